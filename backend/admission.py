@@ -0,0 +1,335 @@
+"""
+Controle de admissão das queries do motor de pivot.
+
+Cada requisição é classificada pelo custo estimado antes de executar:
+
+    light    rollups e queries baratas (só JOINs N:1 com lojas/canais)
+    medium   JOINs com tabelas filhas (produtos, pagamentos, endereços)
+    heavy    customizações de itens (sales -> product_sales -> item_product_sales)
+             ou custo estimado (EXPLAIN) acima de ADMISSION_HEAVY_MIN_COST
+
+Cada classe tem o próprio limite de queries simultâneas, uma fila de espera
+limitada e um statement_timeout. Assim, pivots pesados (ex: itens nos últimos 6
+meses) disputam apenas as vagas da classe 'heavy' e não esgotam o pool de
+conexões usado pelos demais cards do Dashboard. Fila cheia ou espera acima do
+limite resultam em AdmissionRejectedError (HTTP 429 nas rotas).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from backend.cache import TTLCache
+from backend.database import fetch_all, QueryTimeoutError, DB_ERRORS
+from backend.query_builder import CHILD_SOURCES, ROLLUP_TABLE, SKETCH_TABLES
+from backend.slow_queries import slow_query_log
+from backend.telemetry import record_since, untimed
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+
+# Custo estimado pelo planner (EXPLAIN, unidades de custo do Postgres) que separa as classes
+ADMISSION_LIGHT_MAX_COST = float(os.getenv('ADMISSION_LIGHT_MAX_COST', '5000'))
+ADMISSION_HEAVY_MIN_COST = float(os.getenv('ADMISSION_HEAVY_MIN_COST', '50000'))
+
+# JOINs que, por si só, colocam a query na classe 'heavy'
+HEAVY_JOINS = {"items_custom"}
+
+# Estimativas de custo por forma de SQL: o EXPLAIN roda uma vez por forma de requisição e faixa de
+# parâmetros. O período (date_range) já faz parte do texto da query; das listas de IDs (lojas,
+# canais) entra na chave só a ordem de grandeza do tamanho (1, 2-3, 4-7, ...), e escalares (cursor,
+# limite) ficam de fora. A estimativa do primeiro conjunto de valores vale, por até
+# ADMISSION_COST_CACHE_TTL segundos, para os demais da mesma faixa: 3 lojas não herdam o custo de 1
+ADMISSION_COST_CACHE_TTL = float(os.getenv('ADMISSION_COST_CACHE_TTL', '300'))
+
+# Amostras de espera na fila guardadas por classe (percentis de wait time)
+WAIT_SAMPLES = 1024
+
+CLASS_NAMES = ("light", "medium", "heavy")
+
+# Padrões por classe: (concorrência, tamanho da fila, espera máxima na fila (s), statement_timeout (ms))
+CLASS_DEFAULTS = {
+    "light":  (12, 200, 2.0, 5000),
+    "medium": (6, 100, 5.0, 15000),
+    "heavy":  (2, 20, 10.0, 30000),
+}
+
+
+def _class_setting(name, setting, default, cast):
+    """ Ex: ADMISSION_HEAVY_CONCURRENCY, ADMISSION_LIGHT_STATEMENT_TIMEOUT_MS """
+    return cast(os.getenv(f"ADMISSION_{name.upper()}_{setting}", str(default)))
+
+
+class AdmissionRejectedError(Exception):
+    """ A classe da query está saturada (fila cheia ou espera esgotada): o cliente deve tentar depois. """
+
+    def __init__(self, message, query_class, retry_after):
+        super().__init__(message)
+        self.query_class = query_class
+        self.retry_after = retry_after
+
+
+class QueryClass:
+    """
+    Semáforo com fila FIFO limitada e métricas de uma classe de custo.
+
+    Usado apenas a partir do event loop (todas as rotas são async, em qualquer
+    DB_EXECUTION_MODE): não precisa de lock.
+    """
+
+    def __init__(self, name, concurrency, max_queue, queue_timeout, statement_timeout_ms):
+        if concurrency < 1 or max_queue < 0:
+            raise ValueError(f"Configuração de admissão inválida para '{name}': "
+                             f"concurrency={concurrency}, queue={max_queue}")
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+
+        self._active = 0
+        self._waiters = deque()
+        self._wait_samples = deque(maxlen=WAIT_SAMPLES)
+        self._counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_wait_timeout": 0,
+            "statement_timeouts": 0,
+            "wait_time_ms_total": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls, name):
+        concurrency, max_queue, queue_timeout, statement_timeout_ms = CLASS_DEFAULTS[name]
+        return cls(
+            name,
+            concurrency=_class_setting(name, "CONCURRENCY", concurrency, int),
+            max_queue=_class_setting(name, "QUEUE", max_queue, int),
+            queue_timeout=_class_setting(name, "QUEUE_TIMEOUT", queue_timeout, float),
+            statement_timeout_ms=_class_setting(name, "STATEMENT_TIMEOUT_MS", statement_timeout_ms, int),
+        )
+
+    async def acquire(self):
+        """ Ocupa uma vaga da classe, esperando na fila se preciso. Retorna a espera em ms. """
+        start = time.monotonic()
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            return self._admit(start)
+
+        if len(self._waiters) >= self.max_queue:
+            self._counters["rejected_queue_full"] += 1
+            raise AdmissionRejectedError(
+                f"Classe '{self.name}' saturada: {self._active} em execução, {len(self._waiters)} na fila",
+                self.name, self.retry_after()
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._counters["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga foi entregue junto com o timeout/cancelamento: devolve para o próximo
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._counters["rejected_wait_timeout"] += 1
+            raise AdmissionRejectedError(
+                f"Classe '{self.name}' saturada: sem vaga em {self.queue_timeout:.1f}s de espera",
+                self.name, self.retry_after()
+            ) from None
+        # release() já transferiu a vaga (o contador de ativas não mudou)
+        return self._admit(start)
+
+    def try_acquire(self):
+        """ Ocupa uma vaga só se houver uma livre agora (sem fila); não conta como admissão. """
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            return True
+        return False
+
+    def release(self):
+        """ Libera a vaga: passa direto para o primeiro da fila ou decrementa as ativas. """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self._active -= 1
+
+    def record_statement_timeout(self):
+        self._counters["statement_timeouts"] += 1
+
+    def retry_after(self):
+        """ Sugestão (s) para o header Retry-After: a espera máxima da classe. """
+        return max(1, round(self.queue_timeout))
+
+    def _admit(self, start):
+        wait_ms = (time.monotonic() - start) * 1000
+        self._counters["admitted"] += 1
+        self._counters["wait_time_ms_total"] += wait_ms
+        self._wait_samples.append(wait_ms)
+        return wait_ms
+
+    def stats(self):
+        samples = sorted(self._wait_samples)
+
+        def percentile(pct):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(pct / 100 * len(samples)))], 3)
+
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout,
+            "statement_timeout_ms": self.statement_timeout_ms,
+            **self._counters,
+            "wait_ms_p50": percentile(50),
+            "wait_ms_p95": percentile(95),
+            "wait_ms_p99": percentile(99),
+            "wait_ms_max": round(samples[-1], 3) if samples else 0.0,
+        }
+
+
+class AdmissionController:
+    """ Classifica as queries do pivot e controla a execução por classe de custo. """
+
+    def __init__(self, enabled=ADMISSION_ENABLED):
+        self.enabled = enabled
+        self.classes = {name: QueryClass.from_env(name) for name in CLASS_NAMES}
+        self._costs = TTLCache(max_entries=2048, ttl=ADMISSION_COST_CACHE_TTL)
+        self._lock = threading.Lock()
+        self._classified = {name: 0 for name in CLASS_NAMES}
+        self._explain_failures = 0
+        self._explains = 0
+
+    @staticmethod
+    def cost_key(query, params):
+        """ Chave do cache de custos: o SQL e, por lista de IDs, a faixa do tamanho (bit_length). """
+        return query, tuple(len(param).bit_length() for param in params if isinstance(param, (list, tuple)))
+
+    async def estimate_cost(self, query, params):
+        """
+        Custo total estimado pelo planner (EXPLAIN sem executar), com cache por `cost_key`.
+
+        O EXPLAIN ocupa uma conexão do pool: roda sob uma vaga da classe 'light' e com o
+        statement_timeout dela, para que uma rajada de formas novas não esgote o pool
+        antes de a admissão valer. Classe 'light' saturada -> AdmissionRejectedError.
+        """
+        key = self.cost_key(query, params)
+        cost = self._costs.get(key)
+        if cost is None:
+            light = self.classes["light"]
+            async with self.slot(light):
+                with untimed():
+                    _, rows = await fetch_all("EXPLAIN (FORMAT JSON) " + query.strip().rstrip(';'), params,
+                                              timeout_ms=light.statement_timeout_ms)
+            plan = rows[0][0]
+            cost = float(plan[0]["Plan"]["Total Cost"])
+            self._costs.set(key, cost)
+            with self._lock:
+                self._explains += 1
+        return cost
+
+    async def classify(self, query, params, join_set, source="sales"):
+        """
+        Classe de custo da query: a maior entre a indicada pelo conjunto de JOINs
+        (`query_join_set`) e a indicada pelo custo estimado. Rollups e sketches são sempre 'light';
+        queries amostradas (SAMPLE_SOURCE) são classificadas como as das tabelas base.
+        Retorna (QueryClass, custo estimado ou None).
+        """
+        cost = None
+        if source == ROLLUP_TABLE or source in SKETCH_TABLES:
+            name = "light"
+        else:
+            join_set = set(join_set)
+            name = "heavy" if join_set & HEAVY_JOINS else "medium" if join_set & set(CHILD_SOURCES) else "light"
+            if name != "heavy":
+                try:
+                    cost = await self.estimate_cost(query, params)
+                except (AdmissionRejectedError, QueryTimeoutError, *DB_ERRORS) as e:
+                    # Sem estimativa a classe fica a do conjunto de JOINs (a execução trata o erro)
+                    print(f"Erro no EXPLAIN da admissão: {e}")
+                    with self._lock:
+                        self._explain_failures += 1
+                if cost is not None and cost >= ADMISSION_HEAVY_MIN_COST:
+                    name = "heavy"
+                elif cost is not None and cost > ADMISSION_LIGHT_MAX_COST and name == "light":
+                    name = "medium"
+        with self._lock:
+            self._classified[name] += 1
+        return self.classes[name], cost
+
+    @asynccontextmanager
+    async def slot(self, query_class):
+        """ `async with admission.slot(classe):` ocupa uma vaga da classe durante o bloco. """
+        await query_class.acquire()
+        try:
+            yield query_class
+        finally:
+            query_class.release()
+
+    async def fetch_all(self, query, params, join_set, source="sales", prepare=True, fingerprint=None):
+        """
+        `database.fetch_all` sob controle de admissão: classifica, espera a vaga da
+        classe e executa com o statement_timeout dela. Retorna (colunas, linhas, classe).
+
+        Com `fingerprint` (ver slow_queries.query_fingerprint) a duração da execução,
+        sem a espera na fila, vai para o log de queries lentas.
+        """
+        if not self.enabled:
+            execution_start = time.perf_counter()
+            columns, rows = await fetch_all(query, params, prepare=prepare)
+            self._log_execution(fingerprint, execution_start, query, params)
+            return columns, rows, None
+        start = time.perf_counter()
+        query_class, _ = await self.classify(query, params, join_set, source)
+        async with self.slot(query_class):
+            # Classificação e fila contam na fase 'acquire' (junto com a espera pelo pool)
+            record_since("acquire", start)
+            execution_start = time.perf_counter()
+            try:
+                columns, rows = await fetch_all(query, params, prepare=prepare,
+                                                timeout_ms=query_class.statement_timeout_ms)
+            except QueryTimeoutError:
+                query_class.record_statement_timeout()
+                raise
+        self._log_execution(fingerprint, execution_start, query, params)
+        return columns, rows, query_class.name
+
+    @staticmethod
+    def _log_execution(fingerprint, start, query, params):
+        if fingerprint is not None:
+            slow_query_log.observe(fingerprint, (time.perf_counter() - start) * 1000, query, params)
+
+    def stats(self):
+        with self._lock:
+            classified = dict(self._classified)
+            explain_failures = self._explain_failures
+            explains = self._explains
+        return {
+            "enabled": self.enabled,
+            "light_max_cost": ADMISSION_LIGHT_MAX_COST,
+            "heavy_min_cost": ADMISSION_HEAVY_MIN_COST,
+            "classified": classified,
+            "explains": explains,
+            "explain_failures": explain_failures,
+            "classes": {name: query_class.stats() for name, query_class in self.classes.items()},
+        }
+
+
+# Controlador compartilhado pelas rotas do pivot
+admission = AdmissionController()
+
+# Capturas com EXPLAIN ANALYZE do log de queries lentas reexecutam queries lentas: vagas da classe 'heavy'
+slow_query_log.capture_class = admission.classes["heavy"]
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Configuração do Cache de Resultados do Motor de Queries
+PIVOT_CACHE_ENABLED = os.getenv('PIVOT_CACHE_ENABLED', 'true').lower() == 'true'
+PIVOT_CACHE_TTL = float(os.getenv('PIVOT_CACHE_TTL', '60'))               # Validade de cada resultado (s)
+PIVOT_CACHE_MAX_ENTRIES = int(os.getenv('PIVOT_CACHE_MAX_ENTRIES', '512'))  # Limite LRU
+
+
+class TTLCache:
+    """
+    Cache em memória (por processo) com expiração por TTL e limite de tamanho LRU.
+
+    Thread-safe: pode ser usado tanto pelas rotas async quanto pelo threadpool.
+    """
+
+    def __init__(self, max_entries=PIVOT_CACHE_MAX_ENTRIES, ttl=PIVOT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        """ Retorna o valor em cache ou None (e contabiliza hit/miss). """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._counters["expirations"] += 1
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "enabled": PIVOT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    Coalescência de execuções concorrentes: chamadas de `run` com a mesma chave
+    enquanto a primeira ainda executa aguardam o resultado dela em vez de repetir
+    o trabalho (todas recebem o mesmo resultado ou a mesma exceção).
+
+    Vive no event loop: as rotas são async em qualquer DB_EXECUTION_MODE (no modo
+    'sync' só a chamada ao banco vai para o threadpool), então não precisa de lock.
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # chave -> Task da execução em andamento
+        self._counters = {"executions": 0, "saved_executions": 0}
+
+    async def run(self, key, execute):
+        """
+        Executa `execute()` (corrotina) uma única vez por chave em voo. Retorna
+        (resultado, coalesced): coalesced=True quando a chamada reaproveitou uma
+        execução já em andamento.
+        """
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self._counters["saved_executions"] += 1
+        else:
+            self._counters["executions"] += 1
+            # Task própria: se o cliente que iniciou a execução desconectar, os demais ainda recebem o resultado
+            task = asyncio.ensure_future(execute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), coalesced
+
+    def _finish(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Marca a exceção como tratada mesmo que todos os clientes tenham desconectado
+
+    def stats(self):
+        return {"in_flight": len(self._in_flight), **self._counters}
+
+
+# Cache compartilhado pela rota /analytics/pivot
+pivot_cache = TTLCache()
+
+# Requisições de pivot idênticas (mesma chave do cache) em voo ao mesmo tempo
+pivot_flights = SingleFlight()
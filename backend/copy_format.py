@@ -0,0 +1,18 @@
+"""
+Formato texto do COPY FROM STDIN, compartilhado pelo generate_data.py e pela
+ingestão em lote (backend/ingest.py). Sem dependências: a imagem do gerador de
+dados copia apenas este arquivo de backend/.
+"""
+
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_value(value):
+    """ Valor Python no formato texto do COPY (NULL como \\N, separadores escapados). """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, str):
+        return value.translate(COPY_ESCAPES)
+    return str(value)
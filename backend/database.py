@@ -1,15 +1,722 @@
+import io
 import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+import weakref
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from starlette.concurrency import run_in_threadpool
+
+from backend.telemetry import phase, record_since
+
+try:
+    # Driver assíncrono (psycopg 3): necessário apenas com DB_EXECUTION_MODE=async
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+except ImportError:
+    psycopg = None
 
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_NAME = os.getenv('DB_NAME', 'challenge_db')
 DB_USER = os.getenv('DB_USER', 'challenge')
 DB_PASS = os.getenv('DB_PASS', 'challenge_2024')
 
+# Configuração do Pool de Conexões (todas as rotas compartilham o mesmo pool)
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))            # Espera máxima por uma conexão (s)
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))        # Conexões ociosas acima do mínimo são recicladas (s)
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '3600'))  # Idade máxima de uma conexão (s)
+DB_POOL_CHECK_AFTER = float(os.getenv('DB_POOL_CHECK_AFTER', '30'))   # Health check se ociosa há mais de N s
+
+# Modo de execução das queries: 'sync' (psycopg2 + threadpool) ou 'async' (psycopg 3 + pool assíncrono)
+DB_EXECUTION_MODE = os.getenv('DB_EXECUTION_MODE', 'sync').lower()
+if DB_EXECUTION_MODE not in ('sync', 'async'):
+    raise ValueError(f"DB_EXECUTION_MODE inválido: {DB_EXECUTION_MODE} (use 'sync' ou 'async')")
+
+# Prepared statements no servidor para as queries do motor de pivot (planejadas uma vez por conexão)
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+DB_PREPARED_MAX_PER_CONNECTION = int(os.getenv('DB_PREPARED_MAX_PER_CONNECTION', '256'))
+
+# Streaming de resultados: linhas lidas por vez do cursor nomeado (server-side)
+DB_STREAM_CHUNK_ROWS = int(os.getenv('DB_STREAM_CHUNK_ROWS', '2000'))
+
+# Erros de banco de qualquer um dos drivers (para as rotas tratarem de forma única)
+DB_ERRORS = (psycopg2.Error, psycopg.Error) if psycopg else (psycopg2.Error,)
+
+
 def get_db_connection():
     return psycopg2.connect(
         host=DB_HOST,
         database=DB_NAME,
         user=DB_USER,
         password=DB_PASS
-    )
\ No newline at end of file
+    )
+
+
+class PoolTimeoutError(Exception):
+    """ Nenhuma conexão ficou disponível dentro de DB_POOL_TIMEOUT. """
+
+
+class QueryTimeoutError(Exception):
+    """ A query excedeu o statement_timeout pedido e foi cancelada pelo Postgres. """
+
+
+class ConnectionPool:
+    """
+    Pool de conexões psycopg2 thread-safe.
+
+    Mantém entre `min_size` e `max_size` conexões abertas, valida conexões ociosas
+    antes de entregá-las (health check), recicla conexões ociosas ou antigas demais
+    e limita a espera por uma conexão livre a `timeout` segundos.
+    """
+
+    def __init__(self, connect=get_db_connection, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, max_idle=DB_POOL_MAX_IDLE, max_lifetime=DB_POOL_MAX_LIFETIME,
+                 check_after=DB_POOL_CHECK_AFTER):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Tamanho de pool inválido: min={min_size}, max={max_size}")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()    # (conn, created_at, last_used) - LIFO: a conexão mais "quente" sai primeiro
+        self._created = {}      # id(conn) -> created_at (conexões em uso)
+        self._size = 0          # Conexões abertas + conexões sendo abertas
+        self._waiting = 0
+        self._closed = False
+
+        self._counters = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "requests": 0,
+            "requests_waited": 0,
+            "wait_time_ms_total": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+        }
+
+    # -------------------------------------------------------------------
+    # Ciclo de vida
+    # -------------------------------------------------------------------
+
+    def open(self):
+        """ Pré-abre `min_size` conexões. Falhas são ignoradas (o pool tenta de novo sob demanda). """
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._new_connection()
+            except psycopg2.Error:
+                with self._cond:
+                    self._size -= 1
+                return
+            now = time.monotonic()
+            with self._cond:
+                self._idle.append((conn, now, now))
+                self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_connection(conn)
+
+    # -------------------------------------------------------------------
+    # Aquisição / Devolução
+    # -------------------------------------------------------------------
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            self._counters["requests"] += 1
+
+        while True:
+            entry = None
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Pool de conexões encerrado.")
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Nenhuma conexão disponível em {self.timeout:.1f}s "
+                            f"(pool: {self._size}/{self.max_size} em uso)."
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if waited:
+                    self._counters["requests_waited"] += 1
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1  # Reserva a vaga antes de conectar (fora do lock)
+
+            if entry is None:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+            else:
+                conn, created_at, last_used = entry
+                if not self._is_healthy(conn, created_at, last_used):
+                    self._discard(conn)
+                    continue
+
+            with self._cond:
+                self._created[id(conn)] = created_at
+                self._counters["wait_time_ms_total"] += (time.monotonic() - start) * 1000
+            return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            created_at = self._created.pop(id(conn), None)
+        if created_at is None:
+            raise ValueError("Conexão não pertence a este pool.")
+
+        now = time.monotonic()
+        if not discard and not conn.closed:
+            try:
+                # Devolve a conexão limpa: nenhuma transação aberta entre requisições
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        expired = (now - created_at) > self.max_lifetime
+
+        if discard or conn.closed or expired or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, now))
+            to_close = self._collect_idle_locked(now)
+            self._cond.notify()
+        for stale in to_close:
+            self._close_connection(stale)
+
+    @contextmanager
+    def connection(self):
+        """ Empresta uma conexão do pool e a devolve ao final do bloco `with`. """
+        conn = self.getconn()
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            # Conexão possivelmente quebrada (servidor reiniciado, rede): não volta para o pool
+            self.putconn(conn, discard=not self._ping(conn))
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    # -------------------------------------------------------------------
+    # Estatísticas
+    # -------------------------------------------------------------------
+
+    def stats(self):
+        with self._cond:
+            in_use = len(self._created)
+            counters = dict(self._counters)
+            requests = counters["requests"] or 1
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                **counters,
+                "avg_wait_time_ms": round(counters["wait_time_ms_total"] / requests, 3),
+                "wait_time_ms_total": round(counters["wait_time_ms_total"], 3),
+            }
+
+    # -------------------------------------------------------------------
+    # Internos
+    # -------------------------------------------------------------------
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._cond:
+            self._counters["connections_opened"] += 1
+        return conn
+
+    def _close_connection(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._counters["connections_closed"] += 1
+
+    def _discard(self, conn):
+        self._close_connection(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _collect_idle_locked(self, now):
+        """ Remove conexões ociosas há mais de `max_idle` mantendo ao menos `min_size` abertas. """
+        to_close = []
+        # As mais antigas ficam à esquerda da deque (LIFO)
+        while self._idle and self._size > self.min_size and (now - self._idle[0][2]) > self.max_idle:
+            conn, _, _ = self._idle.popleft()
+            self._size -= 1
+            to_close.append(conn)
+        return to_close
+
+    def _is_healthy(self, conn, created_at, last_used):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if (now - created_at) > self.max_lifetime:
+            return False
+        if (now - last_used) > self.check_after and not self._ping(conn):
+            with self._cond:
+                self._counters["health_check_failures"] += 1
+            return False
+        return True
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+# =======================================================================
+# POOL GLOBAL DA APLICAÇÃO
+# =======================================================================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def open_pool():
+    get_pool().open()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def pooled_connection():
+    """ Atalho usado pelas rotas: `with pooled_connection() as conn: ...` """
+    with get_pool().connection() as conn:
+        yield conn
+
+
+# =======================================================================
+# POOL ASSÍNCRONO (DB_EXECUTION_MODE=async)
+# =======================================================================
+
+_async_pool = None
+
+# Conexões do pool assíncrono. O psycopg 3 mantém o próprio cache de prepared statements
+# por conexão; com o limiar automático fora de alcance, só é preparado o que for pedido
+# com prepare=True (ver _fetch_all_async). prepare_threshold=None desligaria também o
+# prepare=True explícito.
+ASYNC_PREPARE_THRESHOLD = 2 ** 31 - 1
+ASYNC_CONNECTION_KWARGS = {"host": DB_HOST, "dbname": DB_NAME, "user": DB_USER, "password": DB_PASS,
+                           "prepare_threshold": ASYNC_PREPARE_THRESHOLD}
+
+
+async def _configure_async_connection(conn):
+    conn.prepared_max = DB_PREPARED_MAX_PER_CONNECTION
+
+
+def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        if psycopg is None:
+            raise RuntimeError("DB_EXECUTION_MODE=async requer os pacotes 'psycopg' e 'psycopg-pool'.")
+        _async_pool = AsyncConnectionPool(
+            kwargs=ASYNC_CONNECTION_KWARGS,
+            configure=_configure_async_connection,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+    return _async_pool
+
+
+async def open_async_pool():
+    # wait=False: a API sobe mesmo com o banco fora do ar; o pool reconecta em segundo plano
+    await get_async_pool().open(wait=False)
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+# =======================================================================
+# EXECUÇÃO DE QUERIES (usada pelas rotas, independente do modo)
+# =======================================================================
+
+async def startup_database():
+    if DB_EXECUTION_MODE == 'async':
+        await open_async_pool()
+    else:
+        await run_in_threadpool(open_pool)
+
+
+async def shutdown_database():
+    if DB_EXECUTION_MODE == 'async':
+        await close_async_pool()
+    else:
+        close_pool()
+
+
+def pool_stats():
+    """ Estatísticas do pool ativo, no formato nativo de cada implementação. """
+    if DB_EXECUTION_MODE == 'async':
+        return {"mode": "async", **get_async_pool().get_stats()}
+    return {"mode": "sync", **get_pool().stats()}
+
+
+# =======================================================================
+# PREPARED STATEMENTS (DB_PREPARED_STATEMENTS)
+# =======================================================================
+
+# Conexão psycopg2 -> {sql: nome do statement}, em ordem de uso (LRU). Os statements
+# vivem na sessão do Postgres: somem junto com a conexão (inclusive quando o pool a descarta).
+_prepared_statements = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+_prepared_counters = {"prepares": 0, "executions": 0, "deallocations": 0}
+
+_PLACEHOLDER_PATTERN = re.compile(r"%(s|%)")
+
+
+def _to_server_placeholders(query):
+    """ Troca os placeholders do psycopg2 (%s) pelos do PREPARE ($1, $2, ...). """
+    position = 0
+
+    def replace(match):
+        nonlocal position
+        if match.group(1) == '%':
+            return '%'
+        position += 1
+        return f"${position}"
+
+    return _PLACEHOLDER_PATTERN.sub(replace, query), position
+
+
+def _count_prepared(counter):
+    with _prepared_lock:
+        _prepared_counters[counter] += 1
+
+
+def _execute_prepared(conn, cursor, query, params):
+    """
+    Executa `query` como prepared statement da conexão: o PREPARE (parse + análise)
+    acontece na primeira execução de cada texto de query nesta conexão; as seguintes
+    só fazem EXECUTE e o Postgres pode reaproveitar o plano (plano genérico).
+    """
+    with _prepared_lock:
+        statements = _prepared_statements.setdefault(conn, OrderedDict())
+        name = statements.get(query)
+        if name is not None:
+            statements.move_to_end(query)
+
+    if name is None:
+        server_query, param_count = _to_server_placeholders(query.strip().rstrip(';'))
+        if param_count != len(params):
+            raise ValueError(f"Query espera {param_count} parâmetros, recebeu {len(params)}")
+        if len(statements) >= DB_PREPARED_MAX_PER_CONNECTION:
+            _, oldest_name = statements.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {oldest_name}")
+            _count_prepared("deallocations")
+        name = "pivot_" + hashlib.sha1(query.encode()).hexdigest()[:16]
+        cursor.execute(f"PREPARE {name} AS {server_query}")
+        statements[query] = name
+        _count_prepared("prepares")
+
+    _count_prepared("executions")
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
+
+def prepared_stats():
+    """ Contadores dos prepared statements do modo 'sync' (o psycopg 3 gerencia os do modo 'async'). """
+    with _prepared_lock:
+        cached = sum(len(statements) for statements in _prepared_statements.values())
+        return {"enabled": DB_PREPARED_STATEMENTS, "cached_statements": cached, **_prepared_counters}
+
+
+# statement_timeout apenas da transação corrente (SET LOCAL), aceito como parâmetro pelos dois drivers
+STATEMENT_TIMEOUT_SQL = "SELECT set_config('statement_timeout', %s, true)"
+
+
+def _query_timeout_error(timeout_ms, error):
+    return QueryTimeoutError(f"Query cancelada após {timeout_ms} ms (statement_timeout): {error}".strip())
+
+
+def _fetch_all_sync(query, params, prepare=False, timeout_ms=None):
+    start = time.perf_counter()
+    with pooled_connection() as conn:
+        record_since("acquire", start)
+        cursor = conn.cursor()
+        try:
+            with phase("execute"):
+                if timeout_ms:
+                    cursor.execute(STATEMENT_TIMEOUT_SQL, (str(int(timeout_ms)),))
+                if prepare and DB_PREPARED_STATEMENTS:
+                    _execute_prepared(conn, cursor, query, params)
+                else:
+                    cursor.execute(query, params)
+        except psycopg2.errors.QueryCanceled as e:
+            # QueryCanceled é um OperationalError: sem o rollback aqui o pool descartaria a conexão
+            conn.rollback()
+            raise _query_timeout_error(timeout_ms, e) from e
+        with phase("fetch"):
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall()
+        cursor.close()
+    return columns, rows
+
+
+async def _fetch_all_async(query, params, prepare=False, timeout_ms=None):
+    try:
+        start = time.perf_counter()
+        async with get_async_pool().connection() as conn:
+            record_since("acquire", start)
+            async with conn.cursor() as cursor:
+                with phase("execute"):
+                    if timeout_ms:
+                        await cursor.execute(STATEMENT_TIMEOUT_SQL, (str(int(timeout_ms)),))
+                    # prepare=True: o psycopg 3 prepara o statement na conexão e o reutiliza
+                    await cursor.execute(query, params, prepare=True if prepare and DB_PREPARED_STATEMENTS else None)
+                with phase("fetch"):
+                    columns = [desc.name for desc in cursor.description]
+                    rows = await cursor.fetchall()
+    except PoolTimeout as e:
+        raise PoolTimeoutError(str(e)) from e
+    except psycopg.errors.QueryCanceled as e:
+        raise _query_timeout_error(timeout_ms, e) from e
+    return columns, rows
+
+
+async def fetch_all(query, params=(), prepare=False, timeout_ms=None):
+    """
+    Executa uma query e retorna (colunas, linhas).
+
+    No modo 'sync' a chamada bloqueante roda no threadpool do Starlette; no modo
+    'async' a espera pelo Postgres não ocupa thread nenhuma, permitindo centenas
+    de queries em voo em um único worker.
+
+    Com `prepare=True` (queries de forma estável, como as do query_builder) a query
+    roda como prepared statement da conexão do pool (ver DB_PREPARED_STATEMENTS).
+
+    `timeout_ms` limita a execução no servidor (statement_timeout da transação);
+    ao estourar, a query é cancelada pelo Postgres e QueryTimeoutError é lançado.
+    """
+    if DB_EXECUTION_MODE == 'async':
+        return await _fetch_all_async(query, params, prepare, timeout_ms)
+    return await run_in_threadpool(_fetch_all_sync, query, params, prepare, timeout_ms)
+
+
+# =======================================================================
+# STREAMING (CURSOR NOMEADO NO SERVIDOR)
+# =======================================================================
+
+def _stream_rows_sync(query, params, chunk_size, timeout_ms=None):
+    """
+    Versão bloqueante de `stream_rows`: a conexão fica emprestada do pool até o
+    gerador terminar (ou ser fechado) e cada bloco é lido sob demanda.
+    """
+    start = time.perf_counter()
+    with pooled_connection() as conn:
+        record_since("acquire", start)
+        try:
+            with phase("execute"):
+                if timeout_ms:
+                    with conn.cursor() as setup:
+                        setup.execute(STATEMENT_TIMEOUT_SQL, (str(int(timeout_ms)),))
+                cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+            with phase("fetch"):
+                rows = cursor.fetchmany(chunk_size)
+            columns = [desc[0] for desc in cursor.description]
+            yield columns, rows
+            while rows:
+                with phase("fetch"):
+                    rows = cursor.fetchmany(chunk_size)
+                if rows:
+                    yield columns, rows
+            cursor.close()
+        except psycopg2.errors.QueryCanceled as e:
+            conn.rollback()
+            raise _query_timeout_error(timeout_ms, e) from e
+
+
+async def stream_rows(query, params=(), chunk_size=DB_STREAM_CHUNK_ROWS, timeout_ms=None):
+    """
+    Executa uma query em um cursor nomeado (server-side) e gera (colunas, linhas)
+    em blocos de até `chunk_size` linhas: a memória fica constante qualquer que
+    seja o tamanho do resultado. O primeiro bloco é sempre gerado (mesmo vazio),
+    de modo que erros de execução aparecem antes de a resposta começar.
+
+    `timeout_ms` vale para cada leitura do cursor (ver `fetch_all`).
+    """
+    if DB_EXECUTION_MODE == 'async':
+        try:
+            start = time.perf_counter()
+            async with get_async_pool().connection() as conn:
+                record_since("acquire", start)
+                async with conn.transaction():
+                    if timeout_ms:
+                        await conn.execute(STATEMENT_TIMEOUT_SQL, (str(int(timeout_ms)),))
+                    async with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                        with phase("execute"):
+                            await cursor.execute(query, params)
+                        with phase("fetch"):
+                            rows = await cursor.fetchmany(chunk_size)
+                        columns = [desc.name for desc in cursor.description]
+                        yield columns, rows
+                        while rows:
+                            with phase("fetch"):
+                                rows = await cursor.fetchmany(chunk_size)
+                            if rows:
+                                yield columns, rows
+        except PoolTimeout as e:
+            raise PoolTimeoutError(str(e)) from e
+        except psycopg.errors.QueryCanceled as e:
+            raise _query_timeout_error(timeout_ms, e) from e
+        return
+
+    chunks = _stream_rows_sync(query, params, chunk_size, timeout_ms)
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # Fecha o cursor e devolve a conexão ao pool também quando o cliente desconecta
+        await run_in_threadpool(chunks.close)
+
+
+# =======================================================================
+# CARGA EM LOTE (COPY)
+# =======================================================================
+
+def _copy_sql(table, columns):
+    return f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+
+
+def _copy_in_transaction_sync(copies, statements, timeout_ms=None):
+    start = time.perf_counter()
+    with pooled_connection() as conn:
+        record_since("acquire", start)
+        cursor = conn.cursor()
+        try:
+            with phase("execute"):
+                if timeout_ms:
+                    cursor.execute(STATEMENT_TIMEOUT_SQL, (str(int(timeout_ms)),))
+                for table, columns, data in copies:
+                    cursor.copy_expert(_copy_sql(table, columns), io.StringIO(data))
+                for query, params in statements:
+                    cursor.execute(query, params)
+                conn.commit()
+        except psycopg2.errors.QueryCanceled as e:
+            conn.rollback()
+            raise _query_timeout_error(timeout_ms, e) from e
+        finally:
+            # Em qualquer outro erro o pool desfaz a transação ao receber a conexão de volta
+            cursor.close()
+
+
+async def _copy_in_transaction_async(copies, statements, timeout_ms=None):
+    try:
+        start = time.perf_counter()
+        async with get_async_pool().connection() as conn:
+            record_since("acquire", start)
+            with phase("execute"):
+                async with conn.transaction():
+                    async with conn.cursor() as cursor:
+                        if timeout_ms:
+                            await cursor.execute(STATEMENT_TIMEOUT_SQL, (str(int(timeout_ms)),))
+                        for table, columns, data in copies:
+                            async with cursor.copy(_copy_sql(table, columns)) as copy:
+                                await copy.write(data)
+                        for query, params in statements:
+                            await cursor.execute(query, params)
+    except PoolTimeout as e:
+        raise PoolTimeoutError(str(e)) from e
+    except psycopg.errors.QueryCanceled as e:
+        raise _query_timeout_error(timeout_ms, e) from e
+
+
+async def copy_in_transaction(copies, statements=(), timeout_ms=None):
+    """
+    Carrega tabelas com COPY FROM STDIN e executa `statements` em uma única transação.
+
+    `copies` é uma lista de (tabela, colunas, dados no formato texto do COPY), na
+    ordem das chaves estrangeiras; `statements` é uma lista de (SQL, parâmetros)
+    executados depois das cargas (ex: manutenção dos rollups). Qualquer erro
+    desfaz a transação inteira. `timeout_ms` vale para cada comando (ver `fetch_all`).
+    """
+    if DB_EXECUTION_MODE == 'async':
+        return await _copy_in_transaction_async(copies, statements, timeout_ms)
+    return await run_in_threadpool(_copy_in_transaction_sync, copies, statements, timeout_ms)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Index Advisor do Motor de Queries.
+
+Percorre todos os JOINs (JOIN_MAP) e filtros que o query_builder consegue emitir,
+propõe os índices correspondentes (B-tree, parciais e cobrindo colunas) e mede o
+custo estimado (EXPLAIN) de um workload representativo antes e depois deles.
+
+Uso:
+    python -m backend.index_advisor                 # relatório (índices criados e descartados em transação)
+    python -m backend.index_advisor --apply         # cria os índices propostos (CREATE INDEX CONCURRENTLY)
+    python -m backend.index_advisor --emit-sql      # imprime o pacote de índices (database-indexes.sql)
+"""
+
+import argparse
+import itertools
+import json
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+import psycopg2
+
+from backend.database import get_db_connection
+from backend.query_builder import (
+    DIMENSION_MAP, JOIN_MAP, SEMI_JOIN_FILTERS, DATE_RANGES, build_analytics_query,
+)
+
+# =======================================================================
+# 1. CANDIDATOS
+# =======================================================================
+
+class IndexCandidate(NamedTuple):
+    table: str
+    columns: Tuple[str, ...]
+    where: Optional[str] = None
+    include: Tuple[str, ...] = ()
+    reason: str = ""
+
+    @property
+    def name(self):
+        suffix = "_completed" if self.where else ""
+        return f"idx_{self.table}_{'_'.join(self.columns)}{suffix}"
+
+    def ddl(self, concurrently=False):
+        sql = (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {self.name} "
+               f"ON {self.table} ({', '.join(self.columns)})")
+        if self.include:
+            sql += f" INCLUDE ({', '.join(self.include)})"
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql
+
+
+JOIN_PATTERN = re.compile(r"JOIN (\w+) (\w+) ON (\w+)\.(\w+) = (\w+)\.(\w+)")
+SEMI_JOIN_PATTERN = re.compile(r"FROM (\w+) (\w+) WHERE \2\.(\w+) = s\.id")
+COMPLETED_PREDICATE = "sale_status_desc = 'COMPLETED'"
+
+
+def join_candidates() -> List[IndexCandidate]:
+    """
+    Para cada `JOIN tabela alias ON a.x = b.y` do JOIN_MAP, a coluna do lado da
+    tabela recém-juntada é a chave de busca; se não for a PK (`id`), precisa de índice.
+    O mesmo vale para a coluna correlacionada dos semi-joins (SEMI_JOIN_FILTERS).
+    """
+    candidates = {}
+    for join_key, join_sql in JOIN_MAP.items():
+        for table, alias, left_alias, left_col, right_alias, right_col in JOIN_PATTERN.findall(join_sql):
+            column = left_col if left_alias == alias else right_col if right_alias == alias else None
+            if column and column != "id":
+                candidates[(table, column)] = IndexCandidate(
+                    table, (column,), reason=f"JOIN '{join_key}': {alias}.{column}"
+                )
+    for filter_key, clause in SEMI_JOIN_FILTERS.items():
+        for table, alias, column in SEMI_JOIN_PATTERN.findall(clause):
+            candidates[(table, column)] = IndexCandidate(
+                table, (column,), reason=f"semi-join '{filter_key}': {alias}.{column}"
+            )
+    return list(candidates.values())
+
+
+def filter_candidates() -> List[IndexCandidate]:
+    """
+    Índices parciais sobre `sales` para os filtros do builder. Toda query filtra
+    vendas concluídas, então os índices carregam o mesmo predicado (WHERE) e o
+    planner só os considera para essas queries - que são todas.
+    """
+    # Descobre as colunas filtradas a partir das próprias queries geradas pelo builder
+    query, _ = build_analytics_query(
+        "total_amount", "SUM", "date.day",
+        {"date_range": next(iter(DATE_RANGES)), "store_ids": [1], "channel_ids": [1]}
+    )
+    filtered = set(re.findall(r"\bs\.(\w+) (?:>=|= ANY)", query))
+
+    candidates = []
+    if "created_at" in filtered:
+        candidates.append(IndexCandidate(
+            "sales", ("created_at",), COMPLETED_PREDICATE,
+            include=("id", "store_id", "channel_id", "total_amount"),
+            reason="filtro date_range + vendas concluídas (cobre pivots por loja/canal/data sem visitar o heap)"
+        ))
+    for column in ("store_id", "channel_id"):
+        if column in filtered:
+            candidates.append(IndexCandidate(
+                "sales", (column, "created_at"), COMPLETED_PREDICATE,
+                reason=f"filtro {column}s (+ date_range) em vendas concluídas"
+            ))
+    return candidates
+
+
+def all_candidates() -> List[IndexCandidate]:
+    return join_candidates() + filter_candidates()
+
+# =======================================================================
+# 2. ÍNDICES EXISTENTES
+# =======================================================================
+
+EXISTING_INDEXES_QUERY = """
+    SELECT c.relname,
+           ARRAY(SELECT a.attname FROM unnest(ix.indkey[0:ix.indnkeyatts - 1]) WITH ORDINALITY k(attnum, ord)
+                 JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+                 ORDER BY k.ord),
+           pg_get_expr(ix.indpred, ix.indrelid)
+    FROM pg_index ix
+    JOIN pg_class c ON c.oid = ix.indrelid
+    WHERE c.relname = ANY(%s)
+"""
+
+
+def _normalize_predicate(predicate):
+    return re.sub(r"[()\s]|::\w+( varying)?", "", predicate or "").lower()
+
+
+def is_covered(candidate, existing):
+    """ Já existe índice com as mesmas colunas iniciais (e mesmo predicado, se parcial)? """
+    for table, columns, predicate in existing:
+        if table != candidate.table or tuple(columns[:len(candidate.columns)]) != candidate.columns:
+            continue
+        if predicate is None or _normalize_predicate(predicate) == _normalize_predicate(candidate.where):
+            return True
+    return False
+
+
+def load_existing_indexes(cursor, tables):
+    cursor.execute(EXISTING_INDEXES_QUERY, (list(tables),))
+    return cursor.fetchall()
+
+# =======================================================================
+# 3. WORKLOAD E CUSTOS (EXPLAIN)
+# =======================================================================
+
+WORKLOAD_METRICS = [("total_amount", "SUM"), ("items.additional_price", "SUM")]
+WORKLOAD_FILTERS = [
+    {},
+    {"date_range": "last_7d"},
+    {"date_range": "last_30d", "store_ids": [1, 2, 3]},
+    {"date_range": "last_6m", "channel_ids": [1]},
+]
+
+
+def workload():
+    """ Todas as dimensões de agrupamento do DIMENSION_MAP x métricas x conjuntos de filtros. """
+    group_bys = [key for key in DIMENSION_MAP if not key.startswith("filter.")]
+    for group_by, (metric, agg), filters in itertools.product(group_bys, WORKLOAD_METRICS, WORKLOAD_FILTERS):
+        query, params = build_analytics_query(metric, agg, group_by, filters)
+        label = f"{agg}({metric}) BY {group_by} {json.dumps(filters, sort_keys=True)}"
+        yield label, query, params
+
+
+def explain_costs(cursor):
+    """ Custo total estimado de cada query do workload (None se o builder gerar SQL inválido). """
+    costs = {}
+    for label, query, params in workload():
+        cursor.execute("SAVEPOINT explain_query")
+        try:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, tuple(params))
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT explain_query")
+            costs[label] = None
+            continue
+        plan = cursor.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        costs[label] = plan[0]["Plan"]["Total Cost"]
+    return costs
+
+# =======================================================================
+# 4. CLI
+# =======================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Propose and apply indexes for the pivot query builder')
+    parser.add_argument('--apply', action='store_true', help='Cria os índices propostos (CONCURRENTLY)')
+    parser.add_argument('--emit-sql', action='store_true', help='Apenas imprime o DDL de todos os candidatos')
+    args = parser.parse_args()
+
+    candidates = all_candidates()
+    if args.emit_sql:
+        for candidate in candidates:
+            print(f"-- {candidate.reason}")
+            print(candidate.ddl() + ";")
+        return
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        existing = load_existing_indexes(cursor, {c.table for c in candidates})
+        proposed = [c for c in candidates if not is_covered(c, existing)]
+
+        print(f"{len(candidates)} candidatos, {len(candidates) - len(proposed)} já cobertos por índices existentes")
+        for candidate in proposed:
+            print(f"  + {candidate.ddl()}\n      ({candidate.reason})")
+        if not proposed:
+            return
+
+        before = explain_costs(cursor)
+
+        # "E se": cria os índices dentro da transação, mede e desfaz (nada persiste)
+        for candidate in proposed:
+            cursor.execute(candidate.ddl())
+        for table in {c.table for c in proposed}:
+            cursor.execute(f"ANALYZE {table}")
+        after = explain_costs(cursor)
+        conn.rollback()
+
+        print()
+        print(f"{'custo antes':>14} {'custo depois':>14} {'ganho':>7}  query")
+        valid = []
+        for label in before:
+            # Só compara queries com custo nos dois lados (o EXPLAIN pode falhar em só um deles)
+            if before[label] is None or after.get(label) is None:
+                print(f"{'-':>14} {'-':>14} {'-':>7}  {label} (SQL inválido, ignorada)")
+                continue
+            valid.append(label)
+            gain = (1 - after[label] / before[label]) * 100 if before[label] else 0.0
+            print(f"{before[label]:>14.0f} {after[label]:>14.0f} {gain:>6.1f}%  {label}")
+        total_before, total_after = sum(before[l] for l in valid), sum(after[l] for l in valid)
+        total_gain = (1 - total_after / total_before) * 100 if total_before else 0.0
+        print(f"{total_before:>14.0f} {total_after:>14.0f} {total_gain:>6.1f}%  TOTAL")
+
+        if args.apply:
+            conn.autocommit = True  # CREATE INDEX CONCURRENTLY não roda dentro de transação
+            for candidate in proposed:
+                cursor.execute(candidate.ddl(concurrently=True))
+                print(f"✓ {candidate.name}")
+            for table in {c.table for c in proposed}:
+                cursor.execute(f"ANALYZE {table}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
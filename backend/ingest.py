@@ -0,0 +1,315 @@
+"""
+Ingestão de vendas em lote (POST /api/v1/ingest/sales).
+
+O corpo é NDJSON: uma venda por linha, com produtos, customizações, entrega e
+pagamentos aninhados (models.IngestSale). Cada lote é validado inteiro antes de
+tocar o banco e carregado em uma única transação:
+
+    1. ids reservados das sequences de todas as tabelas em um único round trip
+       (as linhas filhas já saem com o id do pai, sem RETURNING)
+    2. COPY FROM STDIN de cada tabela, na ordem das chaves estrangeiras
+    3. rollups já construídos atualizados só nos grupos Loja x Canal x Dia/Hora
+       do lote (rollups.rollup_delta_statements), com avanço da marca d'água
+
+Ou o lote inteiro entra (vendas e agregados), ou nada entra. Lotes simultâneos
+só se serializam no passo 3, que é curto; o número de cargas em andamento é
+limitado (INGEST_CONCURRENCY) para que a ingestão não ocupe o pool de conexões
+usado pelos Dashboards. O cache de pivots não é descartado a cada lote: os
+resultados em cache ficam defasados no máximo PIVOT_CACHE_TTL segundos.
+"""
+
+import os
+import time
+
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from backend.admission import QueryClass
+from backend.copy_format import copy_value
+from backend.database import fetch_all, copy_in_transaction, QueryTimeoutError
+from backend.models import IngestSale
+from backend.partitioning import CHILD_TABLES, is_sales_partitioned
+from backend.rollups import built_rollups, rollup_delta_statements
+
+INGEST_MAX_BATCH_SALES = int(os.getenv('INGEST_MAX_BATCH_SALES', '10000'))
+INGEST_MAX_BODY_BYTES = int(os.getenv('INGEST_MAX_BODY_BYTES', str(32 * 1024 * 1024)))
+INGEST_ROLLUP_MAINTENANCE = os.getenv('INGEST_ROLLUP_MAINTENANCE', 'true').lower() == 'true'
+
+# Cargas simultâneas, fila de espera, espera máxima na fila (s) e statement_timeout (ms)
+INGEST_CONCURRENCY = int(os.getenv('INGEST_CONCURRENCY', '2'))
+INGEST_QUEUE = int(os.getenv('INGEST_QUEUE', '20'))
+INGEST_QUEUE_TIMEOUT = float(os.getenv('INGEST_QUEUE_TIMEOUT', '10'))
+INGEST_STATEMENT_TIMEOUT_MS = int(os.getenv('INGEST_STATEMENT_TIMEOUT_MS', '60000'))
+
+# Erros de linha devolvidos na resposta (o lote é rejeitado inteiro de qualquer forma)
+MAX_REPORTED_ERRORS = 20
+
+# Colunas carregadas por tabela, na ordem das chaves estrangeiras
+INGEST_COLUMNS = {
+    "sales": (
+        "id", "store_id", "sub_brand_id", "customer_id", "channel_id", "cod_sale1", "created_at",
+        "customer_name", "sale_status_desc", "total_amount_items", "total_discount", "total_increase",
+        "delivery_fee", "service_tax_fee", "total_amount", "value_paid", "production_seconds",
+        "delivery_seconds", "people_quantity", "discount_reason", "origin",
+    ),
+    "product_sales": ("id", "sale_id", "product_id", "quantity", "base_price", "total_price", "observations"),
+    "item_product_sales": (
+        "id", "product_sale_id", "item_id", "option_group_id", "quantity", "additional_price",
+        "price", "amount", "observations",
+    ),
+    "delivery_sales": (
+        "id", "sale_id", "courier_name", "courier_phone", "courier_type", "delivery_type",
+        "status", "delivery_fee", "courier_fee",
+    ),
+    "delivery_addresses": (
+        "id", "sale_id", "delivery_sale_id", "street", "number", "complement", "neighborhood",
+        "city", "state", "postal_code", "latitude", "longitude",
+    ),
+    "payments": ("id", "sale_id", "payment_type_id", "value", "is_online", "description", "currency"),
+}
+
+# Sequences das colunas SERIAL (resolvidas uma vez: pg_get_serial_sequence a cada
+# linha do generate_series deixaria a reserva de ids várias vezes mais lenta)
+SEQUENCES_SQL = "SELECT " + ", ".join(f"pg_get_serial_sequence('{table}', 'id')" for table in INGEST_COLUMNS)
+
+# Um array de ids por tabela, reservados da sequence: parâmetros (sequence, quantidade) por tabela
+RESERVE_IDS_SQL = "SELECT " + ", ".join(
+    "ARRAY(SELECT nextval(%s::regclass) FROM generate_series(1, %s))" for _ in INGEST_COLUMNS
+)
+
+
+class IngestValidationError(ValueError):
+    """ Linhas inválidas no lote: nada foi carregado. """
+
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+class IngestBatchTooLargeError(ValueError):
+    """ O lote passa de INGEST_MAX_BATCH_SALES vendas ou de INGEST_MAX_BODY_BYTES bytes. """
+
+
+# Vaga de carga: mesmo mecanismo das classes de custo do pivot (fila limitada, 429 ao saturar)
+ingest_slots = QueryClass("ingest", INGEST_CONCURRENCY, INGEST_QUEUE, INGEST_QUEUE_TIMEOUT,
+                          INGEST_STATEMENT_TIMEOUT_MS)
+
+_sequences = None
+
+_counters = {"batches": 0, "sales": 0, "rows": 0, "failed_batches": 0, "rejected_batches": 0}
+
+# =======================================================================
+# 1. VALIDAÇÃO DO NDJSON
+# =======================================================================
+
+async def read_batch_body(request):
+    """
+    Corpo da requisição limitado a INGEST_MAX_BODY_BYTES. Um Content-Length acima do
+    limite é recusado antes de ler qualquer byte; sem Content-Length (chunked), a
+    leitura para assim que o limite é ultrapassado.
+    """
+    too_large = IngestBatchTooLargeError(
+        f"Lote acima do limite de {INGEST_MAX_BODY_BYTES} bytes: divida em lotes menores."
+    )
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > INGEST_MAX_BODY_BYTES:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > INGEST_MAX_BODY_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def parse_batch(body):
+    """ Valida o corpo NDJSON (bytes) e retorna a lista de IngestSale; linhas em branco são ignoradas. """
+    sales, errors = [], []
+    for number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            sales.append(IngestSale.model_validate_json(line))
+        except ValidationError as e:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({
+                    "line": number,
+                    "errors": [{"loc": list(error["loc"]), "msg": error["msg"]} for error in e.errors()],
+                })
+            sales.append(None)
+        if len(sales) > INGEST_MAX_BATCH_SALES:
+            raise IngestBatchTooLargeError(
+                f"Lote acima do limite de {INGEST_MAX_BATCH_SALES} vendas: divida em lotes menores."
+            )
+    if errors:
+        invalid = sum(sale is None for sale in sales)
+        raise IngestValidationError(f"{invalid} de {len(sales)} linhas inválidas: nenhuma venda foi carregada.",
+                                    errors)
+    if not sales:
+        raise IngestValidationError("Lote vazio: envie uma venda (JSON) por linha.")
+    return sales
+
+# =======================================================================
+# 2. MONTAGEM DO COPY
+# =======================================================================
+
+def row_counts(sales):
+    """ Linhas por tabela do lote (quantos ids reservar de cada sequence). """
+    counts = dict.fromkeys(INGEST_COLUMNS, 0)
+    counts["sales"] = len(sales)
+    for sale in sales:
+        counts["product_sales"] += len(sale.products)
+        counts["item_product_sales"] += sum(len(product.items) for product in sale.products)
+        counts["payments"] += len(sale.payments)
+        if sale.delivery:
+            counts["delivery_sales"] += 1
+            counts["delivery_addresses"] += sale.delivery.address is not None
+    return counts
+
+
+def build_copy_payloads(sales, ids, partitioned=False):
+    """
+    Dados do COPY de cada tabela: lista de (tabela, colunas, texto). `ids` traz os
+    ids reservados por tabela. No layout particionado as tabelas filhas recebem
+    também `sale_created_at`.
+    """
+    ids = {table: iter(values) for table, values in ids.items()}
+    lines = {table: [] for table in INGEST_COLUMNS}
+
+    def add(table, row, sale):
+        if partitioned and table in CHILD_TABLES:
+            row = row + (sale.created_at,)
+        lines[table].append("\t".join(map(copy_value, row)))
+
+    for sale in sales:
+        sale_id = next(ids["sales"])
+        add("sales", (
+            sale_id, sale.store_id, sale.sub_brand_id, sale.customer_id, sale.channel_id, sale.cod_sale1,
+            sale.created_at, sale.customer_name, sale.sale_status_desc, sale.total_amount_items,
+            sale.total_discount, sale.total_increase, sale.delivery_fee, sale.service_tax_fee,
+            sale.total_amount, sale.value_paid, sale.production_seconds, sale.delivery_seconds,
+            sale.people_quantity, sale.discount_reason, sale.origin,
+        ), sale)
+
+        for product in sale.products:
+            product_sale_id = next(ids["product_sales"])
+            add("product_sales", (
+                product_sale_id, sale_id, product.product_id, product.quantity, product.base_price,
+                product.total_price, product.observations,
+            ), sale)
+            for item in product.items:
+                add("item_product_sales", (
+                    next(ids["item_product_sales"]), product_sale_id, item.item_id, item.option_group_id,
+                    item.quantity, item.additional_price, item.price, item.amount, item.observations,
+                ), sale)
+
+        if sale.delivery:
+            delivery = sale.delivery
+            delivery_sale_id = next(ids["delivery_sales"])
+            add("delivery_sales", (
+                delivery_sale_id, sale_id, delivery.courier_name, delivery.courier_phone, delivery.courier_type,
+                delivery.delivery_type, delivery.status, delivery.delivery_fee, delivery.courier_fee,
+            ), sale)
+            address = delivery.address
+            if address is not None:
+                add("delivery_addresses", (
+                    next(ids["delivery_addresses"]), sale_id, delivery_sale_id, address.street, address.number,
+                    address.complement, address.neighborhood, address.city, address.state,
+                    address.postal_code, address.latitude, address.longitude,
+                ), sale)
+
+        for payment in sale.payments:
+            add("payments", (
+                next(ids["payments"]), sale_id, payment.payment_type_id, payment.value,
+                payment.is_online, payment.description, payment.currency,
+            ), sale)
+
+    payloads = []
+    for table, columns in INGEST_COLUMNS.items():
+        if lines[table]:
+            if partitioned and table in CHILD_TABLES:
+                columns = columns + ("sale_created_at",)
+            payloads.append((table, columns, "\n".join(lines[table]) + "\n"))
+    return payloads
+
+# =======================================================================
+# 3. CARGA
+# =======================================================================
+
+async def reserve_ids(counts):
+    """ Reserva `counts[tabela]` ids de cada tabela; retorna {tabela: [ids]}. """
+    global _sequences
+    if _sequences is None:
+        _, rows = await fetch_all(SEQUENCES_SQL)
+        _sequences = rows[0]
+    params = [value for pair in zip(_sequences, counts.values()) for value in pair]
+    _, rows = await fetch_all(RESERVE_IDS_SQL, params)
+    return dict(zip(INGEST_COLUMNS, rows[0]))
+
+
+def _is_data_error(error):
+    """ Erros causados pelo conteúdo do lote (FK inexistente, partição ausente, valor inválido). """
+    sqlstate = getattr(error, "pgcode", None) or getattr(error, "sqlstate", None) or ""
+    return sqlstate[:2] in ("22", "23")
+
+
+async def ingest_sales(sales):
+    """
+    Carrega as vendas validadas em uma única transação e mantém os rollups.
+    Retorna o resumo da carga (linhas por tabela, rollups atualizados, tempos).
+    """
+    start = time.perf_counter()
+    await ingest_slots.acquire()
+    try:
+        counts = row_counts(sales)
+        ids = await reserve_ids(counts)
+        partitioned = await is_sales_partitioned()
+        rollups = await built_rollups() if INGEST_ROLLUP_MAINTENANCE else []
+
+        # Montagem do texto do COPY fora do event loop (CPU proporcional ao lote)
+        payloads = await run_in_threadpool(build_copy_payloads, sales, ids, partitioned)
+        load_start = time.perf_counter()
+        try:
+            await copy_in_transaction(payloads, rollup_delta_statements(rollups, ids["sales"]),
+                                      timeout_ms=ingest_slots.statement_timeout_ms)
+        except QueryTimeoutError:
+            ingest_slots.record_statement_timeout()
+            raise
+        except Exception as e:
+            if _is_data_error(e):
+                _counters["rejected_batches"] += 1
+                raise IngestValidationError(f"Lote rejeitado pelo banco: {e}".strip()) from e
+            raise
+    except IngestValidationError:
+        raise
+    except Exception:
+        _counters["failed_batches"] += 1
+        raise
+    finally:
+        ingest_slots.release()
+
+    elapsed = time.perf_counter() - start
+    _counters["batches"] += 1
+    _counters["sales"] += len(sales)
+    _counters["rows"] += sum(counts.values())
+    return {
+        "sales": len(sales),
+        "rows": counts,
+        "first_sale_id": ids["sales"][0],
+        "last_sale_id": ids["sales"][-1],
+        "rollups": sorted(rollups),
+        "load_ms": round((time.perf_counter() - load_start) * 1000, 3),
+        "execution_time_ms": round(elapsed * 1000, 3),
+        "sales_per_second": round(len(sales) / elapsed, 1) if elapsed else None,
+    }
+
+
+def ingest_stats():
+    return {
+        "max_batch_sales": INGEST_MAX_BATCH_SALES,
+        "max_body_bytes": INGEST_MAX_BODY_BYTES,
+        "rollup_maintenance": INGEST_ROLLUP_MAINTENANCE,
+        **_counters,
+        "slots": ingest_slots.stats(),
+    }
@@ -1,10 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.router import router
+from backend.telemetry import metrics_router
+from backend.database import startup_database, shutdown_database
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Aquece o pool de conexões (sync ou async, conforme DB_EXECUTION_MODE) e fecha tudo no desligamento
+    await startup_database()
+    yield
+    await shutdown_database()
+
 
 app = FastAPI(
     title="God Level Analytics API",
-    description="Motor de Queries Dinâmicas para Restaurantes"
+    description="Motor de Queries Dinâmicas para Restaurantes",
+    lifespan=lifespan
 )
 
 origins = [
@@ -18,9 +31,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"], 
+    # Headers de diagnóstico lidos pelo frontend (tempos por fase e de serialização)
+    expose_headers=["Server-Timing", "X-Serialization-Time-Ms"],
 )
 
 app.include_router(
     router,
     prefix="/api/v1"
-)
\ No newline at end of file
+)
+
+# Métricas no formato Prometheus em /metrics (fora do prefixo da API)
+app.include_router(metrics_router)
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Cache dos metadados de dimensões usados pelos filtros do Dashboard.
+
+Lojas, canais, sub-marcas, formas de pagamento, categorias e cidades mudam
+raramente: o payload é montado uma vez, serializado uma vez e servido da memória
+com um ETag (hash do conteúdo) até expirar (METADATA_CACHE_TTL) ou ser invalidado
+explicitamente (POST /api/v1/metadata/invalidate). Como o ETag depende apenas do
+conteúdo, ele é o mesmo em todos os workers, e o navegador revalida com
+If-None-Match recebendo 304 sem corpo.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+
+from backend.cache import SingleFlight
+from backend.database import fetch_all
+from backend.serialization import dumps
+
+METADATA_CACHE_TTL = float(os.getenv('METADATA_CACHE_TTL', '300'))    # Recarga do banco (s)
+METADATA_MAX_AGE = int(os.getenv('METADATA_MAX_AGE', '60'))            # Cache-Control max-age no navegador (s)
+
+# Lookups de dimensão: nome no payload -> (SQL, campos de cada linha)
+METADATA_QUERIES = {
+    "stores": ("SELECT id, name FROM stores WHERE is_active = TRUE ORDER BY name", ("id", "name")),
+    "channels": ("SELECT id, name FROM channels ORDER BY name", ("id", "name")),
+    "sub_brands": ("SELECT id, name FROM sub_brands ORDER BY name", ("id", "name")),
+    "payment_types": ("SELECT id, description FROM payment_types ORDER BY description", ("id", "name")),
+    "categories": ("SELECT id, name FROM categories WHERE deleted_at IS NULL ORDER BY name", ("id", "name")),
+    # Cidades das lojas ativas (o filtro de cidade é sobre a localização da loja)
+    "cities": ("SELECT DISTINCT city, state FROM stores WHERE is_active = TRUE AND city IS NOT NULL "
+               "ORDER BY city, state", ("city", "state")),
+}
+
+
+class MetadataEntry:
+    """ Payload já serializado e seus validadores HTTP. """
+
+    def __init__(self, body, version):
+        self.body = body
+        self.version = version
+        self.etag = f'"{version}"'
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.expires_at = time.monotonic() + METADATA_CACHE_TTL
+
+
+class MetadataCache:
+    """ Metadados em memória com expiração, invalidação explícita e uma carga por vez. """
+
+    def __init__(self):
+        self._entry = None
+        self._generation = 0  # Incrementada a cada invalidação
+        self._loads = SingleFlight()
+        self._counters = {"requests": 0, "not_modified": 0, "loads": 0, "invalidations": 0}
+
+    async def get(self):
+        """ Entrada atual (recarregada do banco se expirada ou invalidada). """
+        self._counters["requests"] += 1
+        entry = self._entry
+        if entry is None or entry.expires_at <= time.monotonic():
+            # Uma carga por geração: quem chega depois de invalidate() não pega carona na anterior
+            generation = self._generation
+            entry, _ = await self._loads.run(f"metadata:{generation}", lambda: self._load(generation))
+        return entry
+
+    def record_not_modified(self):
+        self._counters["not_modified"] += 1
+
+    def invalidate(self):
+        """ Descarta o payload: a próxima requisição recarrega do banco. """
+        self._generation += 1
+        self._entry = None
+        self._counters["invalidations"] += 1
+
+    async def _load(self, generation):
+        # Lookups em paralelo (cada um com sua conexão do pool)
+        results = await asyncio.gather(*(fetch_all(sql) for sql, _ in METADATA_QUERIES.values()))
+        payload = {
+            name: [dict(zip(fields, row)) for row in rows]
+            for (name, (_, fields)), (_, rows) in zip(METADATA_QUERIES.items(), results)
+        }
+        # Versão = hash do conteúdo: igual em todos os workers e só muda quando os dados mudam
+        payload["version"] = hashlib.sha1(dumps(payload)).hexdigest()[:16]
+        entry = MetadataEntry(dumps(payload), payload["version"])
+        self._counters["loads"] += 1
+        # Invalidada durante a carga: o resultado pode ser anterior à mudança e não é guardado
+        if generation == self._generation:
+            self._entry = entry
+        return entry
+
+    def stats(self):
+        entry = self._entry
+        return {
+            "version": entry.version if entry else None,
+            "loaded_at": entry.loaded_at if entry else None,
+            "ttl_s": METADATA_CACHE_TTL,
+            **self._counters,
+        }
+
+
+def etag_matches(if_none_match, etag):
+    """ If-None-Match: lista de ETags (fracos ou fortes) ou '*'. """
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+# Cache compartilhado pela rota /metadata/filters
+metadata_cache = MetadataCache()
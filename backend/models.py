@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, NaiveDatetime
 from typing import List, Dict, Any, Optional
 
 class PivotRequest(BaseModel):
@@ -7,15 +7,127 @@ class PivotRequest(BaseModel):
     no endpoint POST /analytics/pivot.
     """
     metric: str = Field(..., description="Coluna para cálculo (Ex: total_amount)")
-    agg_func: str = Field(..., description="Função de agregação (SUM, AVG, COUNT)")
+    agg_func: str = Field(..., pattern=r"(?i)^\s*(SUM|AVG|COUNT|MIN|MAX|COUNT_DISTINCT|P50|P90|P99)\s*$",
+                          description="Função de agregação (SUM, AVG, COUNT, MIN, MAX, COUNT_DISTINCT, P50, P90, P99)")
     group_by: str = Field(..., description="Dimensão para agrupar (Ex: channels.name)")
 
     filters: Dict[str, Any] = Field({}, description="Filtros a serem aplicados (Ex: date_range)")
 
+    # Paginação por keyset (apenas /analytics/pivot e /analytics/pivot/stream). Sem limit
+    # nem cursor a rota devolve o top 100, como antes.
+    limit: Optional[int] = Field(None, ge=1, le=10000, description="Tamanho da página (linhas por resposta).")
+    cursor: Optional[str] = Field(None, description="Token 'next_cursor' devolvido pela página anterior.")
+
+    # Modo aproximado (apenas /analytics/pivot e /analytics/pivot/batch, sem paginação): pivots
+    # de 6 meses ou do histórico inteiro são estimados a partir de uma amostra de `sales`
+    precision: str = Field("exact", pattern="^(exact|approximate)$",
+                           description="'exact' (padrão) ou 'approximate' (amostragem, com intervalo de confiança).")
+
+class PivotBatchRequest(BaseModel):
+    """
+    Payload do endpoint POST /analytics/pivot/batch: várias requisições de pivot
+    respondidas em uma única chamada.
+    """
+    requests: List[PivotRequest] = Field(..., min_length=1, max_length=50, description="Requisições de pivot (máx. 50).")
+
 class AnalyticsResponse(BaseModel):
     """
     Define a estrutura da resposta devolvida pelo Motor de Queries.
     """
     data: List[Dict[str, Any]] = Field(..., description="Lista de resultados agregados.")
     execution_time_ms: float = Field(..., description="Tempo de execução da query em milissegundos.")
-    status: str = Field(..., description="Status da requisição (success/error).")
\ No newline at end of file
+    status: str = Field(..., description="Status da requisição (success/error).")
+    cache: str = Field("miss", description="Origem do resultado: 'hit' (cache em memória) ou 'miss' (executado no DB).")
+    source: str = Field("sales", description="Tabela consultada: 'sales' (tabelas base), 'sales_sample' (amostra) ou o rollup/sketch usado.")
+    precision: str = Field("exact", description="'approximate' quando o resultado é uma estimativa (colunas ci_lower/ci_upper).")
+    sample_percent: Optional[float] = Field(None, description="Modo aproximado: percentual dos blocos de 'sales' lidos.")
+    confidence_level: Optional[float] = Field(None, description="Modo aproximado: nível de confiança de ci_lower/ci_upper.")
+    relative_error: Optional[float] = Field(None, description="Sketches (COUNT_DISTINCT/percentis): erro relativo esperado.")
+    query_class: Optional[str] = Field(None, description="Classe de custo da admissão (light/medium/heavy); None em cache hit.")
+    coalesced: Optional[bool] = Field(None, description="O resultado veio de uma execução idêntica já em andamento.")
+    has_more: Optional[bool] = Field(None, description="Paginação: existem mais linhas após esta página.")
+    next_cursor: Optional[str] = Field(None, description="Paginação: token para buscar a próxima página.")
+
+# Ingestão (POST /ingest/sales): uma venda por linha do NDJSON
+
+class IngestItem(BaseModel):
+    """ Customização de um produto (item_product_sales). """
+    item_id: int
+    option_group_id: Optional[int] = None
+    quantity: float = Field(1, gt=0)
+    additional_price: float = 0
+    price: float = 0
+    amount: float = 1
+    observations: Optional[str] = Field(None, max_length=300)
+
+class IngestProductSale(BaseModel):
+    """ Linha de produto da venda (product_sales) com suas customizações. """
+    product_id: int
+    quantity: float = Field(..., gt=0)
+    base_price: float
+    total_price: float
+    observations: Optional[str] = Field(None, max_length=300)
+    items: List[IngestItem] = Field([], max_length=50)
+
+class IngestDeliveryAddress(BaseModel):
+    """ Endereço de entrega (delivery_addresses). """
+    street: Optional[str] = Field(None, max_length=200)
+    number: Optional[str] = Field(None, max_length=20)
+    complement: Optional[str] = Field(None, max_length=200)
+    neighborhood: Optional[str] = Field(None, max_length=100)
+    city: Optional[str] = Field(None, max_length=100)
+    state: Optional[str] = Field(None, max_length=50)
+    postal_code: Optional[str] = Field(None, max_length=20)
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+class IngestDelivery(BaseModel):
+    """ Entrega da venda (delivery_sales) e, opcionalmente, o endereço. """
+    courier_name: Optional[str] = Field(None, max_length=100)
+    courier_phone: Optional[str] = Field(None, max_length=100)
+    courier_type: Optional[str] = Field(None, max_length=100)
+    delivery_type: Optional[str] = Field(None, max_length=100)
+    status: Optional[str] = Field(None, max_length=100)
+    delivery_fee: Optional[float] = None
+    courier_fee: Optional[float] = None
+    address: Optional[IngestDeliveryAddress] = None
+
+class IngestPayment(BaseModel):
+    """ Pagamento da venda (payments). """
+    payment_type_id: Optional[int] = None
+    value: float
+    is_online: bool = False
+    description: Optional[str] = Field(None, max_length=100)
+    currency: str = Field("BRL", max_length=10)
+
+class IngestSale(BaseModel):
+    """
+    Venda recebida pelo endpoint POST /ingest/sales, com produtos, customizações,
+    entrega e pagamentos aninhados. Os ids são atribuídos pelo servidor.
+    """
+    store_id: int
+    channel_id: int
+    sub_brand_id: Optional[int] = None
+    customer_id: Optional[int] = None
+    customer_name: Optional[str] = Field(None, max_length=100)
+    cod_sale1: Optional[str] = Field(None, max_length=100, description="Id do pedido no sistema de origem.")
+    created_at: NaiveDatetime = Field(..., description="Horário local da venda, sem fuso (como sales.created_at).")
+    sale_status_desc: str = Field("COMPLETED", max_length=100)
+
+    total_amount_items: float
+    total_discount: float = 0
+    total_increase: float = 0
+    delivery_fee: float = 0
+    service_tax_fee: float = 0
+    total_amount: float
+    value_paid: float = 0
+
+    production_seconds: Optional[int] = Field(None, ge=0)
+    delivery_seconds: Optional[int] = Field(None, ge=0)
+    people_quantity: Optional[int] = Field(None, ge=0)
+    discount_reason: Optional[str] = Field(None, max_length=300)
+    origin: str = Field("API", max_length=100)
+
+    products: List[IngestProductSale] = Field([], max_length=100)
+    delivery: Optional[IngestDelivery] = None
+    payments: List[IngestPayment] = Field([], max_length=20)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Particionamento mensal (RANGE por data) de `sales` e das tabelas filhas.
+
+O layout particionado é opcional: `migrate` converte o schema original
+(database-schema.sql) em uma única transação. As tabelas filhas ganham a coluna
+`sale_created_at` (cópia de `sales.created_at`), que é a sua chave de partição;
+assim um filtro de período (ex: últimos 7 dias) descarta as partições antigas de
+todas as tabelas envolvidas na query, não apenas de `sales`.
+
+Uso:
+    python -m backend.partitioning migrate                  # converte o schema atual
+    python -m backend.partitioning extend --months-ahead 3  # cria as partições dos próximos meses
+    python -m backend.partitioning status                   # partições e linhas estimadas
+"""
+
+import argparse
+import time
+from datetime import date
+
+from backend.database import get_db_connection, fetch_all, DB_ERRORS
+
+PARTITION_CHECK_INTERVAL = 60  # s entre verificações do layout de `sales`
+DEFAULT_MONTHS_AHEAD = 3
+
+# =======================================================================
+# 1. DEFINIÇÕES
+# =======================================================================
+
+# Tabela -> chave de partição. As filhas referenciam `sales` por (sale_id, sale_created_at).
+PARTITIONED_TABLES = {
+    "sales": "created_at",
+    "product_sales": "sale_created_at",
+    "payments": "sale_created_at",
+    "delivery_addresses": "sale_created_at",
+}
+CHILD_TABLES = [table for table in PARTITIONED_TABLES if table != "sales"]
+
+IS_PARTITIONED_QUERY = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'sales' AND c.relnamespace = 'public'::regnamespace
+    )
+"""
+
+# Índices secundários (não únicos) das tabelas migradas: recriados sobre as particionadas
+SECONDARY_INDEXES_QUERY = """
+    SELECT pg_get_indexdef(ix.indexrelid)
+    FROM pg_index ix
+    JOIN pg_class c ON c.oid = ix.indrelid
+    WHERE c.relname = ANY(%s) AND c.relnamespace = 'public'::regnamespace
+      AND NOT ix.indisprimary AND NOT ix.indisunique
+"""
+
+# FKs das tabelas migradas para tabelas que não são migradas (lojas, produtos, ...)
+OUTBOUND_FKS_QUERY = """
+    SELECT c.relname, con.conname, pg_get_constraintdef(con.oid)
+    FROM pg_constraint con
+    JOIN pg_class c ON c.oid = con.conrelid
+    JOIN pg_class r ON r.oid = con.confrelid
+    WHERE con.contype = 'f' AND c.relname = ANY(%s) AND NOT r.relname = ANY(%s)
+"""
+
+# FKs de outras tabelas para as migradas: deixam de existir (a PK passa a incluir a data)
+INBOUND_FKS_QUERY = """
+    SELECT c.relname, con.conname
+    FROM pg_constraint con
+    JOIN pg_class c ON c.oid = con.conrelid
+    JOIN pg_class r ON r.oid = con.confrelid
+    WHERE con.contype = 'f' AND r.relname = ANY(%s) AND NOT c.relname = ANY(%s)
+"""
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def create_month_partitions(cursor, table, first_month, last_month, parent=None):
+    """
+    Cria (se ainda não existirem) as partições mensais de `table` entre os dois
+    meses, inclusive. `parent` permite criá-las sob outro nome de tabela (migração).
+    """
+    created = []
+    month = first_month
+    while month <= last_month:
+        name = _partition_name(table, month)
+        cursor.execute("SELECT to_regclass(%s) IS NULL", (name,))
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE {name} PARTITION OF {parent or table} FOR VALUES FROM (%s) TO (%s)",
+                (month, _add_months(month, 1))
+            )
+            created.append(name)
+        month = _add_months(month, 1)
+    return created
+
+# =======================================================================
+# 2. MIGRAÇÃO
+# =======================================================================
+
+def is_partitioned(cursor):
+    cursor.execute(IS_PARTITIONED_QUERY)
+    return cursor.fetchone()[0]
+
+
+def migrate(conn, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Converte `sales`, `product_sales`, `payments` e `delivery_addresses` em tabelas
+    particionadas por mês, preservando dados, sequências, índices secundários e FKs
+    para as tabelas de dimensão. Tudo roda em uma transação: em caso de erro nada muda.
+
+    Observação: FKs de tabelas não particionadas para as migradas (delivery_sales,
+    coupon_sales, item_product_sales) são removidas, pois a PK passa a ser (id, data).
+    """
+    cursor = conn.cursor()
+    start = time.time()
+    tables = list(PARTITIONED_TABLES)
+
+    if is_partitioned(cursor):
+        return {"migrated": False, "detail": "sales já é particionada"}
+
+    cursor.execute(f"LOCK TABLE {', '.join(tables)} IN ACCESS EXCLUSIVE MODE")
+
+    cursor.execute("SELECT MIN(created_at), MAX(created_at) FROM sales")
+    min_created, max_created = cursor.fetchone()
+    today = date.today()
+    first_month = _month_start(min_created or today)
+    last_month = _add_months(_month_start(max(max_created.date(), today) if max_created else today), months_ahead)
+
+    cursor.execute(SECONDARY_INDEXES_QUERY, (tables,))
+    index_definitions = [row[0] for row in cursor.fetchall()]
+    cursor.execute(OUTBOUND_FKS_QUERY, (tables, tables))
+    outbound_fks = cursor.fetchall()
+    cursor.execute(INBOUND_FKS_QUERY, (tables, tables))
+    dropped_fks = [f"{table}.{name}" for table, name in cursor.fetchall()]
+
+    # 1. Novas tabelas particionadas (mesmas colunas e defaults; filhas + sale_created_at),
+    #    com as partições mensais e uma DEFAULT para datas fora do intervalo criado
+    for table, key in PARTITIONED_TABLES.items():
+        extra = "" if table == "sales" else ", sale_created_at TIMESTAMP NOT NULL"
+        cursor.execute(
+            f"CREATE TABLE {table}_partitioned (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS{extra}) "
+            f"PARTITION BY RANGE ({key})"
+        )
+        create_month_partitions(cursor, table, first_month, last_month, parent=f"{table}_partitioned")
+        cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table}_partitioned DEFAULT")
+
+    # 2. Cópia dos dados (as filhas herdam a data da venda)
+    cursor.execute("INSERT INTO sales_partitioned SELECT * FROM sales")
+    rows = {"sales": cursor.rowcount}
+    for table in CHILD_TABLES:
+        cursor.execute(
+            f"INSERT INTO {table}_partitioned SELECT c.*, s.created_at FROM {table} c JOIN sales s ON s.id = c.sale_id"
+        )
+        rows[table] = cursor.rowcount
+
+    # 3. Troca: as sequências dos SERIAL sobrevivem ao DROP das tabelas antigas
+    sequences = {}
+    for table in tables:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+        sequences[table] = cursor.fetchone()[0]
+        if sequences[table]:
+            cursor.execute(f"ALTER SEQUENCE {sequences[table]} OWNED BY NONE")
+    cursor.execute(f"DROP TABLE {', '.join(tables)} CASCADE")
+    for table in tables:
+        cursor.execute(f"ALTER TABLE {table}_partitioned RENAME TO {table}")
+        if sequences[table]:
+            cursor.execute(f"ALTER SEQUENCE {sequences[table]} OWNED BY {table}.id")
+
+    # 4. Chaves, FKs e índices
+    for table, key in PARTITIONED_TABLES.items():
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {key})")
+    for table, name, definition in outbound_fks:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    for table in CHILD_TABLES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_sale_id ON {table} (sale_id)")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_sale_fkey FOREIGN KEY (sale_id, sale_created_at) "
+            f"REFERENCES sales (id, created_at) ON DELETE CASCADE"
+        )
+    for definition in index_definitions:
+        cursor.execute(definition.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+    for table in tables:
+        cursor.execute(f"ANALYZE {table}")
+    conn.commit()
+
+    return {
+        "migrated": True,
+        "rows": rows,
+        "months": f"{first_month:%Y-%m}..{last_month:%Y-%m}",
+        "indexes_recreated": len(index_definitions),
+        "dropped_fks": dropped_fks,
+        "elapsed_ms": round((time.time() - start) * 1000, 2),
+    }
+
+
+def extend(conn, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Garante as partições do mês corrente até `months_ahead` meses à frente
+    (executar periodicamente, ex: cron mensal). Retorna as partições criadas.
+    """
+    cursor = conn.cursor()
+    if not is_partitioned(cursor):
+        return []
+    current = _month_start(date.today())
+    created = []
+    for table in PARTITIONED_TABLES:
+        created += create_month_partitions(cursor, table, current, _add_months(current, months_ahead))
+    conn.commit()
+    return created
+
+
+_partition_check = (False, 0.0)  # (particionada?, verificado_em)
+
+
+async def is_sales_partitioned():
+    """
+    Indica se `sales` usa o layout particionado (o query_builder então emite os
+    predicados de data também sobre as tabelas filhas). Reavaliado a cada
+    PARTITION_CHECK_INTERVAL segundos.
+    """
+    global _partition_check
+    partitioned, checked_at = _partition_check
+    now = time.monotonic()
+    if now - checked_at > PARTITION_CHECK_INTERVAL:
+        try:
+            _, rows = await fetch_all(IS_PARTITIONED_QUERY)
+            partitioned = bool(rows[0][0])
+        except DB_ERRORS:
+            partitioned = False
+        _partition_check = (partitioned, now)
+    return partitioned
+
+# =======================================================================
+# 3. CLI
+# =======================================================================
+
+STATUS_QUERY = """
+    SELECT parent.relname, child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples::bigint
+    FROM pg_inherits i
+    JOIN pg_class parent ON parent.oid = i.inhparent
+    JOIN pg_class child ON child.oid = i.inhrelid
+    WHERE parent.relname = ANY(%s)
+    ORDER BY parent.relname, child.relname
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monthly range partitioning for sales and its child tables')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('migrate', 'Converte o schema atual para o layout particionado'),
+                               ('extend', 'Cria as partições dos próximos meses')):
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD,
+                                    help='Meses futuros com partição pré-criada')
+    subparsers.add_parser('status', help='Lista as partições existentes')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        if args.command == 'migrate':
+            result = migrate(conn, args.months_ahead)
+            if not result["migrated"]:
+                print(f"- {result['detail']}")
+                return
+            for table, count in result["rows"].items():
+                print(f"✓ {table}: {count:,} linhas")
+            print(f"✓ Partições mensais {result['months']}, {result['indexes_recreated']} índices recriados, "
+                  f"{result['elapsed_ms']} ms")
+            if result["dropped_fks"]:
+                print(f"  FKs removidas: {', '.join(result['dropped_fks'])}")
+        elif args.command == 'extend':
+            created = extend(conn, args.months_ahead)
+            print(f"✓ {len(created)} partições criadas" + (f": {', '.join(created)}" if created else ""))
+        else:
+            cursor = conn.cursor()
+            cursor.execute(STATUS_QUERY, (list(PARTITIONED_TABLES),))
+            rows = cursor.fetchall()
+            if not rows:
+                print("- sales não é particionada (execute 'python -m backend.partitioning migrate')")
+            for parent, child, bound, tuples in rows:
+                print(f"{parent:<20} {child:<32} {max(tuples, 0):>10,}  {bound}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,10 @@
-from typing import Dict, Any, Tuple, List
+from typing import Dict, Any, Tuple, List, NamedTuple, Optional
+from functools import lru_cache
+import base64
+import binascii
+import hashlib
+import json
+import os
 import re
 
 # =======================================================================
@@ -28,6 +34,29 @@ DIMENSION_MAP = {
     "filter.channel_id":    {"column": "s.channel_id", "join": None},
 }
 
+# A2: MAPA DE MÉTRICAS: as únicas colunas agregáveis (o nome da métrica nunca vai cru para o SQL)
+METRIC_MAP = {
+    # Colunas de 'sales'
+    "id":                 {"column": "s.id", "join": None},
+    "customer_id":        {"column": "s.customer_id", "join": None},
+    "total_amount_items": {"column": "s.total_amount_items", "join": None},
+    "total_discount":     {"column": "s.total_discount", "join": None},
+    "total_increase":     {"column": "s.total_increase", "join": None},
+    "delivery_fee":       {"column": "s.delivery_fee", "join": None},
+    "service_tax_fee":    {"column": "s.service_tax_fee", "join": None},
+    "total_amount":       {"column": "s.total_amount", "join": None},
+    "value_paid":         {"column": "s.value_paid", "join": None},
+    "production_seconds": {"column": "s.production_seconds", "join": None},
+    "delivery_seconds":   {"column": "s.delivery_seconds", "join": None},
+    "people_quantity":    {"column": "s.people_quantity", "join": None},
+
+    # Customizações de itens (exigem o JOIN 'items_custom')
+    "items.quantity":         {"column": "ips.quantity", "join": "items_custom"},
+    "items.additional_price": {"column": "ips.additional_price", "join": "items_custom"},
+    "items.price":            {"column": "ips.price", "join": "items_custom"},
+    "items.amount":           {"column": "ips.amount", "join": "items_custom"},
+}
+
 # B: MAPA DE JOINS: Define a string SQL exata para cada 'join' necessário.
 JOIN_MAP = {
     "stores": "JOIN stores st ON st.id = s.store_id",
@@ -43,12 +72,402 @@ JOIN_MAP = {
     "delivery_addresses": "JOIN delivery_addresses da ON da.sale_id = s.id",
 }
 
+# B2: TABELAS FILHAS (relação 1:N com `sales`). Juntá-las diretamente multiplicaria
+# as linhas de `sales` (ex: SUM(s.total_amount) contado uma vez por produto da venda).
+# O builder pré-agrega cada filha por venda em uma subquery antes do JOIN, de modo
+# que cada venda aparece uma única vez por valor da dimensão.
+# Estrutura derivada do JOIN_MAP: {join_key: {"alias", "table", "joins"}}, onde `table`
+# é a filha ligada a `sales` por sale_id e `joins` são os JOINs que partem dela.
+CHILD_JOIN_PATTERN = re.compile(r"^JOIN (\w+) (\w+) ON \2\.sale_id = s\.id\s*(.*)$")
+
+
+def _child_source(join_sql: str) -> Optional[Dict[str, Any]]:
+    match = CHILD_JOIN_PATTERN.match(join_sql)
+    if match is None:
+        return None
+    table, alias, rest = match.groups()
+    return {"alias": alias, "table": table, "joins": [j for j in re.split(r"\s+(?=JOIN )", rest) if j]}
+
+
+CHILD_SOURCES = {
+    join_key: source for join_key, source in
+    ((join_key, _child_source(join_sql)) for join_key, join_sql in JOIN_MAP.items())
+    if source is not None
+}
+
+# B3: LAYOUT PARTICIONADO (backend/partitioning.py): as tabelas filhas de `sales`
+# carregam a data da venda (`sale_created_at`, chave de partição). As subqueries das
+# filhas repetem o filtro de período sobre essa coluna e o JOIN casa também a data,
+# para que o Postgres descarte as partições fora do período em todas as tabelas.
+PARTITIONED_CHILD_ALIASES = {"ps": "product_sales", "pay": "payments", "da": "delivery_addresses"}
+
+# B4: FILTROS SOBRE TABELAS FILHAS: semi-join (EXISTS), sem JOIN e sem multiplicar linhas.
+# delivery_type é coluna de delivery_sales (e não de delivery_addresses).
+SEMI_JOIN_FILTERS = {
+    "delivery_type": "EXISTS (SELECT 1 FROM delivery_sales ds WHERE ds.sale_id = s.id AND ds.delivery_type = %s)",
+}
+
+# Agregações de métricas de tabelas filhas: expressão por venda (subquery) e a
+# combinação no SELECT externo ({m} = coluna pré-agregada)
+CHILD_AGGREGATES = {
+    "SUM":   ({"": "SUM({col})"}, "SUM({m})"),
+    "COUNT": ({"": "COUNT({col})"}, "SUM({m})::bigint"),
+    "AVG":   ({"_sum": "SUM({col})", "_count": "COUNT({col})"}, "SUM({m}_sum) / NULLIF(SUM({m}_count), 0)"),
+    "MIN":   ({"": "MIN({col})"}, "MIN({m})"),
+    "MAX":   ({"": "MAX({col})"}, "MAX({m})"),
+}
+
+# Filtros que recebem listas de IDs (a ordem dos IDs não altera o resultado)
+ID_LIST_FILTERS = ("store_ids", "channel_ids")
+
+# Filtros de valor único em texto: o período vai literal na forma do SQL (chave dos caches
+# de compilação) e o delivery_type vira um parâmetro escalar
+TEXT_FILTERS = ("date_range", "delivery_type")
+
+# Períodos relativos aceitos em filters['date_range']
+DATE_RANGES = {
+    "last_7d": "7 days",
+    "last_30d": "30 days",
+    "last_6m": "6 months",
+}
+
+# C: MAPA DO ROLLUP LOJA x CANAL x HORA (backend/rollups.py: sales_hourly_rollup)
+ROLLUP_TABLE = "sales_hourly_rollup"
+
+# Dimensões que o rollup consegue responder (coluna sobre 'r' e JOIN necessário)
+ROLLUP_DIMENSIONS = {
+    "stores.name":   {"column": "st.name", "join": "JOIN stores st ON st.id = r.store_id"},
+    "channels.name": {"column": "ch.name", "join": "JOIN channels ch ON ch.id = r.channel_id"},
+    "date.day":      {"column": "DATE(r.bucket)", "join": None},
+    "date.hour":     {"column": "EXTRACT(HOUR FROM r.bucket)", "join": None},
+}
+
+# Métricas do rollup: coluna de soma e coluna de contagem (AVG = soma / contagem)
+ROLLUP_MEASURES = {
+    "total_amount":       {"sum": "total_amount_sum", "count": "orders_completed"},
+    "id":                 {"sum": None, "count": "orders_completed"},
+    "production_seconds": {"sum": "production_seconds_sum", "count": "production_seconds_count"},
+    "delivery_seconds":   {"sum": "delivery_seconds_sum", "count": "delivery_seconds_count"},
+}
+
+# Filtros que o rollup sabe aplicar; qualquer outro força a consulta às tabelas base
+ROLLUP_FILTERS = {"date_range", "store_ids", "channel_ids"}
+
+# Paginação por keyset: tamanho padrão da página quando só o cursor é informado
+DEFAULT_PAGE_SIZE = 100
+
+# Agregações aceitas sobre colunas de 'sales' (qualquer outra é rejeitada pelo builder)
+SQL_AGGREGATES = {
+    "SUM": "SUM({col})",
+    "COUNT": "COUNT({col})",
+    "AVG": "AVG({col})",
+    "MIN": "MIN({col})",
+    "MAX": "MAX({col})",
+    "COUNT_DISTINCT": "COUNT(DISTINCT {col})",
+    "P50": "percentile_cont(0.5) WITHIN GROUP (ORDER BY {col})",
+    "P90": "percentile_cont(0.9) WITHIN GROUP (ORDER BY {col})",
+    "P99": "percentile_cont(0.99) WITHIN GROUP (ORDER BY {col})",
+}
+
+# E: SKETCHES MESCLÁVEIS LOJA x CANAL x DIA (backend/rollups.py)
+HLL_TABLE = "customer_hll_rollup"             # HyperLogLog de customer_id (COUNT_DISTINCT)
+HISTOGRAM_TABLE = "latency_histogram_rollup"  # Histograma logarítmico dos tempos (P50/P90/P99)
+SKETCH_TABLES = (HLL_TABLE, HISTOGRAM_TABLE)
+
+HLL_PRECISION = 12                                    # 2^12 registradores por loja x canal x dia
+HLL_REGISTERS = 2 ** HLL_PRECISION
+HISTOGRAM_GAMMA = 1.02                                # Bucket i = [γ^i, γ^(i+1))
+PERCENTILE_AGGREGATES = {"P50": 0.5, "P90": 0.9, "P99": 0.99}
+HISTOGRAM_METRICS = ("production_seconds", "delivery_seconds")
+
+# Erro dos sketches: padrão do HLL (1,04 / √m) e relativo máximo do histograma ((γ-1) / (γ+1))
+SKETCH_RELATIVE_ERROR = {
+    HLL_TABLE: round(1.04 / HLL_REGISTERS ** 0.5, 4),
+    HISTOGRAM_TABLE: round((HISTOGRAM_GAMMA - 1) / (HISTOGRAM_GAMMA + 1), 4),
+}
+
+# Hash de 32 bits do cliente (md5: estável entre versões do Postgres); os bits baixos
+# escolhem o registrador e o rho é a posição do primeiro bit 1 nos bits restantes.
+# Usados pelo refresh dos sketches e pelos ramos que leem `sales` diretamente.
+HLL_HASH_JOIN = "CROSS JOIN LATERAL (SELECT ('x' || substr(md5(s.customer_id::text), 1, 8))::bit(32)::int AS h) hc"
+HLL_REGISTER_SQL = f"(hc.h & {HLL_REGISTERS - 1})"
+HLL_RHO_SQL = (f"COALESCE(NULLIF(position('1' IN ((hc.h >> {HLL_PRECISION})::bit({32 - HLL_PRECISION}))::text), 0), "
+               f"{33 - HLL_PRECISION})")
+HISTOGRAM_BUCKET_SQL = "FLOOR(LN(GREATEST({value}, 1)) / LN(" + str(HISTOGRAM_GAMMA) + "))::smallint"
+
+# Dimensões respondidas pelos sketches (granularidade diária: sem date.hour)
+SKETCH_DIMENSIONS = {
+    "stores.name":   {"column": "st.name", "join": "JOIN stores st ON st.id = r.store_id"},
+    "channels.name": {"column": "ch.name", "join": "JOIN channels ch ON ch.id = r.channel_id"},
+    "date.day":      {"column": "r.day", "join": None},
+}
+
+# D: MODO APROXIMADO (precision="approximate"): amostra de blocos de `sales` (TABLESAMPLE SYSTEM)
+SAMPLE_SOURCE = "sales_sample"
+APPROXIMATE_SAMPLE_PERCENT = float(os.getenv('APPROXIMATE_SAMPLE_PERCENT', '10'))  # % dos blocos lidos
+# REPEATABLE: a mesma amostra em todas as leituras de `sales` da query e entre requisições
+SAMPLE_SEED = 42
+# Períodos em que a amostra compensa (sem período = histórico inteiro também é amostrado);
+# períodos curtos já são baratos pelo índice de data e seguem exatos
+SAMPLED_DATE_RANGES = {"last_6m"}
+# Intervalo de confiança devolvido por grupo (ci_lower, ci_upper)
+CONFIDENCE_LEVEL = 0.95
+CONFIDENCE_Z = 1.96
+
+
+class AnalyticsQuery(NamedTuple):
+    """ Query pronta para execução e a tabela de origem escolhida pelo builder. """
+    sql: str
+    params: List
+    source: str
+
 # =======================================================================
-# 2. FUNÇÃO CENTRAL
+# 2. NORMALIZAÇÃO DE REQUISIÇÕES
 # =======================================================================
 
-def build_analytics_query(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any]) -> Tuple[str, List]:
-    
+def normalize_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Forma canônica dos filtros: listas de IDs inteiros ordenadas e sem duplicatas,
+    IDs escalares promovidos a lista e filtros vazios (ignorados pelo builder)
+    removidos. Valores de tipo inesperado (ex: date_range em lista) geram ValueError.
+    """
+    normalized = {}
+    for key, value in filters.items():
+        if value is None or value == "" or value == []:
+            continue
+        if key in ID_LIST_FILTERS:
+            value = sorted(set(_filter_id(key, item) for item in (value if isinstance(value, list) else [value])))
+        elif key in TEXT_FILTERS and not isinstance(value, str):
+            raise ValueError(f"Filtro {key} inválido: esperado texto, recebido {type(value).__name__}")
+        normalized[key] = value
+    return normalized
+
+
+def _filter_id(key: str, value: Any) -> int:
+    """ ID de um filtro de lista: inteiro (ou texto com um inteiro, como vem de query strings). """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    raise ValueError(f"Filtro {key} inválido: IDs devem ser inteiros, recebido {value!r}")
+
+
+def pivot_cache_key(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any],
+                    precision: str = "exact") -> Tuple:
+    """ Chave canônica (hashable) de uma requisição de pivot: payloads equivalentes geram a mesma chave. """
+    return (
+        metric.strip(),
+        agg_func.strip().upper(),
+        group_by.strip(),
+        json.dumps(normalize_filters(filters), sort_keys=True, default=str),
+        precision,
+    )
+
+
+def _cursor_fingerprint(cache_key: Tuple) -> str:
+    return hashlib.sha1(repr(cache_key).encode()).hexdigest()[:12]
+
+
+def encode_cursor(cache_key: Tuple, row: Tuple) -> str:
+    """
+    Token opaco da próxima página: (result, dimension) da última linha entregue,
+    como texto, e a impressão digital da requisição que o gerou.
+    """
+    result, dimension = (None if value is None else str(value) for value in row)
+    payload = json.dumps([result, dimension, _cursor_fingerprint(cache_key)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, cache_key: Tuple) -> Tuple[Optional[str], Optional[str]]:
+    """ Valida o token contra a requisição atual e devolve (result, dimension) da última linha. """
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        result, dimension, fingerprint = json.loads(payload)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("Cursor de paginação inválido")
+    if fingerprint != _cursor_fingerprint(cache_key):
+        raise ValueError("Cursor de paginação pertence a outra requisição (métrica, dimensão ou filtros diferentes)")
+    return result, dimension
+
+# =======================================================================
+# 3. FUNÇÃO CENTRAL
+# =======================================================================
+
+def plan_analytics_query(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any],
+                         use_rollups: bool = False, partitioned: bool = False,
+                         precision: str = "exact", use_sketches: bool = False) -> AnalyticsQuery:
+    """
+    Escolhe a origem dos dados: o rollup loja x canal x hora quando a requisição
+    pode ser respondida por ele (e `use_rollups` está ativo), os sketches loja x
+    canal x dia para COUNT_DISTINCT e percentis (`use_sketches`), senão as tabelas base
+    (`partitioned` indica o layout particionado de `sales`). Com
+    `precision="approximate"` as tabelas base são lidas por amostragem quando
+    `build_approximate_query` aceita a requisição; o rollup, exato, tem preferência.
+    """
+    filters = normalize_filters(filters)
+
+    if use_rollups:
+        rollup_query = build_rollup_query(metric, agg_func, group_by, filters)
+        if rollup_query is not None:
+            return AnalyticsQuery(*rollup_query, source=ROLLUP_TABLE)
+
+    if use_sketches:
+        sketch_query = build_sketch_query(metric, agg_func, group_by, filters)
+        if sketch_query is not None:
+            return AnalyticsQuery(*sketch_query, source=sketch_table(agg_func))
+
+    if precision == "approximate":
+        approximate_query = build_approximate_query(metric, agg_func, group_by, filters, partitioned)
+        if approximate_query is not None:
+            return AnalyticsQuery(*approximate_query, source=SAMPLE_SOURCE)
+
+    return AnalyticsQuery(*build_analytics_query(metric, agg_func, group_by, filters, partitioned), source="sales")
+
+
+def build_analytics_query(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any],
+                          partitioned: bool = False) -> Tuple[str, List]:
+    """ Query do pivot sobre as tabelas base: colunas (result, dimension), top 100 por result. """
+    return build_multi_metric_query([(metric, agg_func)], group_by, filters, ranked=True, partitioned=partitioned)
+
+
+def build_paginated_query(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any],
+                          limit: Optional[int] = None, after: Optional[Tuple] = None,
+                          partitioned: bool = False) -> Tuple[str, List]:
+    """
+    Query do pivot sem o corte fixo de 100 linhas e em ordem total (result DESC,
+    dimension ASC, NULLs por último), para paginação e streaming.
+
+    `after` é o (result, dimension) da última linha já entregue (ver decode_cursor):
+    a página seguinte começa logo depois dele (keyset, sem OFFSET). `limit=None`
+    retorna todas as linhas restantes.
+    """
+    inner, params = build_multi_metric_query([(metric, agg_func)], group_by, filters, partitioned=partitioned)
+    after_shape = None if after is None else tuple(value is None for value in after)
+    final_query = _compile_paginated_query(inner, after_shape, limit is not None)
+
+    keyset_params = []
+    if after is not None:
+        result, dimension = after
+        if result is not None:
+            keyset_params += [result, result] if dimension is not None else [result]
+        if dimension is not None:
+            keyset_params.append(dimension)
+    return final_query, params + keyset_params + ([limit] if limit is not None else [])
+
+
+@lru_cache(maxsize=1024)
+def _compile_paginated_query(inner: str, after_shape: Optional[Tuple[bool, bool]], limited: bool) -> str:
+    """ Envolve a query agregada com o predicado de keyset (conforme os NULLs do cursor) e a ordenação total. """
+    keyset = ""
+    if after_shape is not None:
+        # Valores do cursor seguem como texto; o Postgres os converte para o tipo da coluna
+        dimension_after = "(q.dimension > %s OR q.dimension IS NULL)"
+        keyset = "WHERE " + {
+            (False, False): f"(q.result_0 < %s OR (q.result_0 = %s AND {dimension_after}) OR q.result_0 IS NULL)",
+            (False, True): "(q.result_0 < %s OR q.result_0 IS NULL)",
+            (True, False): f"(q.result_0 IS NULL AND {dimension_after})",
+            (True, True): "FALSE",
+        }[after_shape]
+    final_query = f"""
+        SELECT q.result_0 AS result, q.dimension AS dimension 
+        FROM ({inner.strip().rstrip(';')}) q 
+        {keyset} 
+        ORDER BY q.result_0 DESC NULLS LAST, q.dimension ASC NULLS LAST 
+        {"LIMIT %s" if limited else ""};
+    """
+    return final_query
+
+
+def _metric_column(metric: str) -> Tuple[str, Optional[str]]:
+    """ Coluna SQL da métrica e o JOIN que ela exige (None para colunas de 'sales'). """
+    if metric not in METRIC_MAP:
+        raise ValueError(f"Métrica inválida: {metric}")
+    return METRIC_MAP[metric]['column'], METRIC_MAP[metric]['join']
+
+
+def merge_key(metric: str, group_by: str, filters: Dict[str, Any]) -> Tuple:
+    """
+    Requisições com a mesma chave (dimensão, filtros e JOINs da métrica) podem ser
+    respondidas por um único SELECT com várias colunas agregadas.
+    """
+    return (group_by, json.dumps(normalize_filters(filters), sort_keys=True, default=str),
+            METRIC_MAP.get(metric, {}).get('join'))
+
+
+def query_join_set(metric: str, group_by: str, filters: Dict[str, Any]) -> Tuple[str, ...]:
+    """
+    Tabelas que a query do pivot junta a `sales` (chaves do JOIN_MAP, na ordem do
+    JOIN_MAP, mais os filtros de semi-join): indica o porte da query antes de executá-la.
+    """
+    join_keys = [DIMENSION_MAP.get(group_by, {}).get('join'), METRIC_MAP.get(metric, {}).get('join')]
+    join_keys += [DIMENSION_MAP[key]['join'] for key in filters if key.startswith('filter.') and key in DIMENSION_MAP]
+    return tuple(_ordered_joins(key for key in join_keys if key)) + tuple(
+        key for key in SEMI_JOIN_FILTERS if key in filters
+    )
+
+
+def filter_shape(filters: Dict[str, Any]) -> Tuple:
+    """
+    Forma dos filtros (já normalizados) que determina o texto do SQL: as chaves
+    presentes e o período, que vai literal na query. Os valores das listas de IDs
+    viram parâmetros de array e não alteram o texto.
+    """
+    return tuple(sorted(
+        (key, value if key == 'date_range' else None) for key, value in filters.items()
+    ))
+
+
+def _ordered_joins(join_keys) -> List[str]:
+    """ JOINs sem repetição e na ordem do JOIN_MAP: requisições equivalentes geram o mesmo texto. """
+    join_keys = set(join_keys)
+    return [join_key for join_key in JOIN_MAP if join_key in join_keys]
+
+
+def build_multi_metric_query(measures: List[Tuple[str, str]], group_by: str, filters: Dict[str, Any],
+                             ranked: bool = False, partitioned: bool = False,
+                             sample_percent: Optional[float] = None) -> Tuple[str, List]:
+    """
+    Monta um SELECT com uma coluna agregada por (métrica, agg_func) de `measures`.
+
+    Com `ranked=True` (uma única métrica) a saída é a do pivot: `result` ordenado
+    de forma decrescente e limitado a 100 linhas. Caso contrário as colunas se
+    chamam result_0..result_N e todos os grupos são retornados (o chamador ordena
+    cada métrica separadamente).
+
+    Com `partitioned=True` os JOINs e o filtro de período seguem o layout
+    particionado (PARTITIONED_JOIN_MAP), permitindo o partition pruning.
+
+    Com `sample_percent` (apenas sem `ranked`) `sales` é lida por TABLESAMPLE
+    SYSTEM e cada grupo é quebrado também por bloco da amostra (colunas
+    sample_table, sample_block), base das estimativas de `build_approximate_query`.
+
+    O SQL depende apenas da forma da requisição (ver `filter_shape`) e é compilado
+    uma única vez por forma; os valores dos filtros seguem como parâmetros.
+    """
+    filters = normalize_filters(filters)
+    if ranked and len(measures) != 1:
+        raise ValueError("ranked=True exige exatamente uma métrica")
+    if ranked and sample_percent is not None:
+        raise ValueError("sample_percent não pode ser usado com ranked=True")
+
+    final_query, param_keys = _compile_multi_metric_query(
+        tuple((metric, agg_func.upper()) for metric, agg_func in measures),
+        group_by, filter_shape(filters), ranked, partitioned, sample_percent
+    )
+    # Retorna a query SQL pronta e os parâmetros de filtro (para execução segura)
+    return final_query, [filters[key] for key in param_keys]
+
+
+@lru_cache(maxsize=1024)
+def _compile_multi_metric_query(measures: Tuple[Tuple[str, str], ...], group_by: str, shape: Tuple,
+                                ranked: bool, partitioned: bool,
+                                sample_percent: Optional[float] = None) -> Tuple[str, Tuple[str, ...]]:
+    """ Compila o SQL de uma forma de requisição: retorna (sql, chaves dos filtros na ordem dos parâmetros). """
+    filters = dict(shape)
+    sales_table = "sales s"
+    if sample_percent is not None:
+        sales_table += f" TABLESAMPLE SYSTEM ({sample_percent}) REPEATABLE ({SAMPLE_SEED})"
+
     # 1. VALIDAÇÃO, MAPEAMENTO DE DIMENSÃO E MÉTRICA
     if group_by not in DIMENSION_MAP:
         raise ValueError(f"Dimensão de agrupamento inválida: {group_by}")
@@ -56,17 +475,16 @@ def build_analytics_query(metric: str, agg_func: str, group_by: str, filters: Di
     dim_data = DIMENSION_MAP[group_by]
     group_by_col = dim_data['column']
     
-    metric_col = f"s.{metric}"
-    sql_joins = set()
+    join_keys = []
     if dim_data['join']:
-        sql_joins.add(dim_data['join'])
+        join_keys.append(dim_data['join'])
 
-    if metric.startswith('items.'):
-        # Ex: metric = 'items.additional_price' -> ips.additional_price
-        metric_col = f"ips.{metric.split('.')[-1]}"
-        
-        # Garante que o JOIN de customização (ips) esteja sempre presente
-        sql_joins.add('items_custom')
+    metric_columns = []
+    for metric, agg_func in measures:
+        metric_col, metric_join = _metric_column(metric)
+        if metric_join:
+            join_keys.append(metric_join)
+        metric_columns.append(metric_col)
 
     # 2. CONSTRUÇÃO DE JOINS ADICIONAIS DE FILTRO
     
@@ -75,68 +493,467 @@ def build_analytics_query(metric: str, agg_func: str, group_by: str, filters: Di
         if filter_key.startswith('filter.'):
             # Se for um filtro por dimensão (ex: filter.city), adicione o JOIN
             if filter_key in DIMENSION_MAP and DIMENSION_MAP[filter_key]['join']:
-                sql_joins.add(DIMENSION_MAP[filter_key]['join'])
-    
-    joins_string = " ".join([JOIN_MAP[join_key] for join_key in sql_joins])
+                join_keys.append(DIMENSION_MAP[filter_key]['join'])
 
-    # 3. CLÁUSULAS SELECT, FROM E AGRUPAMENTO
-    sql_select = f"{agg_func.upper()}({metric_col}) AS result, {group_by_col} AS dimension"
-    sql_from = "FROM sales s"
-    sql_group_by = f"GROUP BY {group_by_col}"
-
-    # 4. CLÁUSULA WHERE (FILTROS DE ALTA PERFORMANCE)
+    # 3. CLÁUSULA WHERE (FILTROS DE ALTA PERFORMANCE)
     where_clauses = []
-    filter_params = []
+    where_keys = []
 
     # Filtro Obrigatório de Negócio: APENAS VENDAS CONCLUÍDAS
     where_clauses.append("s.sale_status_desc = 'COMPLETED'")
 
     # Filtro de Data (Otimizado para PostgreSQL com INTERVAL)
-    if 'date_range' in filters:
-        if filters['date_range'] == 'last_7d':
-            where_clauses.append("s.created_at >= NOW() - INTERVAL '7 days'")
-        elif filters['date_range'] == 'last_30d':
-            where_clauses.append("s.created_at >= NOW() - INTERVAL '30 days'")
-        elif filters['date_range'] == 'last_6m':
-            where_clauses.append("s.created_at >= NOW() - INTERVAL '6 months'")
+    lower_bound = None
+    if filters.get('date_range') in DATE_RANGES:
+        lower_bound = f"NOW() - INTERVAL '{DATE_RANGES[filters['date_range']]}'"
+        where_clauses.append(f"s.created_at >= {lower_bound}")
     
-    # Filtro 1: store_ids (Exemplo de filtro por IDs na tabela 'sales')
-    if 'store_ids' in filters and filters['store_ids']:
-        store_ids = filters['store_ids']
-        if not isinstance(store_ids, list): store_ids = [store_ids]
-        
-        placeholders = ', '.join(['%s'] * len(store_ids))
-        where_clauses.append(f"s.store_id IN ({placeholders})")
-        filter_params.extend(store_ids)
-
-    # Filtro 2: channel_ids (Exemplo de filtro por IDs na tabela 'sales')
-    if 'channel_ids' in filters and filters['channel_ids']:
-        channel_ids = filters['channel_ids']
-        if not isinstance(channel_ids, list): channel_ids = [channel_ids]
-        
-        placeholders = ', '.join(['%s'] * len(channel_ids))
-        where_clauses.append(f"s.channel_id IN ({placeholders})")
-        filter_params.extend(channel_ids)
-
-    # Filtro 3: Filtro de String por Tipo de Entrega (Requer JOIN: delivery_addresses)
-    if 'delivery_type' in filters and filters['delivery_type']:
-        where_clauses.append("da.delivery_type = %s") 
-        filter_params.append(filters['delivery_type'])
-        sql_joins.add('delivery_addresses') # Garante que o JOIN seja adicionado
+    # Filtros 1 e 2: store_ids / channel_ids (um único parâmetro de array, qualquer que
+    # seja a quantidade de IDs: o texto da query não muda e o plano pode ser reaproveitado)
+    for filter_key, column in (('store_ids', 'store_id'), ('channel_ids', 'channel_id')):
+        if filter_key in filters:
+            where_clauses.append(f"s.{column} = ANY(%s::int[])")
+            where_keys.append(filter_key)
+
+    # Filtro 3: filtros sobre tabelas filhas (ex: delivery_type) viram semi-joins
+    for filter_key, clause in SEMI_JOIN_FILTERS.items():
+        if filter_key in filters:
+            where_clauses.append(clause)
+            where_keys.append(filter_key)
 
     sql_where = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
 
-    # 5. MONTAGEM FINAL
+    # 4. JOINS: diretos para tabelas N:1 (lojas, canais), subqueries pré-agregadas para as filhas
+    joins = []
+    children = {}  # alias da filha -> {"source", "joins", "dimension", "measures"}
+    for join_key in _ordered_joins(join_keys):
+        source = CHILD_SOURCES.get(join_key)
+        if source is None:
+            joins.append(JOIN_MAP[join_key])
+            continue
+        child = children.setdefault(source["alias"], {"source": source, "joins": [], "dimension": None, "measures": []})
+        child["joins"] += [j for j in source["joins"] if j not in child["joins"]]
+        if join_key == dim_data['join']:
+            child["dimension"] = group_by_col
+
+    # Requisição filtrada (ou amostrada) com filhas: cada filha é pré-agregada apenas para as
+    # vendas selecionadas, descritas uma única vez na CTE (o WHERE e seus parâmetros entram no
+    # texto duas vezes, CTE e query externa, e não uma vez por filha). NOT MATERIALIZED: o
+    # Postgres expande a CTE em cada semi-join e estima a seletividade dos filtros; materializada,
+    # a estimativa padrão do CTE Scan levava a planos piores.
+    filtered_cte, cte_param_keys = "", []
+    if children and (len(where_clauses) > 1 or sample_percent is not None):
+        filtered_cte = f"WITH filtered_sales AS NOT MATERIALIZED (SELECT s.id FROM {sales_table} {sql_where}) "
+        cte_param_keys = list(where_keys)
+
+    aggregates = []
+    for i, ((metric, agg_func), metric_col) in enumerate(zip(measures, metric_columns)):
+        metric_join = _metric_column(metric)[1]
+        if metric_join not in CHILD_SOURCES:
+            if agg_func not in SQL_AGGREGATES:
+                raise ValueError(f"Agregação {agg_func} não suportada para a métrica {metric}")
+            aggregates.append(SQL_AGGREGATES[agg_func].format(col=metric_col))
+            continue
+        if agg_func not in CHILD_AGGREGATES:
+            raise ValueError(f"Agregação {agg_func} não suportada para a métrica {metric}")
+        child_alias = CHILD_SOURCES[metric_join]["alias"]
+        per_sale, combine = CHILD_AGGREGATES[agg_func]
+        children[child_alias]["measures"] += [
+            f"{expr.format(col=metric_col)} AS m{i}{suffix}" for suffix, expr in per_sale.items()
+        ]
+        aggregates.append(combine.format(m=f"{child_alias}_agg.m{i}"))
+
+    for alias, child in children.items():
+        sub_alias = f"{alias}_agg"
+        keyed_by_date = partitioned and alias in PARTITIONED_CHILD_ALIASES
+        keys = [f"{alias}.sale_id"] + ([f"{alias}.sale_created_at"] if keyed_by_date else [])
+        if child["dimension"]:
+            keys.append(f"{child['dimension']} AS dimension")
+            group_by_col = f"{sub_alias}.dimension"
+
+        sub_where = []
+        if keyed_by_date and lower_bound:
+            sub_where.append(f"{alias}.sale_created_at >= {lower_bound}")
+        if filtered_cte:
+            sub_where.append(f"{alias}.sale_id IN (SELECT id FROM filtered_sales)")
+
+        subquery = (
+            f"SELECT {', '.join(keys + child['measures'])} "
+            f"FROM {child['source']['table']} {alias} {' '.join(child['joins'])} "
+            + (f"WHERE {' AND '.join(sub_where)} " if sub_where else "")
+            + f"GROUP BY {', '.join(str(n) for n in range(1, len(keys) + 1))}"
+        )
+        on_clause = f"{sub_alias}.sale_id = s.id"
+        if keyed_by_date:
+            on_clause += f" AND {sub_alias}.sale_created_at = s.created_at"
+        joins.append(f"JOIN ({subquery}) {sub_alias} ON {on_clause}")
+
+    joins_string = " ".join(joins)
+
+    # 5. CLÁUSULAS SELECT, FROM E AGRUPAMENTO
+    if ranked:
+        sql_select = f"{aggregates[0]} AS result, {group_by_col} AS dimension"
+    else:
+        sql_select = ", ".join(f"{agg} AS result_{i}" for i, agg in enumerate(aggregates)) + f", {group_by_col} AS dimension"
+    sql_from = f"FROM {sales_table}"
+    sql_group_by = f"GROUP BY {group_by_col}"
+    if sample_percent is not None:
+        # Bloco físico da venda (tabela/partição + página): unidade sorteada pelo TABLESAMPLE SYSTEM
+        block = "(s.ctid::text::point)[0]"
+        sql_select += f", s.tableoid AS sample_table, {block} AS sample_block"
+        sql_group_by += f", s.tableoid, {block}"
+
+    # 6. MONTAGEM FINAL
+    sql_order = "ORDER BY result DESC \n        LIMIT 100" if ranked else ""
     final_query = f"""
-        SELECT 
+        {filtered_cte}SELECT 
             {sql_select} 
         {sql_from} 
         {joins_string} 
         {sql_where} 
         {sql_group_by} 
+        {sql_order};
+    """
+    
+    return final_query, tuple(cte_param_keys + where_keys)
+
+# =======================================================================
+# 4. ROTEAMENTO PARA O ROLLUP
+# =======================================================================
+
+def build_rollup_query(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any]) -> Optional[Tuple[str, List]]:
+    """
+    Reescreve a requisição sobre `sales_hourly_rollup`, ou retorna None se ela não
+    for respondível pelo rollup (dimensão, métrica, agregação ou filtro não suportado).
+
+    O resultado é exato: o rollup cobre as horas completas do período até a marca
+    d'água do último refresh; a hora parcial do início do período e as vendas mais
+    novas que a marca d'água são lidas de `sales` e somadas via UNION ALL.
+    (A hora parcial usa o índice `idx_sales_date_status` criado pelo generate_data.py.)
+    """
+    agg = agg_func.strip().upper()
+    measure = ROLLUP_MEASURES.get(metric)
+    dimension = ROLLUP_DIMENSIONS.get(group_by)
+
+    if measure is None or dimension is None or agg not in ("SUM", "COUNT", "AVG"):
+        return None
+    if agg in ("SUM", "AVG") and measure["sum"] is None:
+        return None
+    if not set(filters) <= ROLLUP_FILTERS:
+        return None
+    if 'date_range' in filters and filters['date_range'] not in DATE_RANGES:
+        return None
+
+    final_query, param_keys = _compile_rollup_query(metric, agg, group_by, filter_shape(filters))
+    return final_query, [filters[key] for key in param_keys]
+
+
+@lru_cache(maxsize=256)
+def _compile_rollup_query(metric: str, agg: str, group_by: str, shape: Tuple) -> Tuple[str, Tuple[str, ...]]:
+    """ Compila a query sobre o rollup para uma forma de requisição já validada por `build_rollup_query`. """
+    filters = dict(shape)
+    measure = ROLLUP_MEASURES[metric]
+    dimension = ROLLUP_DIMENSIONS[group_by]
+
+    # Ramo 1: horas completas já agregadas no rollup
+    rollup_where, rollup_keys = [], []
+    # Ramos 2 e 3: vendas fora do rollup, lidas de `sales` (cada ramo usa seu próprio índice)
+    base_branches = []
+
+    watermark = f"(SELECT last_sale_id FROM rollup_refresh_state WHERE rollup_name = '{ROLLUP_TABLE}')"
+    if 'date_range' in filters:
+        lower_bound = f"NOW() - INTERVAL '{DATE_RANGES[filters['date_range']]}'"
+        first_full_hour = f"date_trunc('hour', {lower_bound}) + INTERVAL '1 hour'"
+        rollup_where.append(f"r.bucket >= {first_full_hour}")
+        # Hora parcial do início do período (DATE(...) aproveita idx_sales_date_status)
+        base_branches.append([
+            f"DATE(s.created_at) = DATE({lower_bound})",
+            f"s.created_at >= {lower_bound}",
+            f"s.created_at < {first_full_hour}",
+        ])
+        # Vendas posteriores ao último refresh do rollup (varredura pela PK)
+        base_branches.append([f"s.id > {watermark}", f"s.created_at >= {first_full_hour}"])
+    else:
+        base_branches.append([f"s.id > {watermark}"])
+
+    shared_where, shared_keys = ["s.sale_status_desc = 'COMPLETED'"], []
+    for filter_key, column in (('store_ids', 'store_id'), ('channel_ids', 'channel_id')):
+        if filter_key in filters:
+            rollup_where.append(f"r.{column} = ANY(%s::int[])")
+            rollup_keys.append(filter_key)
+            shared_where.append(f"s.{column} = ANY(%s::int[])")
+            shared_keys.append(filter_key)
+
+    base_dimension = DIMENSION_MAP[group_by]
+    base_join = JOIN_MAP[base_dimension['join']] if base_dimension['join'] else ""
+    rollup_sum = f"SUM(r.{measure['sum']})" if measure['sum'] else "NULL::numeric"
+    base_sum = f"SUM(s.{metric})" if measure['sum'] else "NULL::numeric"
+
+    outer_result = {
+        "SUM": "SUM(u.m_sum)",
+        "COUNT": "SUM(u.m_count)",
+        "AVG": "SUM(u.m_sum) / NULLIF(SUM(u.m_count), 0)",
+    }[agg]
+
+    branches = [f"""
+            SELECT {dimension['column']} AS dimension, {rollup_sum} AS m_sum, SUM(r.{measure['count']}) AS m_count
+            FROM {ROLLUP_TABLE} r 
+            {dimension['join'] or ""} 
+            {"WHERE " + " AND ".join(rollup_where) if rollup_where else ""} 
+            GROUP BY 1"""]
+    base_keys = []
+    for branch_where in base_branches:
+        branches.append(f"""
+            SELECT {base_dimension['column']} AS dimension, {base_sum} AS m_sum, COUNT(s.{metric}) AS m_count
+            FROM sales s 
+            {base_join} 
+            WHERE {" AND ".join(shared_where + branch_where)} 
+            GROUP BY 1""")
+        base_keys.extend(shared_keys)
+
+    union = "\n            UNION ALL".join(branches)
+    final_query = f"""
+        SELECT 
+            {outer_result} AS result, u.dimension AS dimension 
+        FROM ({union}
+        ) u 
+        GROUP BY u.dimension 
         ORDER BY result DESC 
         LIMIT 100;
     """
-    
-    # Retorna a query SQL pronta e os parâmetros de filtro (para execução segura)
-    return final_query, filter_params
\ No newline at end of file
+
+    return final_query, tuple(rollup_keys + base_keys)
+
+# =======================================================================
+# 5. MODO APROXIMADO (AMOSTRA DE BLOCOS)
+# =======================================================================
+
+# Colunas por bloco da amostra pedidas ao builder para cada agregação (result_0, result_1)
+APPROXIMATE_MEASURES = {
+    "SUM":   ("SUM",),
+    "COUNT": ("COUNT",),
+    "AVG":   ("SUM", "COUNT"),
+}
+
+
+def build_approximate_query(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any],
+                            partitioned: bool = False,
+                            sample_percent: float = APPROXIMATE_SAMPLE_PERCENT) -> Optional[Tuple[str, List]]:
+    """
+    Estimativa do pivot a partir de uma amostra de blocos de `sales`, ou None se a
+    requisição não deve ser aproximada (agregação sem estimador ou período curto).
+
+    Colunas: (result, dimension, ci_lower, ci_upper), top 100 por result. SUM e
+    COUNT são escalados por 100 / sample_percent; AVG é a razão das somas da
+    amostra. Como o TABLESAMPLE SYSTEM sorteia blocos inteiros, a variância é a
+    de uma amostra por conglomerados: calculada sobre os totais de cada bloco,
+    sem supor vendas independentes dentro da mesma página.
+    """
+    agg = agg_func.strip().upper()
+    filters = normalize_filters(filters)
+    if agg not in APPROXIMATE_MEASURES:
+        return None
+    if filters.get('date_range') in DATE_RANGES and filters['date_range'] not in SAMPLED_DATE_RANGES:
+        return None
+    if not 0 < sample_percent < 100:
+        raise ValueError(f"Percentual de amostragem inválido: {sample_percent}")
+
+    inner, params = build_multi_metric_query(
+        [(metric, measure) for measure in APPROXIMATE_MEASURES[agg]], group_by, filters,
+        partitioned=partitioned, sample_percent=sample_percent
+    )
+    return _compile_approximate_query(inner, agg, sample_percent), params
+
+
+@lru_cache(maxsize=256)
+def _compile_approximate_query(inner: str, agg: str, sample_percent: float) -> str:
+    """
+    Estimador e intervalo de confiança por grupo sobre os totais por bloco (y = result_0,
+    x = result_1). Com q = fração amostrada e w = 1 / q:
+
+        SUM/COUNT   w * Σy,   Var = (1 - q) * w² * Σy²
+        AVG         R = Σy / Σx,   Var = (1 - q) * Σ(y - R·x)² / (Σx)²
+    """
+    q = sample_percent / 100
+    w = 100 / sample_percent
+    fpc = 1 - q
+    z = CONFIDENCE_Z
+
+    totals = ["SUM(b.result_0) AS y", "SUM(b.result_0::float8 ^ 2) AS yy"]
+    if agg == "AVG":
+        totals += ["SUM(b.result_1) AS x", "SUM(b.result_1::float8 ^ 2) AS xx",
+                   "SUM(b.result_0::float8 * b.result_1) AS xy"]
+        ratio = "(g.y::float8 / NULLIF(g.x, 0))"
+        estimate = "g.y / NULLIF(g.x, 0)"
+        # Σ(y - R·x)² = Σy² - 2R·Σxy + R²·Σx² (GREATEST absorve o erro de arredondamento)
+        margin = (f"{z} * SQRT(GREATEST(0, {fpc} * (g.yy - 2 * {ratio} * g.xy + {ratio} ^ 2 * g.xx))) "
+                  f"/ NULLIF(g.x, 0)")
+    else:
+        estimate = f"g.y * {w}" if agg == "SUM" else f"ROUND(g.y * {w})::bigint"
+        margin = f"{z} * {w} * SQRT({fpc} * g.yy)"
+
+    final_query = f"""
+        SELECT a.result AS result, a.dimension AS dimension, 
+            a.result - a.margin AS ci_lower, a.result + a.margin AS ci_upper 
+        FROM (
+            SELECT {estimate} AS result, {margin} AS margin, g.dimension 
+            FROM (
+                SELECT b.dimension, {", ".join(totals)} 
+                FROM ({inner.strip().rstrip(';')}) b 
+                GROUP BY b.dimension
+            ) g
+        ) a 
+        ORDER BY a.result DESC 
+        LIMIT 100;
+    """
+    return final_query
+
+# =======================================================================
+# 6. ROTEAMENTO PARA OS SKETCHES
+# =======================================================================
+
+def sketch_table(agg_func: str) -> str:
+    """ Tabela de sketches que responde a agregação (COUNT_DISTINCT -> HLL, percentis -> histograma). """
+    return HLL_TABLE if agg_func.strip().upper() == "COUNT_DISTINCT" else HISTOGRAM_TABLE
+
+
+def build_sketch_query(metric: str, agg_func: str, group_by: str, filters: Dict[str, Any]) -> Optional[Tuple[str, List]]:
+    """
+    Responde COUNT_DISTINCT de customer_id e P50/P90/P99 dos tempos mesclando os
+    sketches loja x canal x dia, ou retorna None se a requisição não for respondível
+    por eles (métrica, dimensão ou filtro não suportado).
+
+    Como no rollup horário, o dia parcial do início do período e as vendas mais
+    novas que a marca d'água do sketch são lidos de `sales` e entram na mesma
+    mescla: o HLL toma o maior rho por registrador e o histograma soma as
+    contagens por bucket. O resultado é aproximado (ver SKETCH_RELATIVE_ERROR).
+    """
+    agg = agg_func.strip().upper()
+    if agg == "COUNT_DISTINCT":
+        if metric != "customer_id":
+            return None
+    elif agg not in PERCENTILE_AGGREGATES or metric not in HISTOGRAM_METRICS:
+        return None
+    if group_by not in SKETCH_DIMENSIONS:
+        return None
+    if not set(filters) <= ROLLUP_FILTERS:
+        return None
+    if 'date_range' in filters and filters['date_range'] not in DATE_RANGES:
+        return None
+
+    final_query, param_keys = _compile_sketch_query(metric, agg, group_by, filter_shape(filters))
+    return final_query, [filters[key] for key in param_keys]
+
+
+@lru_cache(maxsize=256)
+def _compile_sketch_query(metric: str, agg: str, group_by: str, shape: Tuple) -> Tuple[str, Tuple[str, ...]]:
+    """ Compila a mescla dos sketches para uma forma de requisição já validada por `build_sketch_query`. """
+    filters = dict(shape)
+    table = sketch_table(agg)
+    dimension = SKETCH_DIMENSIONS[group_by]
+
+    # Ramo 1: dias completos já no sketch
+    sketch_where, sketch_keys = [], []
+    # Ramos 2 e 3: vendas fora do sketch, lidas de `sales`
+    base_branches = []
+
+    watermark = f"(SELECT last_sale_id FROM rollup_refresh_state WHERE rollup_name = '{table}')"
+    if 'date_range' in filters:
+        lower_bound = f"NOW() - INTERVAL '{DATE_RANGES[filters['date_range']]}'"
+        first_full_day = f"DATE({lower_bound}) + 1"
+        sketch_where.append(f"r.day >= {first_full_day}")
+        # Dia parcial do início do período (aproveita idx_sales_date_status)
+        base_branches.append([f"DATE(s.created_at) = DATE({lower_bound})", f"s.created_at >= {lower_bound}"])
+        # Vendas posteriores ao último refresh do sketch (varredura pela PK)
+        base_branches.append([f"s.id > {watermark}", f"s.created_at >= {first_full_day}"])
+    else:
+        base_branches.append([f"s.id > {watermark}"])
+
+    shared_where, shared_keys = ["s.sale_status_desc = 'COMPLETED'"], []
+    for filter_key, column in (('store_ids', 'store_id'), ('channel_ids', 'channel_id')):
+        if filter_key in filters:
+            sketch_where.append(f"r.{column} = ANY(%s::int[])")
+            sketch_keys.append(filter_key)
+            shared_where.append(f"s.{column} = ANY(%s::int[])")
+            shared_keys.append(filter_key)
+
+    base_dimension = DIMENSION_MAP[group_by]
+    base_join = JOIN_MAP[base_dimension['join']] if base_dimension['join'] else ""
+
+    if table == HLL_TABLE:
+        # Mescla: maior rho por (dimensão, registrador)
+        sketch_select, sketch_group = "r.register AS k, MAX(r.rho) AS v", "GROUP BY 1, 2"
+        base_select = f"{HLL_REGISTER_SQL} AS k, MAX({HLL_RHO_SQL}) AS v"
+        base_from = f"sales s {HLL_HASH_JOIN}"
+        shared_where.append("s.customer_id IS NOT NULL")
+        merge = "MAX(u.v)"
+    else:
+        # Mescla: soma das contagens por (dimensão, bucket)
+        sketch_where.insert(0, f"r.metric = '{metric}'")
+        sketch_select, sketch_group = "r.bucket AS k, SUM(r.count) AS v", "GROUP BY 1, 2"
+        base_select = f"{HISTOGRAM_BUCKET_SQL.format(value=f's.{metric}')} AS k, COUNT(*) AS v"
+        base_from = "sales s"
+        shared_where.append(f"s.{metric} IS NOT NULL")
+        merge = "SUM(u.v)"
+
+    branches = [f"""
+            SELECT {dimension['column']} AS dimension, {sketch_select}
+            FROM {table} r 
+            {dimension['join'] or ""} 
+            {"WHERE " + " AND ".join(sketch_where) if sketch_where else ""} 
+            {sketch_group}"""]
+    base_keys = []
+    for branch_where in base_branches:
+        branches.append(f"""
+            SELECT {base_dimension['column']} AS dimension, {base_select}
+            FROM {base_from} 
+            {base_join} 
+            WHERE {" AND ".join(shared_where + branch_where)} 
+            GROUP BY 1, 2""")
+        base_keys.extend(shared_keys)
+
+    union = "\n            UNION ALL".join(branches)
+    merged = f"SELECT u.dimension, u.k, {merge} AS v FROM ({union}\n            ) u GROUP BY 1, 2"
+
+    if table == HLL_TABLE:
+        # Estimador do HyperLogLog com a correção de contagem linear para cardinalidades baixas
+        m = HLL_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = f"({alpha * m * m} / (h.harmonic + ({m} - h.filled)))"
+        final_query = f"""
+        SELECT 
+            ROUND(CASE WHEN {raw} <= {2.5 * m} AND h.filled < {m} 
+                       THEN {m} * LN({m}::float8 / ({m} - h.filled)) ELSE {raw} END)::bigint AS result, 
+            h.dimension AS dimension 
+        FROM (
+            SELECT r.dimension, SUM(POWER(2::float8, -r.v)) AS harmonic, COUNT(*) AS filled 
+            FROM ({merged}) r 
+            GROUP BY r.dimension
+        ) h 
+        ORDER BY result DESC 
+        LIMIT 100;
+    """
+    else:
+        # Primeiro bucket cuja contagem acumulada alcança o percentil; o valor é o ponto
+        # do bucket com erro relativo máximo (γ-1)/(γ+1)
+        gamma = HISTOGRAM_GAMMA
+        final_query = f"""
+        SELECT 
+            ROUND((2 * POWER({gamma}::float8, c.k + 1) / {gamma + 1})::numeric, 2) AS result, 
+            c.dimension AS dimension 
+        FROM (
+            SELECT DISTINCT ON (b.dimension) b.dimension, b.k 
+            FROM (
+                SELECT m.dimension, m.k, 
+                    SUM(m.v) OVER (PARTITION BY m.dimension ORDER BY m.k) AS running, 
+                    SUM(m.v) OVER (PARTITION BY m.dimension) AS total 
+                FROM ({merged}) m
+            ) b 
+            WHERE b.running >= {PERCENTILE_AGGREGATES[agg]} * b.total 
+            ORDER BY b.dimension, b.k
+        ) c 
+        ORDER BY result DESC 
+        LIMIT 100;
+    """
+
+    return final_query, tuple(sketch_keys + base_keys)
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Rollups (tabelas pré-agregadas) construídas a partir de `sales`.
+
+Cada rollup guarda uma marca d'água (o maior `sales.id` já agregado). O refresh
+incremental recalcula apenas os dias que receberam vendas novas desde a última
+execução; o refresh completo reconstrói a tabela inteira. Vendas recebidas por
+POST /api/v1/ingest/sales já entram nos rollups construídos na mesma transação
+da carga (seção 3).
+
+Uso:
+    python -m backend.rollups refresh            # incremental, todos os rollups
+    python -m backend.rollups refresh --full     # reconstrução completa
+    python -m backend.rollups refresh --rollup sales_daily_rollup
+"""
+
+import argparse
+import os
+import time
+
+from backend.database import get_db_connection, fetch_all, DB_ERRORS
+from backend.query_builder import (
+    HLL_HASH_JOIN, HLL_REGISTER_SQL, HLL_RHO_SQL, HISTOGRAM_BUCKET_SQL, HISTOGRAM_METRICS, SKETCH_TABLES,
+)
+
+# Roteamento automático de /analytics/pivot para o rollup horário (ver query_builder)
+ROLLUP_ROUTING_ENABLED = os.getenv('ROLLUP_ROUTING_ENABLED', 'true').lower() == 'true'
+ROLLUP_READY_CHECK_INTERVAL = 60  # s entre verificações de existência do rollup
+
+# =======================================================================
+# 1. DEFINIÇÕES
+# =======================================================================
+
+STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS rollup_refresh_state (
+        rollup_name VARCHAR(100) PRIMARY KEY,
+        last_sale_id INTEGER NOT NULL DEFAULT 0,
+        refreshed_at TIMESTAMP
+    )
+"""
+
+# Cada rollup declara: DDL, a expressão de "dia" sobre a própria tabela (para apagar
+# os dias tocados), um filtro fixo opcional, o SELECT agregado sobre `sales s`
+# (o {where} é preenchido pelo refresh) e, para a ingestão (ver seção 3), a chave
+# da tabela e como cada coluna agregada é mesclada a uma linha existente.
+ROLLUPS = {
+    # Loja x Canal x Dia (todas as vendas; concluídas e canceladas separadas)
+    "sales_daily_rollup": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS sales_daily_rollup (
+                day DATE NOT NULL,
+                store_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                orders_total INTEGER NOT NULL,
+                orders_completed INTEGER NOT NULL,
+                orders_cancelled INTEGER NOT NULL,
+                revenue DECIMAL(14,2) NOT NULL,
+                PRIMARY KEY (day, store_id, channel_id)
+            )
+        """,
+        "day_column": "day",
+        "key": ("day", "store_id", "channel_id"),
+        "merge": {"orders_total": "sum", "orders_completed": "sum", "orders_cancelled": "sum", "revenue": "sum"},
+        "select": """
+            SELECT
+                DATE(s.created_at) AS day,
+                s.store_id,
+                s.channel_id,
+                COUNT(*) AS orders_total,
+                COUNT(*) FILTER (WHERE s.sale_status_desc = 'COMPLETED') AS orders_completed,
+                COUNT(*) FILTER (WHERE s.sale_status_desc = 'CANCELLED') AS orders_cancelled,
+                COALESCE(SUM(s.total_amount) FILTER (WHERE s.sale_status_desc = 'COMPLETED'), 0) AS revenue
+            FROM sales s
+            {where}
+            GROUP BY DATE(s.created_at), s.store_id, s.channel_id
+        """,
+    },
+    # Loja x Canal x Hora (apenas vendas concluídas): base do roteamento automático
+    # de /analytics/pivot (query_builder.build_rollup_query)
+    "sales_hourly_rollup": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS sales_hourly_rollup (
+                bucket TIMESTAMP NOT NULL,
+                store_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                orders_completed INTEGER NOT NULL,
+                total_amount_sum DECIMAL(16,2) NOT NULL,
+                production_seconds_sum BIGINT NOT NULL,
+                production_seconds_count INTEGER NOT NULL,
+                delivery_seconds_sum BIGINT NOT NULL,
+                delivery_seconds_count INTEGER NOT NULL,
+                PRIMARY KEY (bucket, store_id, channel_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sales_hourly_rollup_day ON sales_hourly_rollup (DATE(bucket));
+        """,
+        "day_column": "DATE(bucket)",
+        "filter": "s.sale_status_desc = 'COMPLETED'",
+        "key": ("bucket", "store_id", "channel_id"),
+        "merge": {column: "sum" for column in (
+            "orders_completed", "total_amount_sum", "production_seconds_sum", "production_seconds_count",
+            "delivery_seconds_sum", "delivery_seconds_count",
+        )},
+        "select": """
+            SELECT
+                date_trunc('hour', s.created_at) AS bucket,
+                s.store_id,
+                s.channel_id,
+                COUNT(*) AS orders_completed,
+                SUM(s.total_amount) AS total_amount_sum,
+                COALESCE(SUM(s.production_seconds), 0) AS production_seconds_sum,
+                COUNT(s.production_seconds) AS production_seconds_count,
+                COALESCE(SUM(s.delivery_seconds), 0) AS delivery_seconds_sum,
+                COUNT(s.delivery_seconds) AS delivery_seconds_count
+            FROM sales s
+            {where}
+            GROUP BY date_trunc('hour', s.created_at), s.store_id, s.channel_id
+        """,
+    },
+    # Sketches mescláveis Loja x Canal x Dia (query_builder.build_sketch_query): qualquer
+    # período e subconjunto de lojas/canais é respondido mesclando as linhas dos dias.
+    # Registradores do HyperLogLog de customer_id (esparso: só os registradores preenchidos)
+    "customer_hll_rollup": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS customer_hll_rollup (
+                day DATE NOT NULL,
+                store_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                register SMALLINT NOT NULL,
+                rho SMALLINT NOT NULL,
+                PRIMARY KEY (day, store_id, channel_id, register)
+            )
+        """,
+        "day_column": "day",
+        "filter": "s.sale_status_desc = 'COMPLETED' AND s.customer_id IS NOT NULL",
+        "key": ("day", "store_id", "channel_id", "register"),
+        "merge": {"rho": "max"},
+        "select": f"""
+            SELECT
+                DATE(s.created_at) AS day,
+                s.store_id,
+                s.channel_id,
+                {HLL_REGISTER_SQL} AS register,
+                MAX({HLL_RHO_SQL}) AS rho
+            FROM sales s {HLL_HASH_JOIN}
+            {{where}}
+            GROUP BY 1, 2, 3, 4
+        """,
+    },
+    # Histograma logarítmico (contagem por bucket) de production_seconds e delivery_seconds
+    "latency_histogram_rollup": {
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS latency_histogram_rollup (
+                day DATE NOT NULL,
+                store_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                metric VARCHAR(32) NOT NULL,
+                bucket SMALLINT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (day, store_id, channel_id, metric, bucket)
+            )
+        """,
+        "day_column": "day",
+        "filter": "s.sale_status_desc = 'COMPLETED' AND v.value IS NOT NULL",
+        "key": ("day", "store_id", "channel_id", "metric", "bucket"),
+        "merge": {"count": "sum"},
+        "select": f"""
+            SELECT
+                DATE(s.created_at) AS day,
+                s.store_id,
+                s.channel_id,
+                v.metric,
+                {HISTOGRAM_BUCKET_SQL.format(value="v.value")} AS bucket,
+                COUNT(*) AS count
+            FROM sales s
+            CROSS JOIN LATERAL (VALUES {", ".join(f"('{m}', s.{m})" for m in HISTOGRAM_METRICS)}) v(metric, value)
+            {{where}}
+            GROUP BY 1, 2, 3, 4, 5
+        """,
+    },
+}
+
+# =======================================================================
+# 2. REFRESH
+# =======================================================================
+
+def insert_sql(name, *conditions):
+    """ INSERT do SELECT agregado do rollup restrito a `conditions` (mais o filtro fixo). """
+    definition = ROLLUPS[name]
+    conditions = list(conditions) + ([definition["filter"]] if definition.get("filter") else [])
+    return f"INSERT INTO {name} " + definition["select"].format(where="WHERE " + " AND ".join(conditions))
+
+
+def ensure_rollup_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute(STATE_DDL)
+    for definition in ROLLUPS.values():
+        cursor.execute(definition["ddl"])
+    conn.commit()
+
+
+def refresh_rollup(conn, name, full=False):
+    """
+    Atualiza um rollup em uma única transação e retorna um resumo da execução.
+
+    Observação: a marca d'água acompanha apenas vendas novas (id crescente);
+    alterações em vendas antigas exigem `full=True`.
+    """
+    definition = ROLLUPS[name]
+    table = name
+    cursor = conn.cursor()
+    start = time.time()
+
+    # Trava a linha de estado: dois refresh do mesmo rollup nunca rodam juntos
+    cursor.execute(
+        "INSERT INTO rollup_refresh_state (rollup_name) VALUES (%s) ON CONFLICT (rollup_name) DO NOTHING",
+        (name,)
+    )
+    cursor.execute("SELECT last_sale_id FROM rollup_refresh_state WHERE rollup_name = %s FOR UPDATE", (name,))
+    last_sale_id = 0 if full else cursor.fetchone()[0]
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sales")
+    new_sale_id = cursor.fetchone()[0]
+
+    if full:
+        days = None
+        cursor.execute(f"TRUNCATE {table}")
+        cursor.execute(insert_sql(name, "s.id <= %s"), (new_sale_id,))
+    else:
+        cursor.execute(
+            "SELECT DISTINCT DATE(created_at) FROM sales WHERE id > %s AND id <= %s",
+            (last_sale_id, new_sale_id)
+        )
+        days = [row[0] for row in cursor.fetchall()]
+        if days:
+            cursor.execute(f"DELETE FROM {table} WHERE {definition['day_column']} = ANY(%s)", (days,))
+            cursor.execute(insert_sql(name, "DATE(s.created_at) = ANY(%s)", "s.id <= %s"), (days, new_sale_id))
+
+    rows = cursor.rowcount if full or days else 0
+    cursor.execute(
+        "UPDATE rollup_refresh_state SET last_sale_id = %s, refreshed_at = NOW() WHERE rollup_name = %s",
+        (new_sale_id, name)
+    )
+    conn.commit()
+
+    return {
+        "rollup": name,
+        "mode": "full" if full else "incremental",
+        "days_refreshed": None if full else len(days),
+        "rows_written": rows,
+        "last_sale_id": new_sale_id,
+        "elapsed_ms": round((time.time() - start) * 1000, 2),
+    }
+
+
+def refresh_rollups(conn, names=None, full=False):
+    ensure_rollup_tables(conn)
+    return [refresh_rollup(conn, name, full) for name in (names or ROLLUPS)]
+
+
+_ready_checks = {}  # rollup -> (pronto?, verificado_em)
+
+
+async def is_rollup_ready(name):
+    """
+    Indica se o rollup já foi construído ao menos uma vez (e pode receber queries).
+    O resultado é reaproveitado por ROLLUP_READY_CHECK_INTERVAL segundos.
+    """
+    if not ROLLUP_ROUTING_ENABLED:
+        return False
+    ready, checked_at = _ready_checks.get(name, (False, 0.0))
+    now = time.monotonic()
+    if now - checked_at > ROLLUP_READY_CHECK_INTERVAL:
+        try:
+            _, rows = await fetch_all("SELECT 1 FROM rollup_refresh_state WHERE rollup_name = %s", (name,))
+            ready = bool(rows)
+        except DB_ERRORS:
+            ready = False
+        _ready_checks[name] = (ready, now)
+    return ready
+
+
+async def are_sketches_ready():
+    """ Os dois sketches (HLL e histograma) já foram construídos. """
+    for name in SKETCH_TABLES:
+        if not await is_rollup_ready(name):
+            return False
+    return True
+
+# =======================================================================
+# 3. MANUTENÇÃO PELA INGESTÃO (POST /ingest/sales)
+# =======================================================================
+
+# Trava as linhas de estado dos rollups do lote, sempre na mesma ordem (sem deadlock
+# entre lotes simultâneos); o refresh trava uma linha por vez e espera o lote terminar
+ROLLUP_LOCK_SQL = """
+    SELECT rollup_name FROM rollup_refresh_state
+    WHERE rollup_name = ANY(%s)
+    ORDER BY rollup_name
+    FOR UPDATE
+"""
+
+# Maior id de venda visível, lido uma única vez: limita os ids mesclados e é a nova marca d'água
+ROLLUP_BOUND_SQL = "bound AS MATERIALIZED (SELECT COALESCE(MAX(id), 0) AS max_sale_id FROM sales)"
+
+# A marca d'água passa a cobrir o lote e tudo o que foi mesclado junto com ele
+ROLLUP_ADVANCE_SQL = """
+    UPDATE rollup_refresh_state
+    SET last_sale_id = GREATEST(last_sale_id, (SELECT max_sale_id FROM bound)), refreshed_at = NOW()
+    WHERE rollup_name = ANY(%s)
+"""
+
+# Ids a incorporar: os do lote mais os visíveis entre a marca d'água do rollup e o limite
+DELTA_SALE_IDS_SQL = """%s::integer[] || ARRAY(
+    SELECT id FROM sales
+    WHERE id > (SELECT last_sale_id FROM rollup_refresh_state WHERE rollup_name = %s)
+      AND id <= (SELECT max_sale_id FROM bound)
+)"""
+
+
+def merge_sql(name):
+    """
+    INSERT ... ON CONFLICT que soma (ou, no HLL, combina pelo máximo) as linhas novas
+    às existentes. Usa o CTE `bound` (ver rollup_delta_statements).
+    """
+    definition = ROLLUPS[name]
+    assignments = [
+        f"{column} = GREATEST({name}.{column}, EXCLUDED.{column})" if how == "max"
+        else f"{column} = {name}.{column} + EXCLUDED.{column}"
+        for column, how in definition["merge"].items()
+    ]
+    # Um único `= ANY(array)` (lote + vendas acima da marca d'água): busca pelo índice
+    # da PK, enquanto um OR entre as duas condições levaria a um seq scan de `sales`
+    return (
+        insert_sql(name, f"s.id = ANY({DELTA_SALE_IDS_SQL})")
+        + f"ON CONFLICT ({', '.join(definition['key'])}) DO UPDATE SET {', '.join(assignments)}"
+    )
+
+
+def rollup_delta_statements(names, sale_ids):
+    """
+    Statements (SQL, parâmetros) que incorporam aos rollups `names` as vendas
+    `sale_ids` recém-carregadas, na mesma transação da carga.
+
+    Em vez de recalcular os dias tocados, só os grupos Loja x Canal x Dia/Hora do
+    lote são somados às linhas existentes. Vendas visíveis acima da marca d'água
+    (ex: carregadas pelo generate_data desde o último refresh) entram junto, e a
+    marca d'água avança: o roteamento do query_builder continua lendo "rollup +
+    vendas acima da marca d'água" sem contar nada duas vezes. Vendas de outras
+    cargas com id abaixo da marca d'água, ou alterações em vendas antigas, exigem
+    `refresh --full`, como no refresh incremental.
+
+    Depois da trava, as mesclas de todos os rollups e o avanço da marca d'água
+    formam um único statement (CTEs com INSERT/UPDATE): todos leem o mesmo
+    snapshot e o mesmo MAX(id). Em statements separados (READ COMMITTED), uma
+    venda confirmada por outra sessão entre a mescla e o avanço ficaria abaixo
+    da nova marca d'água sem ter sido mesclada.
+    """
+    names = sorted(names)
+    if not names:
+        return []
+    sale_ids = list(sale_ids)
+    ctes = [ROLLUP_BOUND_SQL] + [f"{name}_delta AS ({merge_sql(name)})" for name in names]
+    params = [value for name in names for value in (sale_ids, name)] + [names]
+    return [
+        (ROLLUP_LOCK_SQL, (names,)),
+        ("WITH " + ",\n".join(ctes) + ROLLUP_ADVANCE_SQL, tuple(params)),
+    ]
+
+
+async def built_rollups():
+    """ Rollups já construídos (com linha de estado), que a ingestão precisa manter. """
+    try:
+        _, rows = await fetch_all("SELECT rollup_name FROM rollup_refresh_state")
+    except DB_ERRORS:
+        return []
+    return [name for (name,) in rows if name in ROLLUPS]
+
+# =======================================================================
+# 4. CONSULTAS SOBRE OS ROLLUPS
+# =======================================================================
+
+# KPIs do mês corrente (até hoje) vs o mesmo intervalo do mês anterior.
+# Retorna até duas linhas: (is_current, receita, concluídos, cancelados, total).
+OVERVIEW_QUERY = """
+    WITH bounds AS MATERIALIZED (
+        SELECT
+            date_trunc('month', CURRENT_DATE)::date AS cur_start,
+            (date_trunc('month', CURRENT_DATE) - INTERVAL '1 month')::date AS prev_start,
+            LEAST(
+                (date_trunc('month', CURRENT_DATE) - INTERVAL '1 month')::date
+                    + (CURRENT_DATE - date_trunc('month', CURRENT_DATE)::date) + 1,
+                date_trunc('month', CURRENT_DATE)::date
+            ) AS prev_end
+    )
+    SELECT
+        r.day >= b.cur_start AS is_current,
+        SUM(r.revenue),
+        SUM(r.orders_completed),
+        SUM(r.orders_cancelled),
+        SUM(r.orders_total)
+    FROM bounds b
+    JOIN sales_daily_rollup r
+        ON r.day >= b.prev_start AND r.day <= CURRENT_DATE
+        AND (r.day >= b.cur_start OR r.day < b.prev_end)
+    GROUP BY 1
+"""
+
+
+def _period_kpis(revenue, completed, cancelled, total):
+    revenue = float(revenue)
+    return {
+        "revenue": revenue,
+        "orders": int(completed),
+        "ticket": revenue / completed if completed else 0.0,
+        "cancel_rate": cancelled * 100.0 / total if total else 0.0,
+    }
+
+
+def _pct_change(current, previous):
+    return round((current - previous) * 100.0 / previous, 2) if previous else 0.0
+
+
+def build_overview_kpis(rows):
+    """ Converte as linhas de OVERVIEW_QUERY no formato consumido pelo QuickMetrics. """
+    periods = {is_current: values for is_current, *values in rows}
+    cur = _period_kpis(*periods.get(True, (0, 0, 0, 0)))
+    prev = _period_kpis(*periods.get(False, (0, 0, 0, 0)))
+    return [
+        {"label": "Faturamento Mês Atual", "value": round(cur["revenue"], 2),
+         "trend": _pct_change(cur["revenue"], prev["revenue"]), "isCurrency": True},
+        {"label": "Ticket Médio", "value": round(cur["ticket"], 2),
+         "trend": _pct_change(cur["ticket"], prev["ticket"]), "isCurrency": True},
+        {"label": "Total de Pedidos", "value": cur["orders"],
+         "trend": _pct_change(cur["orders"], prev["orders"]), "isCurrency": False},
+        # Para a taxa de cancelamento a tendência é a diferença em pontos percentuais
+        {"label": "Taxa de Cancelamento", "value": round(cur["cancel_rate"], 2),
+         "trend": round(cur["cancel_rate"] - prev["cancel_rate"], 2), "isCurrency": False, "isPercent": True},
+    ]
+
+# =======================================================================
+# 5. CLI
+# =======================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh pre-aggregated rollup tables')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = subparsers.add_parser('refresh', help='Atualiza os rollups')
+    refresh_parser.add_argument('--full', action='store_true', help='Reconstrói os rollups do zero')
+    refresh_parser.add_argument('--rollup', action='append', choices=sorted(ROLLUPS),
+                                help='Rollup específico (pode repetir); padrão: todos')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        for result in refresh_rollups(conn, args.rollup, args.full):
+            print(f"✓ {result['rollup']}: {result['mode']}, {result['rows_written']:,} linhas, "
+                  f"{result['elapsed_ms']} ms (last_sale_id={result['last_sale_id']})")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
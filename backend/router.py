@@ -1,11 +1,38 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import time
-import psycopg2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from backend.query_builder import build_analytics_query
-from backend.database import get_db_connection
-from backend.models import PivotRequest 
+from backend.query_builder import (
+    plan_analytics_query, pivot_cache_key, ROLLUP_TABLE,
+    build_rollup_query, build_multi_metric_query, merge_key, normalize_filters,
+    build_paginated_query, encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, query_join_set,
+    SAMPLE_SOURCE, APPROXIMATE_SAMPLE_PERCENT, CONFIDENCE_LEVEL,
+    build_sketch_query, SKETCH_TABLES, SKETCH_RELATIVE_ERROR,
+)
+from backend.admission import admission, AdmissionRejectedError
+from backend.metadata import metadata_cache, etag_matches, METADATA_MAX_AGE
+from backend.slow_queries import slow_query_log, query_fingerprint, SLOW_QUERY_ADMIN_ENABLED
+from backend.telemetry import (
+    start_request, phase, record_since, observe_request, server_timing, SERVER_TIMING_ENABLED,
+)
+from backend.cache import pivot_cache, pivot_flights, PIVOT_CACHE_ENABLED
+from backend.rollups import OVERVIEW_QUERY, build_overview_kpis, is_rollup_ready, are_sketches_ready
+from backend.partitioning import is_sales_partitioned
+from backend.database import (
+    fetch_all, stream_rows, pool_stats, prepared_stats, PoolTimeoutError, QueryTimeoutError, DB_ERRORS,
+)
+from backend.models import PivotRequest, PivotBatchRequest
+from backend.ingest import (
+    read_batch_body, parse_batch, ingest_sales, ingest_stats, IngestValidationError, IngestBatchTooLargeError,
+)
+from backend.serialization import (
+    negotiate, encode, export_encoder, NotAcceptableError,
+    ROWS_JSON, COLUMNAR_JSON, ARROW_STREAM, EXPORT_MEDIA_TYPES,
+)
 from backend.models import AnalyticsResponse # Assumindo que este modelo está definido
 
 router = APIRouter()
@@ -15,99 +42,555 @@ router = APIRouter()
 # =======================================================================
 
 @router.get("/status")
-def get_status():
-    """ Verifica a conexão com o DB e a contagem de dados. """
-    conn = None
+async def get_status():
+    """ Verifica a conexão com o DB, a contagem de dados e o estado do pool de conexões. """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM sales;")
-        sales_count = cursor.fetchone()[0]
-        cursor.close()
+        _, rows = await fetch_all("SELECT COUNT(*) FROM sales;")
+        sales_count = rows[0][0]
         return {
             "status": "ok",
             "message": "Conexão com DB bem-sucedida e dados carregados.",
-            "total_sales": int(sales_count)
+            "total_sales": int(sales_count),
+            "pool": pool_stats(),
+            "prepared_statements": prepared_stats(),
+            "admission": admission.stats(),
+            "cache": pivot_cache.stats(),
+            "single_flight": pivot_flights.stats(),
+            "metadata": metadata_cache.stats(),
+            "slow_queries": slow_query_log.stats(),
+            "ingest": ingest_stats()
         }
-    except psycopg2.Error as e:
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"DB Pool Exhausted: {e}")
+    except DB_ERRORS as e:
         raise HTTPException(status_code=503, detail=f"DB Connection Failed: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 
 # =======================================================================
 # 2. ROTAS ANALÍTICAS (MOTOR DE QUERIES)
 # =======================================================================
 
+# Formatos de resposta do pivot (header Accept); sem Accept: JSON com um objeto por linha
+PIVOT_MEDIA_TYPES = {ROWS_JSON, COLUMNAR_JSON, ARROW_STREAM}
+
+
+def _overloaded(e: AdmissionRejectedError):
+    """ 429 com Retry-After: a classe de custo da query está saturada. """
+    return HTTPException(status_code=429, detail=f"Overloaded: {e}", headers={"Retry-After": str(e.retry_after)})
+
+
+def _rows_as_dicts(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _precision_meta(source):
+    """
+    Campos de precisão da resposta: resultados da amostra informam o percentual e a
+    confiança; os dos sketches, o erro relativo esperado.
+    """
+    if source in SKETCH_TABLES:
+        return {"precision": "approximate", "relative_error": SKETCH_RELATIVE_ERROR[source]}
+    if source != SAMPLE_SOURCE:
+        return {"precision": "exact"}
+    return {"precision": "approximate", "sample_percent": APPROXIMATE_SAMPLE_PERCENT,
+            "confidence_level": CONFIDENCE_LEVEL}
+
+
+def _json_response(content):
+    """ JSON codificado como o FastAPI faria com o dict, mas dentro da fase 'serialize'. """
+    with phase("serialize"):
+        return JSONResponse(jsonable_encoder(content))
+
+
+def _pivot_response(media_type, columns, rows, meta):
+    """
+    Resposta do pivot no formato negociado: o JSON padrão (um objeto por linha)
+    ou um formato colunar, com o tempo de serialização no header X-Serialization-Time-Ms.
+    """
+    if media_type == ROWS_JSON:
+        start = time.perf_counter()
+        response = _json_response({"data": _rows_as_dicts(columns, rows), **meta})
+        serialization_ms = (time.perf_counter() - start) * 1000
+    else:
+        with phase("serialize"):
+            body, serialization_ms = encode(media_type, columns, rows, meta)
+        response = Response(body, media_type=media_type)
+    response.headers["X-Serialization-Time-Ms"] = f"{serialization_ms:.3f}"
+    return response
+
+
+def _observed(response, timings, route, request_body, cache):
+    """ Registra as fases da requisição nos histogramas de /metrics e, se ativo, no header Server-Timing. """
+    observe_request(timings, route, request_body.group_by, request_body.agg_func,
+                    query_join_set(request_body.metric, request_body.group_by, request_body.filters), cache)
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+
 @router.post("/analytics/pivot")
-def get_pivot_data(request_body: PivotRequest): 
+async def get_pivot_data(request_body: PivotRequest, request: Request): 
     """ Rota principal que recebe o Payload da UI e executa a query dinâmica. """
-    conn = None
     try:
         start_time = time.time()
-        
-        query, params = build_analytics_query(
-            request_body.metric, request_body.agg_func, request_body.group_by, request_body.filters
-        )
+        timings = start_request()
+        media_type = negotiate(request.headers.get("accept"), PIVOT_MEDIA_TYPES, ROWS_JSON)
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, tuple(params)) 
+        # Paginação por keyset: sem o corte fixo de 100 linhas (não passa pelo cache nem pelo rollup)
+        if request_body.limit is not None or request_body.cursor is not None:
+            response = await _get_pivot_page(request_body, start_time, media_type)
+            return _observed(response, timings, "pivot_page", request_body, "bypass")
+
+        # Payloads equivalentes (mesma métrica/agregação/dimensão/filtros/precisão) são servidos do cache
+        cache_key = pivot_cache_key(
+            request_body.metric, request_body.agg_func, request_body.group_by, request_body.filters,
+            request_body.precision
+        )
+        if PIVOT_CACHE_ENABLED:
+            cached = pivot_cache.get(cache_key)
+            if cached is not None:
+                cached_columns, cached_rows, cached_source = cached
+                response = _pivot_response(media_type, cached_columns, cached_rows, {
+                    "execution_time_ms": (time.time() - start_time) * 1000,
+                    "status": "success",
+                    "cache": "hit",
+                    "source": cached_source,
+                    **_precision_meta(cached_source)
+                })
+                return _observed(response, timings, "pivot", request_body, "hit")
         
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
+        # Requisições idênticas em voo ao mesmo tempo (ex: HomeTab e StoreRankingTab abrindo
+        # juntas) compartilham uma única execução no banco
+        use_rollups, partitioned = await is_rollup_ready(ROLLUP_TABLE), await is_sales_partitioned()
+        use_sketches = await are_sketches_ready()
+        (columns, results, source, query_class), coalesced = await pivot_flights.run(
+            cache_key, lambda: _execute_pivot(request_body, use_rollups, partitioned, use_sketches)
+        )
 
-        data = [dict(zip(columns, row)) for row in results]
+        if PIVOT_CACHE_ENABLED and not coalesced:
+            pivot_cache.set(cache_key, (columns, results, source))
         end_time = time.time()
 
-        return {
-            "data": data,
+        response = _pivot_response(media_type, columns, results, {
             "execution_time_ms": (end_time - start_time) * 1000,
-            "status": "success"
-        }
+            "status": "success",
+            "cache": "miss",
+            "source": source,
+            **_precision_meta(source),
+            "query_class": query_class,
+            "coalesced": coalesced
+        })
+        return _observed(response, timings, "pivot", request_body, "coalesced" if coalesced else "miss")
+    except NotAcceptableError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except AdmissionRejectedError as e:
+        raise _overloaded(e)
+    except QueryTimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"Query Timeout: {e}")
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"DB Pool Exhausted: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Erro na execução da Query: {e}") 
         raise HTTPException(status_code=500, detail=f"Internal Error: {e}")
-    finally:
-        if conn:
-            conn.close()
 
-@router.get("/metadata/filters")
-def get_filter_metadata():
-    """ Rota para Metadados: Busca a lista completa de lojas e canais para os filtros. """
-    conn = None
+
+async def _get_pivot_page(request_body: PivotRequest, start_time: float, media_type: str):
+    """ Uma página do pivot: `limit` linhas após o cursor, mais o token da página seguinte. """
+    if request_body.precision == "approximate":
+        raise ValueError("precision 'approximate' não é suportada com paginação (limit/cursor)")
+    cache_key = pivot_cache_key(
+        request_body.metric, request_body.agg_func, request_body.group_by, request_body.filters
+    )
+    limit = request_body.limit or DEFAULT_PAGE_SIZE
+    after = decode_cursor(request_body.cursor, cache_key) if request_body.cursor else None
+
+    # Uma linha a mais indica se existe próxima página
+    partitioned = await is_sales_partitioned()
+    with phase("build"):
+        query, params = build_paginated_query(
+            request_body.metric, request_body.agg_func, request_body.group_by, request_body.filters,
+            limit=limit + 1, after=after, partitioned=partitioned
+        )
+    (columns, results, query_class), coalesced = await pivot_flights.run(
+        ("page", cache_key, limit, request_body.cursor),
+        lambda: admission.fetch_all(
+            query, tuple(params), query_join_set(request_body.metric, request_body.group_by, request_body.filters)
+        )
+    )
+
+    has_more = len(results) > limit
+    results = results[:limit]
+    return _pivot_response(media_type, columns, results, {
+        "execution_time_ms": (time.time() - start_time) * 1000,
+        "status": "success",
+        "cache": "bypass",
+        "source": "sales",
+        "query_class": query_class,
+        "coalesced": coalesced,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(cache_key, results[-1]) if has_more else None,
+    })
+
+
+@router.post("/analytics/pivot/stream")
+async def stream_pivot_data(request_body: PivotRequest, request: Request,
+                             format: Optional[str] = Query(None, pattern="^(ndjson|csv|arrow)$")):
+    """
+    Resultado completo do pivot (sem o corte de 100 linhas), transmitido em blocos
+    NDJSON, CSV ou Arrow IPC à medida que as linhas saem do cursor nomeado no
+    Postgres. Sem `format` o formato vem do header Accept (padrão: NDJSON). Aceita
+    o `cursor` da paginação para continuar a partir de uma página já entregue.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Busca lojas (ID e Nome)
-        cursor.execute("SELECT id, name FROM stores WHERE is_active = TRUE ORDER BY name")
-        stores = [{"id": row[0], "name": row[1]} for row in cursor.fetchall()]
+        timings = start_request()
+        if request_body.precision == "approximate":
+            raise ValueError("precision 'approximate' não é suportada no stream")
+        if format is None:
+            media_type = negotiate(request.headers.get("accept"), set(EXPORT_MEDIA_TYPES.values()),
+                                   EXPORT_MEDIA_TYPES["ndjson"])
+            format = next(name for name, value in EXPORT_MEDIA_TYPES.items() if value == media_type)
+        cache_key = pivot_cache_key(
+            request_body.metric, request_body.agg_func, request_body.group_by, request_body.filters
+        )
+        after = decode_cursor(request_body.cursor, cache_key) if request_body.cursor else None
+        partitioned = await is_sales_partitioned()
+        with phase("build"):
+            query, params = build_paginated_query(
+                request_body.metric, request_body.agg_func, request_body.group_by, request_body.filters,
+                limit=request_body.limit, after=after, partitioned=partitioned
+            )
+        # A vaga da classe de custo fica ocupada enquanto o cursor estiver aberto
+        query_class = None
+        if admission.enabled:
+            acquire_start = time.perf_counter()
+            join_set = query_join_set(request_body.metric, request_body.group_by, request_body.filters)
+            query_class, _ = await admission.classify(query, tuple(params), join_set)
+            await query_class.acquire()
+            record_since("acquire", acquire_start)
+        try:
+            timeout_ms = query_class.statement_timeout_ms if query_class else None
+            chunks = stream_rows(query, tuple(params), timeout_ms=timeout_ms)
+            # O primeiro bloco é lido antes de responder: erros de SQL/pool ainda viram HTTP 4xx/5xx
+            columns, first_rows = await chunks.__anext__()
+            with phase("serialize"):
+                encoder = export_encoder(format, columns)
+        except BaseException as e:
+            if query_class:
+                if isinstance(e, QueryTimeoutError):
+                    query_class.record_statement_timeout()
+                query_class.release()
+            raise
+    except NotAcceptableError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except AdmissionRejectedError as e:
+        raise _overloaded(e)
+    except QueryTimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"Query Timeout: {e}")
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"DB Pool Exhausted: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Erro na execução da Query (stream): {e}")
+        raise HTTPException(status_code=500, detail=f"Internal Error: {e}")
 
-        # Busca canais (ID e Nome)
-        cursor.execute("SELECT id, name FROM channels ORDER BY name")
-        channels = [{"id": row[0], "name": row[1]} for row in cursor.fetchall()]
+    async def body():
+        try:
+            with phase("serialize"):
+                data = encoder.write(first_rows)
+            yield data
+            async for _, rows in chunks:
+                with phase("serialize"):
+                    data = encoder.write(rows)
+                yield data
+            with phase("serialize"):
+                data = encoder.close()
+            yield data
+            # Fases acumuladas durante todo o stream (a resposta já começou: sem Server-Timing)
+            observe_request(timings, "pivot_stream", request_body.group_by, request_body.agg_func,
+                            query_join_set(request_body.metric, request_body.group_by, request_body.filters),
+                            "bypass")
+        finally:
+            await chunks.aclose()
+            if query_class:
+                query_class.release()
 
-        return {"stores": stores, "channels": channels}
-        
+    return StreamingResponse(body(), media_type=EXPORT_MEDIA_TYPES[format])
+
+
+async def _execute_pivot(item: PivotRequest, use_rollups: bool, partitioned: bool, use_sketches: bool = False):
+    """
+    Executa uma requisição de pivot isolada e retorna (colunas, linhas, source,
+    classe de admissão). Requisições compatíveis com o rollup horário são
+    reescritas sobre ele, COUNT_DISTINCT e percentis sobre os sketches diários, e
+    as aproximadas lidas da amostra de `sales`; pivots pesados só ocupam as vagas
+    da sua classe de custo.
+    """
+    with phase("build"):
+        query, params, source = plan_analytics_query(
+            item.metric, item.agg_func, item.group_by, item.filters, use_rollups=use_rollups, partitioned=partitioned,
+            precision=item.precision, use_sketches=use_sketches
+        )
+    # Apenas queries sobre as tabelas base entram no log de queries lentas
+    fingerprint = query_fingerprint(item.metric, item.group_by, item.filters) if source == "sales" else None
+    columns, results, query_class = await admission.fetch_all(
+        query, tuple(params), query_join_set(item.metric, item.group_by, item.filters), source=source,
+        fingerprint=fingerprint
+    )
+    return columns, results, source, query_class
+
+
+async def _execute_merged_pivot(items: List[PivotRequest], partitioned: bool):
+    """
+    Executa várias métricas com a mesma dimensão/filtros/JOINs em um único SELECT
+    e devolve, para cada uma, o top 100 no mesmo formato (e ordem) da rota individual.
+    """
+    first = items[0]
+    with phase("build"):
+        query, params = build_multi_metric_query(
+            [(item.metric, item.agg_func) for item in items], first.group_by, first.filters, partitioned=partitioned
+        )
+    # Mesma chave de fusão = mesmos JOINs: o conjunto da primeira métrica vale para todas
+    _, results, _ = await admission.fetch_all(
+        query, tuple(params), query_join_set(first.metric, first.group_by, first.filters),
+        fingerprint=query_fingerprint(first.metric, first.group_by, first.filters)
+    )
+
+    per_item = []
+    for i in range(len(items)):
+        # Mesma ordenação do Postgres em "ORDER BY result DESC": NULLs primeiro
+        ranked = sorted(results, key=lambda row: (row[i] is None, row[i] if row[i] is not None else 0), reverse=True)
+        per_item.append([(row[i], row[-1]) for row in ranked[:100]])
+    return per_item
+
+
+def _batch_error(error: Exception, statement_index: int):
+    """ Resultado de erro de uma entrada do lote, com o mesmo status/detail que a rota individual daria. """
+    if isinstance(error, AdmissionRejectedError):
+        status_code, detail = 429, f"Overloaded: {error}"
+    elif isinstance(error, QueryTimeoutError):
+        status_code, detail = 504, f"Query Timeout: {error}"
+    elif isinstance(error, PoolTimeoutError):
+        status_code, detail = 503, f"DB Pool Exhausted: {error}"
+    elif isinstance(error, ValueError):
+        status_code, detail = 400, str(error)
+    else:
+        print(f"Erro na execução da Query (batch): {error}")
+        status_code, detail = 500, f"Internal Error: {error}"
+    return {"data": [], "execution_time_ms": 0.0, "status": "error", "status_code": status_code,
+            "detail": detail, "statement": statement_index}
+
+
+@router.post("/analytics/pivot/batch")
+async def get_pivot_batch(batch: PivotBatchRequest):
+    """
+    Responde várias requisições de pivot em uma única chamada.
+
+    Requisições que compartilham dimensão, filtros e JOINs (ex: os rankings de loja
+    do StoreRankingTab) são fundidas em um SELECT com várias colunas agregadas; as
+    demais (e as atendidas pelo rollup, pelos sketches ou pela amostra) rodam em
+    paralelo. Resultados em cache não tocam o banco.
+    """
+    start_time = time.time()
+    timings = start_request()
+    items = batch.requests
+    results: List[Dict[str, Any]] = [None] * len(items)
+    use_rollups = await is_rollup_ready(ROLLUP_TABLE)
+    use_sketches = await are_sketches_ready()
+    partitioned = await is_sales_partitioned()
+
+    cache_keys: List[Any] = [None] * len(items)
+    singles, groups = [], {}
+    for index, item in enumerate(items):
+        try:
+            filters = normalize_filters(item.filters)
+            cache_keys[index] = pivot_cache_key(item.metric, item.agg_func, item.group_by, filters, item.precision)
+        except ValueError as e:
+            # Filtros inválidos reprovam só esta entrada (o 400 da rota individual)
+            results[index] = _batch_error(e, None)
+            continue
+        cached = pivot_cache.get(cache_keys[index]) if PIVOT_CACHE_ENABLED else None
+        if cached is not None:
+            columns, rows, source = cached
+            results[index] = {"data": _rows_as_dicts(columns, rows), "execution_time_ms": 0.0, "status": "success",
+                              "cache": "hit", "source": source, **_precision_meta(source), "statement": None}
+        elif use_rollups and build_rollup_query(item.metric, item.agg_func, item.group_by, filters) is not None:
+            singles.append([index])
+        elif use_sketches and build_sketch_query(item.metric, item.agg_func, item.group_by, filters) is not None:
+            singles.append([index])
+        elif item.precision == "approximate":
+            # Estimativas (result + intervalo de confiança) não entram no SELECT fundido
+            singles.append([index])
+        else:
+            groups.setdefault(merge_key(item.metric, item.group_by, item.filters), []).append(index)
+
+    statements = singles + [indices for indices in groups.values()]
+
+    async def run_single(index):
+        item = items[index]
+        (columns, rows, source, _), _ = await pivot_flights.run(
+            cache_keys[index], lambda: _execute_pivot(item, use_rollups, partitioned, use_sketches)
+        )
+        return columns, rows, source
+
+    async def run_statement(indices):
+        statement_start = time.time()
+        merged = len(indices)
+        if merged == 1:
+            outputs = [await run_single(indices[0])]
+        else:
+            try:
+                outputs = [(["result", "dimension"], rows, "sales")
+                           for rows in await _execute_merged_pivot([items[i] for i in indices], partitioned)]
+            except ValueError:
+                # Uma entrada inválida (ex: agregação não suportada) não derruba as demais do
+                # SELECT fundido: cada uma roda sozinha e o erro fica só com a entrada que o causou
+                outputs = await asyncio.gather(*(run_single(index) for index in indices), return_exceptions=True)
+                merged = 1
+        return outputs, (time.time() - statement_start) * 1000, merged
+
+    outcomes = await asyncio.gather(*(run_statement(indices) for indices in statements), return_exceptions=True)
+
+    for statement_index, (indices, outcome) in enumerate(zip(statements, outcomes)):
+        if isinstance(outcome, Exception):
+            for index in indices:
+                results[index] = _batch_error(outcome, statement_index)
+            continue
+        outputs, elapsed_ms, merged = outcome
+        for index, output in zip(indices, outputs):
+            if isinstance(output, Exception):
+                results[index] = _batch_error(output, statement_index)
+                continue
+            columns, rows, source = output
+            if PIVOT_CACHE_ENABLED:
+                pivot_cache.set(cache_keys[index], (columns, rows, source))
+            results[index] = {"data": _rows_as_dicts(columns, rows), "execution_time_ms": elapsed_ms, "status": "success",
+                              "cache": "miss", "source": source, **_precision_meta(source),
+                              "statement": statement_index,
+                              "merged": merged}
+
+    response = _json_response({
+        "results": results,
+        "statements": len(statements),
+        "execution_time_ms": (time.time() - start_time) * 1000,
+        "status": "success" if all(r["status"] == "success" for r in results) else "partial"
+    })
+    # Lote com dimensões/agregações variadas: fases somadas entre as statements paralelas
+    observe_request(timings, "pivot_batch", "*", "*", ("*",), "mixed")
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+@router.get("/metadata/filters")
+async def get_filter_metadata(request: Request):
+    """
+    Rota para Metadados: lojas, canais, sub-marcas, formas de pagamento, categorias
+    e cidades para os filtros, servidos da memória (ver backend/metadata.py). Com
+    If-None-Match igual ao ETag atual a resposta é 304, sem corpo.
+    """
+    try:
+        entry = await metadata_cache.get()
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"DB Pool Exhausted: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load metadata: {e}")
-    finally:
-        if conn:
-            conn.close()
+
+    headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={METADATA_MAX_AGE}, must-revalidate"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        metadata_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+@router.post("/metadata/invalidate")
+async def invalidate_filter_metadata():
+    """ Descarta os metadados em cache (ex: após cadastrar lojas ou canais); a próxima leitura recarrega. """
+    metadata_cache.invalidate()
+    return {"status": "success", "metadata": metadata_cache.stats()}
  
 
 @router.get("/metrics/overview")
-def get_quick_kpis():
-    """ 🌟 Rota para QuickMetrics: Simula a consulta à Materialized View (MV) para KPIs instantâneos. 🌟 """
-    # Este endpoint é chamado uma vez pelo Dashboard para o Overview
-    
-    kpis_data = [
-        { "label": "Faturamento Mês Atual", "value": 60598191.78, "trend": -4.19, "isCurrency": True },
-        { "label": "Ticket Médio", "value": 355.47, "trend": 0.10, "isCurrency": True },
-        { "label": "Total de Pedidos", "value": 179624, "trend": -4.23, "isCurrency": False },
-        { "label": "Taxa de Cancelamento", "value": 4.8, "trend": 0.4, "isCurrency": False, "isPercent": True },
-    ]
-    
-    return kpis_data
\ No newline at end of file
+async def get_quick_kpis():
+    """ 🌟 Rota para QuickMetrics: KPIs do mês corrente vs mês anterior, lidos do rollup diário (sales_daily_rollup). 🌟 """
+    # Este endpoint é chamado uma vez pelo Dashboard para o Overview.
+    # O rollup é mantido por `python -m backend.rollups refresh` (incremental).
+    try:
+        _, rows = await fetch_all(OVERVIEW_QUERY)
+        return build_overview_kpis(rows)
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"DB Pool Exhausted: {e}")
+    except DB_ERRORS as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Rollups indisponíveis (execute 'python -m backend.rollups refresh'): {e}"
+        )
+
+
+# =======================================================================
+# 3. ROTAS ADMINISTRATIVAS
+# =======================================================================
+
+SLOW_QUERY_SORT_KEYS = ("p50_ms", "p95_ms", "p99_ms", "max_ms", "mean_ms", "count", "slow_count")
+
+
+def require_slow_query_admin():
+    """ As rotas de queries lentas expõem SQL e planos: só existem com SLOW_QUERY_ADMIN_ENABLED=true. """
+    if not SLOW_QUERY_ADMIN_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/admin/slow-queries", dependencies=[Depends(require_slow_query_admin)])
+async def get_slow_queries(limit: int = Query(20, ge=1, le=200),
+                           sort: str = Query("p95_ms", pattern=f"^({'|'.join(SLOW_QUERY_SORT_KEYS)})$"),
+                           plans: bool = Query(False, description="Inclui os planos capturados (EXPLAIN; ANALYZE se SLOW_QUERY_CAPTURE_ANALYZE=true).")):
+    """ Fingerprints de query mais caros (percentis de duração por forma de requisição). """
+    return {"log": slow_query_log.stats(), "fingerprints": slow_query_log.top(limit, sort, include_plans=plans)}
+
+
+@router.get("/admin/slow-queries/{fingerprint_id}", dependencies=[Depends(require_slow_query_admin)])
+async def get_slow_query(fingerprint_id: str):
+    """ Estatísticas e planos capturados de um fingerprint. """
+    summary = slow_query_log.get(fingerprint_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Fingerprint não encontrado: {fingerprint_id}")
+    return summary
+
+
+@router.delete("/admin/slow-queries", dependencies=[Depends(require_slow_query_admin)])
+async def reset_slow_queries():
+    """ Zera as estatísticas por fingerprint (ex: após aplicar um índice novo). """
+    slow_query_log.reset()
+    return {"status": "success", "log": slow_query_log.stats()}
+
+
+# =======================================================================
+# 4. INGESTÃO
+# =======================================================================
+
+@router.post("/ingest/sales")
+async def post_ingest_sales(request: Request):
+    """
+    Carga em lote de vendas (NDJSON: uma venda por linha, ver models.IngestSale).
+    O lote entra inteiro em uma única transação (COPY) junto com a atualização dos
+    rollups, ou é rejeitado inteiro (ver backend/ingest.py).
+    """
+    try:
+        # Validação fora do event loop: lotes grandes levam centenas de ms de CPU
+        sales = await run_in_threadpool(parse_batch, await read_batch_body(request))
+        result = await ingest_sales(sales)
+        return {"status": "success", **result}
+    except IngestBatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestValidationError as e:
+        raise HTTPException(status_code=422, detail={"message": str(e), "errors": e.errors})
+    except AdmissionRejectedError as e:
+        raise _overloaded(e)
+    except QueryTimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"Query Timeout: {e}")
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"DB Pool Exhausted: {e}")
+    except Exception as e:
+        print(f"Erro na ingestão: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal Error: {e}")
@@ -0,0 +1,234 @@
+"""
+Codificação das respostas analíticas.
+
+O formato padrão (JSON com um objeto por linha) continua sendo o das rotas. Clientes
+podem pedir, pelo header `Accept`, formatos colunares mais compactos:
+
+    application/vnd.analytics.columnar+json   colunas como arrays (orjson)
+    application/vnd.apache.arrow.stream       Apache Arrow IPC (stream)
+
+Valores Decimal viram float nos formatos colunares, como já acontece no JSON padrão.
+"""
+
+import csv
+import io
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    # Serializador JSON rápido (opcional): sem ele o JSON colunar usa o módulo json
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Apache Arrow (opcional): necessário apenas para o formato Arrow IPC
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+ROWS_JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.analytics.columnar+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# Formatos de /analytics/pivot/stream (parâmetro `format` ou header Accept)
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv", "arrow": ARROW_STREAM}
+
+
+class NotAcceptableError(Exception):
+    """ O formato pedido no Accept não está disponível (ex: pyarrow não instalado). """
+
+
+# =======================================================================
+# 1. NEGOCIAÇÃO (HEADER ACCEPT)
+# =======================================================================
+
+def _parse_accept(accept):
+    """ Lista (media type, q) do header Accept, na ordem de preferência do cliente. """
+    entries = []
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *parameters = [item.strip() for item in part.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        entries.append((media_type.lower(), q, position))
+    entries.sort(key=lambda entry: (-entry[1], entry[2]))
+    return [(media_type, q) for media_type, q, _ in entries if q > 0]
+
+
+def negotiate(accept, offered, default):
+    """
+    Escolhe, entre os media types `offered`, o preferido pelo cliente. Curingas
+    (*/*, application/*) e a ausência do header resultam em `default`.
+    """
+    for media_type, _ in _parse_accept(accept):
+        if media_type in offered:
+            if media_type == ARROW_STREAM and pa is None:
+                raise NotAcceptableError("Formato Arrow indisponível: instale o pacote 'pyarrow'")
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return default
+    return default
+
+# =======================================================================
+# 2. CODIFICADORES
+# =======================================================================
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def column_arrays(columns, rows):
+    """ Transpõe as linhas em uma lista por coluna (Decimal -> float). """
+    arrays = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    for values in arrays:
+        if any(isinstance(value, Decimal) for value in values):
+            values[:] = [None if value is None else float(value) for value in values]
+    return arrays
+
+
+def dumps(payload):
+    """ JSON em bytes: orjson quando disponível, senão o módulo json. """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default)
+    return json.dumps(payload, default=_json_default).encode()
+
+
+def encode_columnar_json(columns, rows, meta):
+    """ {"columns": [...], "data": {coluna: [valores]}, **meta} """
+    payload = {"columns": list(columns), "data": dict(zip(columns, column_arrays(columns, rows)))}
+    payload.update(meta)
+    return dumps(payload)
+
+
+def arrow_schema_metadata(meta):
+    return {key: json.dumps(value, default=_json_default) for key, value in meta.items()}
+
+
+def arrow_batch(columns, rows, schema=None):
+    """ RecordBatch com as linhas; com `schema` os tipos seguem os do primeiro bloco. """
+    arrays = column_arrays(columns, rows)
+    if schema is None:
+        return pa.RecordBatch.from_arrays([pa.array(values) for values in arrays], names=list(columns))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(arrays, schema)], schema=schema
+    )
+
+
+def encode_arrow(columns, rows, meta):
+    """ Arrow IPC (stream) com um único RecordBatch; `meta` vai nos metadados do schema. """
+    if pa is None:
+        raise NotAcceptableError("Formato Arrow indisponível: instale o pacote 'pyarrow'")
+    batch = arrow_batch(columns, rows)
+    schema = batch.schema.with_metadata(arrow_schema_metadata(meta))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+    return sink.getvalue().to_pybytes()
+
+
+def encode(media_type, columns, rows, meta):
+    """ Codifica no formato colunar pedido e mede o tempo gasto: (bytes, ms). """
+    start = time.perf_counter()
+    if media_type == ARROW_STREAM:
+        body = encode_arrow(columns, rows, meta)
+    else:
+        body = encode_columnar_json(columns, rows, meta)
+    return body, (time.perf_counter() - start) * 1000
+
+# =======================================================================
+# 3. EXPORTAÇÃO EM BLOCOS (STREAMING)
+# =======================================================================
+
+class _ChunkSink(io.RawIOBase):
+    """ Destino do writer Arrow que entrega (e descarta) os bytes escritos a cada bloco. """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ArrowStreamEncoder:
+    """
+    Escreve um Arrow IPC stream em blocos: o schema sai com o primeiro bloco e
+    cada bloco seguinte vira um RecordBatch (a memória fica limitada ao bloco).
+    """
+
+    def __init__(self, columns):
+        if pa is None:
+            raise NotAcceptableError("Formato Arrow indisponível: instale o pacote 'pyarrow'")
+        self.columns = columns
+        self._sink = _ChunkSink()
+        self._writer = None
+        self._schema = None
+
+    def write(self, rows):
+        if self._writer is None:
+            batch = arrow_batch(self.columns, rows)
+            self._schema = batch.schema
+            self._writer = pa.ipc.new_stream(self._sink, self._schema)
+        else:
+            batch = arrow_batch(self.columns, rows, self._schema)
+        self._writer.write_batch(batch)
+        return self._sink.drain()
+
+    def close(self):
+        if self._writer is None:
+            self.write([])
+        self._writer.close()
+        return self._sink.drain()
+
+
+class TextExportEncoder:
+    """ NDJSON (um objeto por linha) ou CSV (com cabeçalho no primeiro bloco). """
+
+    def __init__(self, columns, output_format):
+        self.columns = columns
+        self.output_format = output_format
+        self._header_pending = output_format == "csv"
+
+    def write(self, rows):
+        if self.output_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if self._header_pending:
+                writer.writerow(self.columns)
+                self._header_pending = False
+            writer.writerows(rows)
+            return buffer.getvalue().encode()
+        return b"".join(dumps(dict(zip(self.columns, row))) + b"\n" for row in rows)
+
+    def close(self):
+        return self.write([]) if self._header_pending else b""
+
+
+def export_encoder(output_format, columns):
+    """ Codificador em blocos para um dos EXPORT_MEDIA_TYPES: write(linhas) -> bytes, close() -> bytes. """
+    if output_format == "arrow":
+        return ArrowStreamEncoder(columns)
+    return TextExportEncoder(columns, output_format)
@@ -0,0 +1,222 @@
+"""
+Log de queries lentas do motor de pivot.
+
+Cada execução é agrupada por fingerprint, a forma da requisição que determina o
+custo: dimensão, métrica, conjunto de JOINs e as chaves dos filtros (os valores
+ficam de fora). Por fingerprint são mantidos contagem e percentis de duração.
+
+Execuções acima de SLOW_QUERY_THRESHOLD_MS têm, por amostragem, o plano capturado
+em uma task em segundo plano, depois que a resposta original já saiu. Por padrão
+a captura é um EXPLAIN simples (o planner não executa a query). Com
+SLOW_QUERY_CAPTURE_ANALYZE=true ela passa a ser EXPLAIN (ANALYZE, BUFFERS), ou
+seja, repete a query lenta: nesse caso a captura ocupa uma vaga da classe 'heavy'
+da admissão e é descartada quando não há vaga livre, sem entrar na fila das
+requisições. No máximo SLOW_QUERY_MAX_CAPTURES capturas rodam ao mesmo tempo, e
+cada fingerprint é capturado no máximo uma vez a cada SLOW_QUERY_CAPTURE_INTERVAL
+segundos. Os piores fingerprints e seus planos ficam em GET /api/v1/admin/slow-queries,
+rota desligada por padrão (SLOW_QUERY_ADMIN_ENABLED=true a expõe). Os planos
+guardam o SQL, mas não os valores dos parâmetros (IDs de loja, filtros etc.).
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+from collections import deque, OrderedDict
+from datetime import datetime, timezone
+
+from backend.database import fetch_all, DB_ERRORS, QueryTimeoutError
+from backend.query_builder import normalize_filters, query_join_set
+from backend.telemetry import untimed
+
+SLOW_QUERY_LOG_ENABLED = os.getenv('SLOW_QUERY_LOG_ENABLED', 'true').lower() == 'true'
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '500'))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', '0.2'))        # Fração das lentas capturadas
+SLOW_QUERY_CAPTURE_INTERVAL = float(os.getenv('SLOW_QUERY_CAPTURE_INTERVAL', '300'))  # Por fingerprint (s)
+SLOW_QUERY_MAX_CAPTURES = int(os.getenv('SLOW_QUERY_MAX_CAPTURES', '1'))           # Capturas simultâneas
+SLOW_QUERY_CAPTURE_ANALYZE = os.getenv('SLOW_QUERY_CAPTURE_ANALYZE', 'false').lower() == 'true'
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', '5000'))  # EXPLAIN simples
+SLOW_QUERY_ADMIN_ENABLED = os.getenv('SLOW_QUERY_ADMIN_ENABLED', 'false').lower() == 'true'  # Rotas /admin
+
+# Limites de memória
+MAX_FINGERPRINTS = 1000
+DURATION_SAMPLES = 512
+PLANS_PER_FINGERPRINT = 3
+
+
+def query_fingerprint(metric, group_by, filters):
+    """ Forma da requisição: {"id", "group_by", "metric", "join_set", "filter_keys"}. """
+    filters = normalize_filters(filters)
+    shape = {
+        "group_by": group_by,
+        "metric": metric,
+        "join_set": list(query_join_set(metric, group_by, filters)),
+        "filter_keys": sorted(filters),
+    }
+    canonical = f"{group_by}|{metric}|{','.join(shape['join_set'])}|{','.join(shape['filter_keys'])}"
+    return {"id": hashlib.sha1(canonical.encode()).hexdigest()[:12], **shape}
+
+
+class FingerprintStats:
+    """ Durações recentes, contadores e planos capturados de um fingerprint. """
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.slow_count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_seen = None
+        self.last_capture = 0.0
+        self.durations = deque(maxlen=DURATION_SAMPLES)
+        self.plans = deque(maxlen=PLANS_PER_FINGERPRINT)
+
+    def percentile(self, pct):
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def summary(self, include_plans=False):
+        summary = {
+            **self.fingerprint,
+            "count": self.count,
+            "slow_count": self.slow_count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "last_seen": self.last_seen,
+            "plans_captured": len(self.plans),
+        }
+        if include_plans:
+            summary["plans"] = list(self.plans)
+        return summary
+
+
+class SlowQueryLog:
+    """
+    Estatísticas por fingerprint e captura amostrada de planos.
+
+    Atualizado apenas a partir do event loop (as execuções passam pelo controle
+    de admissão, que é async): não precisa de lock.
+    """
+
+    def __init__(self, enabled=SLOW_QUERY_LOG_ENABLED, threshold_ms=SLOW_QUERY_THRESHOLD_MS,
+                 analyze=SLOW_QUERY_CAPTURE_ANALYZE):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.analyze = analyze
+        # Classe da admissão usada pelas capturas com ANALYZE (definida em backend/admission.py,
+        # que importa este módulo); sem ela as capturas com ANALYZE são descartadas
+        self.capture_class = None
+        self._stats = OrderedDict()  # id do fingerprint -> FingerprintStats (LRU)
+        self._captures = set()       # Tasks de EXPLAIN em andamento
+        self._counters = {"executions": 0, "slow": 0, "captures_started": 0, "captures_failed": 0,
+                          "captures_skipped_busy": 0}
+
+    def observe(self, fingerprint, duration_ms, query, params):
+        """ Registra uma execução; se lenta, agenda (por amostragem) a captura do plano. """
+        if not self.enabled:
+            return
+        stats = self._stats.get(fingerprint["id"])
+        if stats is None:
+            stats = self._stats[fingerprint["id"]] = FingerprintStats(fingerprint)
+            while len(self._stats) > MAX_FINGERPRINTS:
+                self._stats.popitem(last=False)
+        self._stats.move_to_end(fingerprint["id"])
+
+        stats.count += 1
+        stats.total_ms += duration_ms
+        stats.max_ms = max(stats.max_ms, duration_ms)
+        stats.durations.append(duration_ms)
+        stats.last_seen = datetime.now(timezone.utc).isoformat()
+        self._counters["executions"] += 1
+
+        if duration_ms < self.threshold_ms:
+            return
+        stats.slow_count += 1
+        self._counters["slow"] += 1
+
+        now = time.monotonic()
+        if (len(self._captures) >= SLOW_QUERY_MAX_CAPTURES
+                or now - stats.last_capture < SLOW_QUERY_CAPTURE_INTERVAL
+                or random.random() >= SLOW_QUERY_SAMPLE_RATE):
+            return
+        stats.last_capture = now
+        self._counters["captures_started"] += 1
+        # Fora do caminho da requisição: a resposta não espera o EXPLAIN
+        task = asyncio.ensure_future(self._capture_plan(stats, duration_ms, query, params))
+        self._captures.add(task)
+        task.add_done_callback(self._captures.discard)
+
+    async def _capture_plan(self, stats, duration_ms, query, params):
+        if not self.analyze:
+            rows = await self._explain("EXPLAIN (FORMAT JSON) ", stats, query, params, SLOW_QUERY_EXPLAIN_TIMEOUT_MS)
+        else:
+            # A reexecução disputa as vagas das queries pesadas, mas nunca espera nem entra na fila
+            if self.capture_class is None or not self.capture_class.try_acquire():
+                self._counters["captures_skipped_busy"] += 1
+                return
+            try:
+                rows = await self._explain("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ", stats, query, params,
+                                           self.capture_class.statement_timeout_ms)
+            finally:
+                self.capture_class.release()
+        if rows is None:
+            return
+        plan = rows[0][0][0]
+        top = plan["Plan"]
+        stats.plans.append({
+            "captured_at": datetime.now(timezone.utc).isoformat(),
+            "analyze": self.analyze,
+            "request_duration_ms": round(duration_ms, 3),
+            "execution_time_ms": plan.get("Execution Time"),
+            "planning_time_ms": plan.get("Planning Time"),
+            "shared_hit_blocks": top.get("Shared Hit Blocks"),
+            "shared_read_blocks": top.get("Shared Read Blocks"),
+            "query": query.strip(),
+            # Só os tipos: os valores ficam fora do que a rota administrativa devolve
+            "param_types": [type(param).__name__ for param in params],
+            "plan": plan,
+        })
+
+    async def _explain(self, prefix, stats, query, params, timeout_ms):
+        try:
+            with untimed():
+                _, rows = await fetch_all(prefix + query.strip().rstrip(';'), params, timeout_ms=timeout_ms)
+            return rows
+        except (QueryTimeoutError, *DB_ERRORS) as e:
+            print(f"Erro ao capturar o plano [{stats.fingerprint['id']}]: {e}")
+            self._counters["captures_failed"] += 1
+            return None
+
+    def top(self, limit=20, sort="p95_ms", include_plans=False):
+        """ Fingerprints ordenados pela estatística `sort` (maior primeiro). """
+        summaries = [stats.summary(include_plans) for stats in self._stats.values()]
+        summaries.sort(key=lambda summary: summary[sort], reverse=True)
+        return summaries[:limit]
+
+    def get(self, fingerprint_id):
+        stats = self._stats.get(fingerprint_id)
+        return stats.summary(include_plans=True) if stats else None
+
+    def reset(self):
+        self._stats.clear()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "sample_rate": SLOW_QUERY_SAMPLE_RATE,
+            "capture_analyze": self.analyze,
+            "fingerprints": len(self._stats),
+            "captures_in_progress": len(self._captures),
+            **self._counters,
+        }
+
+
+# Log compartilhado pelas execuções do pivot (ver AdmissionController.fetch_all)
+slow_query_log = SlowQueryLog()
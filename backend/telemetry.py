@@ -0,0 +1,170 @@
+"""
+Telemetria do motor de pivot: tempo por fase de cada requisição.
+
+Fases medidas:
+
+    build      montagem do SQL (query_builder / rollup)
+    acquire    classificação e fila da admissão + conexão do pool
+    execute    execução da query no Postgres
+    fetch      leitura das linhas do cursor
+    serialize  conversão e codificação da resposta
+
+As fases de uma requisição ficam em um ContextVar: o código do banco (inclusive
+no threadpool do modo 'sync', que copia o contexto) soma o próprio tempo sem
+receber parâmetros extras. Ao final, os tempos vão para histogramas por rota,
+dimensão, agregação e conjunto de JOINs, expostos em formato Prometheus em
+GET /metrics e, com SERVER_TIMING_ENABLED=true, no header Server-Timing.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+
+PHASES = ("build", "acquire", "execute", "fetch", "serialize")
+
+# Limites dos buckets dos histogramas (s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar("pivot_request_timings", default=None)
+
+
+class RequestTimings:
+    """ Milissegundos acumulados por fase em uma requisição. """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed_ms):
+        # Fases podem ser somadas a partir de threads do threadpool (modo 'sync')
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def start_request():
+    """ Abre a medição de uma requisição no contexto atual. """
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def record_since(name, start):
+    """ Soma à fase `name` o tempo desde `start` (time.perf_counter()). """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, (time.perf_counter() - start) * 1000)
+
+
+@contextmanager
+def phase(name):
+    """ `with phase("execute"): ...` soma a duração do bloco à fase da requisição atual. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_since(name, start)
+
+
+@contextmanager
+def untimed():
+    """ Queries auxiliares (ex: EXPLAIN da admissão) que não devem entrar nas fases da requisição. """
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def server_timing(timings):
+    """ Valor do header Server-Timing (fases em ms, na ordem de PHASES, mais o total). """
+    entries = [f"{name};dur={timings.phases[name]:.3f}" for name in PHASES if name in timings.phases]
+    entries.append(f"total;dur={timings.total_ms():.3f}")
+    return ", ".join(entries)
+
+
+# =======================================================================
+# HISTOGRAMAS (FORMATO PROMETHEUS)
+# =======================================================================
+
+class Histogram:
+    """ Histograma com labels no modelo do Prometheus (buckets cumulativos, _sum e _count). """
+
+    def __init__(self, name, description, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # valores dos labels -> [contagem por bucket..., soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key))
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_LABELS = ("route", "group_by", "agg_func", "join_set")
+
+phase_duration = Histogram(
+    "pivot_phase_duration_seconds", "Duração de cada fase das requisições do pivot.",
+    REQUEST_LABELS + ("phase",),
+)
+request_duration = Histogram(
+    "pivot_request_duration_seconds", "Duração total das requisições do pivot.",
+    REQUEST_LABELS + ("cache",),
+)
+
+
+def observe_request(timings, route, group_by, agg_func, join_set, cache="miss"):
+    """ Registra as fases e o total da requisição nos histogramas. """
+    labels = {"route": route, "group_by": group_by, "agg_func": agg_func.upper(),
+              "join_set": "+".join(join_set) or "none"}
+    for name, elapsed_ms in list(timings.phases.items()):
+        phase_duration.observe({**labels, "phase": name}, elapsed_ms / 1000)
+    request_duration.observe({**labels, "cache": cache}, timings.total_ms() / 1000)
+
+
+def render_metrics():
+    return "\n".join(histogram.render() for histogram in (phase_duration, request_duration)) + "\n"
+
+
+# Incluído sem o prefixo /api/v1 (backend/main.py): caminho padrão do scrape do Prometheus
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga: DB_EXECUTION_MODE=sync vs DB_EXECUTION_MODE=async
+
+Sobe um worker uvicorn para cada modo (mesmo banco, mesmo tamanho de pool),
+dispara N requisições concorrentes de /api/v1/analytics/pivot e compara
+throughput e latências (p50/p95/p99).
+
+Uso:
+    python benchmarks/bench_execution_modes.py --concurrency 200 --requests 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Payloads típicos enviados pelas abas do Dashboard
+PAYLOADS = [
+    {"metric": "total_amount", "agg_func": "SUM", "group_by": "channels.name", "filters": {"date_range": "last_30d"}},
+    {"metric": "total_amount", "agg_func": "AVG", "group_by": "stores.name", "filters": {"date_range": "last_6m"}},
+    {"metric": "id", "agg_func": "COUNT", "group_by": "date.hour", "filters": {"date_range": "last_7d"}},
+    {"metric": "production_seconds", "agg_func": "AVG", "group_by": "stores.name", "filters": {"date_range": "last_6m"}},
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def start_server(mode, port, pool_size):
+    env = dict(os.environ, DB_EXECUTION_MODE=mode, DB_POOL_MAX_SIZE=str(pool_size))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if httpx.get(f"{base_url}/api/v1/status", timeout=5).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Servidor em modo '{mode}' não respondeu em {base_url}")
+
+
+async def run_load(base_url, total_requests, concurrency):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/api/v1/analytics/pivot", json=PAYLOADS[i % len(PAYLOADS)])
+                except httpx.HTTPError:
+                    errors += 1
+                    return
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sync vs async execution modes')
+    parser.add_argument('--requests', type=int, default=2000, help='Total de requisições por modo')
+    parser.add_argument('--concurrency', type=int, default=200, help='Requisições simultâneas')
+    parser.add_argument('--pool-size', type=int, default=50, help='DB_POOL_MAX_SIZE usado nos dois modos')
+    parser.add_argument('--port', type=int, default=8100, help='Porta base dos servidores de teste')
+    parser.add_argument('--output', help='Arquivo JSON para salvar o resultado')
+    args = parser.parse_args()
+
+    results = {}
+    for offset, mode in enumerate(('sync', 'async')):
+        process, base_url = start_server(mode, args.port + offset, args.pool_size)
+        try:
+            asyncio.run(run_load(base_url, min(50, args.requests), args.concurrency))  # Aquecimento
+            results[mode] = asyncio.run(run_load(base_url, args.requests, args.concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"{'modo':<6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>6}")
+    for mode, r in results.items():
+        print(f"{mode:<6} {r['throughput_rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['errors']:>6}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
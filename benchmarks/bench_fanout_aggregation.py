@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Verificação + benchmark: agregação sem fan-out nas tabelas filhas
+
+Para cada combinação métrica x dimensão x filtros do Dashboard compara, no banco
+gerado pelo generate_data.py:
+
+  * o resultado do query_builder (filhas pré-agregadas por venda) com uma
+    referência independente: as linhas do JOIN direto deduplicadas por
+    (venda, linha da métrica, valor da dimensão) antes de agregar;
+  * o tempo do builder com o do JOIN direto antigo (fan-out), e quanto o JOIN
+    direto inflava a soma dos resultados.
+
+Sai com código 1 se algum resultado divergir da referência.
+
+Uso:
+    python benchmarks/bench_fanout_aggregation.py
+    python benchmarks/bench_fanout_aggregation.py --repeat 5 --output fanout.json
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.database import get_db_connection  # noqa: E402
+from backend.query_builder import (  # noqa: E402
+    DIMENSION_MAP, JOIN_MAP, DATE_RANGES, _metric_column, build_analytics_query,
+)
+
+METRICS = [("total_amount", "SUM"), ("total_amount", "AVG"), ("id", "COUNT"),
+           ("production_seconds", "AVG"), ("items.additional_price", "SUM"), ("items.additional_price", "AVG")]
+DIMENSIONS = ["stores.name", "channels.name", "date.hour", "products.name", "items.name_custom",
+              "payment_types.desc", "address.neighborhood"]
+FILTERS = [{}, {"date_range": "last_7d"}, {"date_range": "last_30d", "store_ids": [1, 2, 3]}]
+
+# Chave da linha que carrega a métrica (métricas de itens vivem em item_product_sales)
+METRIC_LINE_KEYS = {"items_custom": "ips.id"}
+
+
+def direct_joins(join_keys):
+    """ JOINs diretos do JOIN_MAP (layout antigo), sem repetir aliases. """
+    clauses = []
+    for join_key in JOIN_MAP:
+        if join_key in join_keys:
+            for clause in re.split(r"\s+(?=JOIN )", JOIN_MAP[join_key]):
+                if clause not in clauses:
+                    clauses.append(clause)
+    return " ".join(clauses)
+
+
+def direct_where(filters):
+    where, params = ["s.sale_status_desc = 'COMPLETED'"], []
+    if filters.get("date_range") in DATE_RANGES:
+        where.append(f"s.created_at >= NOW() - INTERVAL '{DATE_RANGES[filters['date_range']]}'")
+    if filters.get("store_ids"):
+        where.append("s.store_id = ANY(%s)")
+        params.append(filters["store_ids"])
+    if filters.get("delivery_type"):
+        where.append("ds.delivery_type = %s")
+        params.append(filters["delivery_type"])
+    return " AND ".join(where), params
+
+
+def query_shapes(metric, agg, group_by, filters):
+    """ (SQL do JOIN direto com fan-out, SQL de referência deduplicada, params). """
+    metric_col, metric_join = _metric_column(metric)
+    dim = DIMENSION_MAP[group_by]
+    joins = direct_joins({dim["join"], metric_join} - {None})
+    if filters.get("delivery_type"):
+        joins += " JOIN delivery_sales ds ON ds.sale_id = s.id"
+    where, params = direct_where(filters)
+
+    fanout = (f"SELECT {agg}({metric_col}) AS result, {dim['column']} AS dimension FROM sales s {joins} "
+              f"WHERE {where} GROUP BY 2")
+    line_key = METRIC_LINE_KEYS.get(metric_join, "NULL::int")
+    reference = (f"SELECT {agg}(t.value) AS result, t.dimension FROM ("
+                 f"SELECT DISTINCT s.id, {line_key} AS line_id, {metric_col} AS value, {dim['column']} AS dimension "
+                 f"FROM sales s {joins} WHERE {where}) t GROUP BY 2")
+    return fanout, reference, params
+
+
+def timed(cursor, query, params, repeat):
+    best, rows = math.inf, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return rows, best
+
+
+def same_results(rows, reference):
+    expected = {dimension: result for result, dimension in reference}
+    if len(rows) != min(len(expected), 100):
+        return False
+    for result, dimension in rows:
+        if dimension not in expected:
+            return False
+        want = expected[dimension]
+        if (result is None) != (want is None):
+            return False
+        if result is not None and not math.isclose(float(result), float(want), rel_tol=1e-9, abs_tol=1e-6):
+            return False
+    return True
+
+
+def total(rows, dimensions=None):
+    return sum(float(r[0]) for r in rows if r[0] is not None and (dimensions is None or r[1] in dimensions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and time fan-out-free aggregation over child tables')
+    parser.add_argument('--repeat', type=int, default=3, help='Execuções por query (vale o melhor tempo)')
+    parser.add_argument('--output', help='Arquivo JSON para salvar o resultado')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    results, failures = [], 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT delivery_type FROM delivery_sales WHERE delivery_type IS NOT NULL LIMIT 1")
+        row = cursor.fetchone()
+        filter_sets = FILTERS + ([{"date_range": "last_30d", "delivery_type": row[0]}] if row else [])
+
+        # Tudo na mesma transação: NOW() é o mesmo em todas as queries
+        for (metric, agg), group_by, filters in itertools.product(METRICS, DIMENSIONS, filter_sets):
+            fanout, reference, direct_params = query_shapes(metric, agg, group_by, filters)
+            query, params = build_analytics_query(metric, agg, group_by, filters)
+
+            rows, builder_ms = timed(cursor, query, tuple(params), args.repeat)
+            fanout_rows, fanout_ms = timed(cursor, fanout, direct_params, args.repeat)
+            cursor.execute(reference, direct_params)
+            ok = same_results(rows, cursor.fetchall())
+            failures += not ok
+
+            # Mesmo conjunto de grupos dos dois lados (o builder devolve só o top 100)
+            ranked = {dimension for _, dimension in rows}
+            inflation = total(fanout_rows, ranked) / total(rows) if agg in ("SUM", "COUNT") and total(rows) else None
+            results.append({
+                "request": f"{agg}({metric}) BY {group_by} {json.dumps(filters)}",
+                "ok": ok,
+                "builder_ms": round(builder_ms, 2),
+                "fanout_ms": round(fanout_ms, 2),
+                "fanout_inflation": round(inflation, 4) if inflation else None,
+            })
+        conn.rollback()
+    finally:
+        conn.close()
+
+    print(f"{'ok':<4} {'builder ms':>10} {'fan-out ms':>10} {'inflação':>9}  requisição")
+    for r in results:
+        inflation = f"{r['fanout_inflation']:.2f}x" if r['fanout_inflation'] else "-"
+        print(f"{'✓' if r['ok'] else '✗':<4} {r['builder_ms']:>10} {r['fanout_ms']:>10} {inflation:>9}  {r['request']}")
+    builder_total = sum(r["builder_ms"] for r in results)
+    fanout_total = sum(r["fanout_ms"] for r in results)
+    print(f"{len(results) - failures}/{len(results)} iguais à referência; "
+          f"tempo total builder {builder_total:.0f} ms vs JOIN direto {fanout_total:.0f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
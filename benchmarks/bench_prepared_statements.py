@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Benchmark de planejamento: queries do pivot com e sem prepared statements
+
+Gera o workload do Dashboard (métricas x dimensões x períodos do
+analytics_config.js, mais seleções de várias lojas) com o query_builder e mede,
+direto no banco:
+
+  * quantos textos de SQL distintos o workload produz (formas estáveis);
+  * o tempo de planejamento reportado pelo Postgres (EXPLAIN SUMMARY) para a
+    query avulsa e para o EXECUTE do prepared statement;
+  * o tempo de ponta a ponta (execução + fetch) das duas formas;
+  * no driver assíncrono (psycopg 3, DB_EXECUTION_MODE=async), com as mesmas
+    opções de conexão do pool da API, o tempo de ponta a ponta com e sem
+    prepare=True e quantos statements o servidor realmente preparou
+    (pg_prepared_statements). Zero statements preparados indica que o
+    prepare=True está sendo ignorado.
+
+Uso:
+    python benchmarks/bench_prepared_statements.py --rounds 5
+    python benchmarks/bench_prepared_statements.py --plan-cache-mode force_generic_plan
+    python benchmarks/bench_prepared_statements.py --skip-async
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.database import (  # noqa: E402
+    get_db_connection, _execute_prepared, _prepared_statements, ASYNC_CONNECTION_KWARGS,
+    DB_PREPARED_MAX_PER_CONNECTION,
+)
+from backend.query_builder import DIMENSION_MAP, build_analytics_query  # noqa: E402
+
+# Espelho de frontend/analytics_config.js (METRICS_CONFIG, DIMENSIONS_CONFIG, FILTER_RANGES)
+METRICS = [("total_amount", "SUM"), ("total_amount", "AVG"), ("id", "COUNT"),
+           ("production_seconds", "AVG"), ("items.additional_price", "SUM")]
+DIMENSIONS = ["channels.name", "stores.name", "products.name", "address.neighborhood",
+              "payment_types.desc", "date.hour"]
+DATE_RANGES = ["last_7d", "last_30d", "last_6m"]
+# Seleções de lojas no FilterPanel (quantidades diferentes de IDs)
+STORE_SELECTIONS = [None, [1], [1, 2], [3, 5, 8], [2, 4, 6, 8, 10]]
+
+
+def dashboard_workload():
+    for (metric, agg), group_by, date_range, stores in itertools.product(
+            METRICS, DIMENSIONS, DATE_RANGES, STORE_SELECTIONS):
+        if group_by not in DIMENSION_MAP:
+            continue
+        filters = {"date_range": date_range}
+        if stores:
+            filters["store_ids"] = stores
+        query, params = build_analytics_query(metric, agg, group_by, filters)
+        yield f"{agg}({metric}) BY {group_by} {json.dumps(filters)}", query, tuple(params)
+
+
+def valid_workload(conn):
+    """ Descarta combinações que o builder não consegue emitir como SQL válido. """
+    cursor = conn.cursor()
+    workload, skipped = [], 0
+    for label, query, params in dashboard_workload():
+        try:
+            cursor.execute("EXPLAIN " + query, params)
+            cursor.fetchall()
+            workload.append((label, query, params))
+        except psycopg2.Error:
+            conn.rollback()
+            skipped += 1
+    conn.rollback()
+    return workload, skipped
+
+
+def planning_ms(cursor, statement, params):
+    cursor.execute("EXPLAIN (SUMMARY, FORMAT JSON) " + statement, params)
+    plan = cursor.fetchone()[0]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return plan[0]["Planning Time"]
+
+
+def run_unprepared(conn, workload, rounds):
+    cursor = conn.cursor()
+    planning, elapsed = [], []
+    for _ in range(rounds):
+        for _, query, params in workload:
+            planning.append(planning_ms(cursor, query.strip().rstrip(';'), params))
+            start = time.perf_counter()
+            cursor.execute(query, params)
+            cursor.fetchall()
+            elapsed.append((time.perf_counter() - start) * 1000)
+    conn.rollback()
+    return planning, elapsed
+
+
+def run_prepared(conn, workload, rounds):
+    cursor = conn.cursor()
+    planning, elapsed = [], []
+    for _ in range(rounds):
+        for _, query, params in workload:
+            start = time.perf_counter()
+            _execute_prepared(conn, cursor, query, params)
+            cursor.fetchall()
+            elapsed.append((time.perf_counter() - start) * 1000)
+            name = _prepared_statements[conn][query]
+            placeholders = ", ".join(["%s"] * len(params))
+            planning.append(planning_ms(cursor, f"EXECUTE {name}" + (f" ({placeholders})" if params else ""), params))
+    conn.rollback()
+    return planning, elapsed
+
+
+async def run_async(workload, rounds, plan_cache_mode, prepare):
+    """
+    Workload no driver assíncrono, com as opções de conexão do pool da API.
+    Retorna (tempos em ms, statements preparados no servidor ao final).
+    """
+    import psycopg
+
+    conn = await psycopg.AsyncConnection.connect(**ASYNC_CONNECTION_KWARGS)
+    conn.prepared_max = DB_PREPARED_MAX_PER_CONNECTION
+    try:
+        await conn.execute("SELECT set_config('plan_cache_mode', %s, false)", (plan_cache_mode,))
+        elapsed = []
+        async with conn.cursor() as cursor:
+            for _ in range(rounds):
+                for _, query, params in workload:
+                    start = time.perf_counter()
+                    await cursor.execute(query, params, prepare=True if prepare else None)
+                    await cursor.fetchall()
+                    elapsed.append((time.perf_counter() - start) * 1000)
+            await cursor.execute("SELECT COUNT(*) FROM pg_prepared_statements")
+            prepared = (await cursor.fetchone())[0]
+        await conn.rollback()
+    finally:
+        await conn.close()
+    return elapsed, prepared
+
+
+def summarize(planning, elapsed):
+    return {
+        "executions": len(elapsed),
+        "planning_ms_total": round(sum(planning), 2),
+        "planning_ms_mean": round(statistics.fmean(planning), 4),
+        "elapsed_ms_total": round(sum(elapsed), 2),
+        "elapsed_ms_mean": round(statistics.fmean(elapsed), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark planning time with and without prepared statements')
+    parser.add_argument('--rounds', type=int, default=3, help='Repetições do workload completo')
+    parser.add_argument('--plan-cache-mode', default='auto',
+                        choices=['auto', 'force_generic_plan', 'force_custom_plan'],
+                        help='plan_cache_mode da sessão (afeta apenas os prepared statements)')
+    parser.add_argument('--skip-async', action='store_true', help='Não mede o driver assíncrono (psycopg 3)')
+    parser.add_argument('--output', help='Arquivo JSON para salvar o resultado')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        workload, skipped = valid_workload(conn)
+        statements = {query for _, query, _ in workload}
+        print(f"{len(workload)} requisições ({skipped} inválidas ignoradas), {len(statements)} textos de SQL distintos")
+
+        cursor = conn.cursor()
+        cursor.execute("SET plan_cache_mode = %s", (args.plan_cache_mode,))
+        conn.commit()
+
+        # Aquecimento (cache de catálogo e de páginas) antes de medir
+        run_unprepared(conn, workload, 1)
+
+        results = {
+            "unprepared": summarize(*run_unprepared(conn, workload, args.rounds)),
+            "prepared": summarize(*run_prepared(conn, workload, args.rounds)),
+        }
+    finally:
+        conn.close()
+
+    async_results = {}
+    if not args.skip_async:
+        for mode, prepare in (("unprepared", False), ("prepared", True)):
+            elapsed, prepared = asyncio.run(run_async(workload, args.rounds, args.plan_cache_mode, prepare))
+            async_results[mode] = {
+                "executions": len(elapsed),
+                "elapsed_ms_total": round(sum(elapsed), 2),
+                "elapsed_ms_mean": round(statistics.fmean(elapsed), 3),
+                "server_prepared_statements": prepared,
+            }
+
+    print(f"{'modo':<11} {'execuções':>9} {'planej. total ms':>17} {'planej. médio ms':>17} {'total ms':>11} {'médio ms':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<11} {r['executions']:>9} {r['planning_ms_total']:>17} {r['planning_ms_mean']:>17} "
+              f"{r['elapsed_ms_total']:>11} {r['elapsed_ms_mean']:>9}")
+    saved = results["unprepared"]["planning_ms_total"] - results["prepared"]["planning_ms_total"]
+    print(f"✓ Planejamento economizado: {saved:.2f} ms "
+          f"({saved * 100 / (results['unprepared']['planning_ms_total'] or 1):.1f}%)")
+
+    if async_results:
+        print("\nDriver assíncrono (psycopg 3, opções do pool da API)")
+        print(f"{'modo':<11} {'execuções':>9} {'total ms':>11} {'médio ms':>9} {'preparados no servidor':>23}")
+        for mode, r in async_results.items():
+            print(f"{mode:<11} {r['executions']:>9} {r['elapsed_ms_total']:>11} {r['elapsed_ms_mean']:>9} "
+                  f"{r['server_prepared_statements']:>23}")
+        if not async_results["prepared"]["server_prepared_statements"]:
+            print("✗ prepare=True não preparou nenhum statement no servidor (verifique prepare_threshold)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "requests": len(workload), "distinct_statements": len(statements),
+                       "results": results, "async_results": async_results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
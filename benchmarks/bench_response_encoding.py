@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialização: respostas do pivot por formato
+
+Monta um resultado sintético no formato devolvido pelo banco (result Decimal,
+dimension texto) e mede, fora do banco, o custo de codificar a resposta em cada
+formato aceito por /analytics/pivot:
+
+  * rows-json   um objeto por linha, pelo caminho padrão do FastAPI
+                (jsonable_encoder + JSONResponse);
+  * columnar    arrays por coluna (application/vnd.analytics.columnar+json);
+  * arrow       Apache Arrow IPC (application/vnd.apache.arrow.stream).
+
+Uso:
+    python benchmarks/bench_response_encoding.py --rows 100000
+    python benchmarks/bench_response_encoding.py --rows 100000 --repeat 10 --output encoding.json
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.serialization import (  # noqa: E402
+    COLUMNAR_JSON, ARROW_STREAM, encode, orjson, pa,
+)
+
+COLUMNS = ["result", "dimension"]
+
+
+def synthetic_result(rows, seed=42):
+    rng = random.Random(seed)
+    return [(Decimal(f"{rng.uniform(0, 100000):.2f}"), f"Produto {i:06d}") for i in range(rows)]
+
+
+def encode_rows_json(rows, meta):
+    """ Caminho atual: lista de dicts devolvida pela rota e renderizada pelo FastAPI. """
+    content = {"data": [dict(zip(COLUMNS, row)) for row in rows], **meta}
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+
+def measure(encoder, repeat):
+    timings, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encoder()
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(body)
+    return {"ms_best": round(min(timings), 2), "ms_median": round(statistics.median(timings), 2), "bytes": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pivot response encoding by format')
+    parser.add_argument('--rows', type=int, default=100000, help='Linhas do resultado sintético')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetições por formato')
+    parser.add_argument('--output', help='Arquivo JSON para salvar o resultado')
+    args = parser.parse_args()
+
+    rows = synthetic_result(args.rows)
+    meta = {"execution_time_ms": 12.5, "status": "success", "cache": "miss", "source": "sales"}
+
+    encoders = {
+        "rows-json": lambda: encode_rows_json(rows, meta),
+        "columnar": lambda: encode(COLUMNAR_JSON, COLUMNS, rows, meta)[0],
+    }
+    if pa is not None:
+        encoders["arrow"] = lambda: encode(ARROW_STREAM, COLUMNS, rows, meta)[0]
+    else:
+        print("pyarrow não instalado: formato Arrow ignorado")
+    if orjson is None:
+        print("orjson não instalado: o JSON colunar usa o módulo json")
+
+    results = {name: measure(encoder, args.repeat) for name, encoder in encoders.items()}
+
+    baseline = results["rows-json"]
+    print(f"{'formato':<10} {'melhor ms':>10} {'mediana ms':>11} {'bytes':>12} {'speedup':>8}")
+    for name, r in results.items():
+        speedup = baseline["ms_best"] / r["ms_best"] if r["ms_best"] else 0.0
+        print(f"{name:<10} {r['ms_best']:>10} {r['ms_median']:>11} {r['bytes']:>12} {speedup:>7.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
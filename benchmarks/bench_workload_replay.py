@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Benchmark de workload: replay das combinações do Dashboard em /analytics/pivot
+
+Monta o workload a partir de frontend/analytics_config.js (METRICS_CONFIG x
+DIMENSIONS_CONFIG x FILTER_RANGES), cruzado com seleções múltiplas de lojas
+(filtro store_ids), e o reproduz contra POST /api/v1/analytics/pivot com a
+concorrência pedida. Cada requisição é agrupada pelo mesmo fingerprint do log de
+queries lentas (backend/slow_queries.py), o que permite cruzar o resultado com
+GET /api/v1/admin/slow-queries.
+
+Com --scales, cada fator de escala usa um banco próprio ({DB_NAME}_sf<fator>),
+criado e populado com generate_data.py (mesmo --data-seed em todas as execuções)
+na primeira vez ou com --reseed. O fator multiplica meses de vendas, lojas e
+clientes do padrão do gerador (6 meses, 50 lojas, 10.000 clientes). Sem --scales
+o replay roda contra o banco atual (DB_NAME).
+
+O resultado (p50/p95/p99, throughput, status HTTP e a quebra por fingerprint)
+vai para --output em JSON. Com --baseline, o resultado é comparado com uma
+execução anterior: p95 acima da tolerância ou taxa de erro maior é regressão
+(código de saída 1). --current compara dois arquivos sem rodar o replay.
+
+Uso:
+    python benchmarks/bench_workload_replay.py --concurrency 20 --rounds 3 --output base.json
+    python benchmarks/bench_workload_replay.py --scales 0.25,1,2 --output scales.json
+    python benchmarks/bench_workload_replay.py --baseline base.json --output atual.json
+    python benchmarks/bench_workload_replay.py --baseline base.json --current atual.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from urllib.parse import quote
+
+import httpx
+import psycopg2
+from psycopg2 import sql
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from backend.database import DB_HOST, DB_NAME, DB_USER, DB_PASS  # noqa: E402
+from backend.slow_queries import query_fingerprint  # noqa: E402
+
+ANALYTICS_CONFIG = os.path.join(ROOT_DIR, "frontend", "analytics_config.js")
+
+# Seleções do multi-select de lojas (None = todas as lojas, sem filtro)
+STORE_SELECTIONS = [None, [1], [1, 2, 3], [2, 4, 6, 8, 10]]
+
+# Padrões do generate_data.py multiplicados pelo fator de escala
+SCALE_BASE = {"months": 6, "stores": 50, "customers": 10000}
+SCALE_MIN = {"months": 1, "stores": 10, "customers": 500}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# =======================================================================
+# 1. WORKLOAD
+# =======================================================================
+
+def _config_block(source, name):
+    match = re.search(rf"export const {name} = \[(.*?)\n\];", source, re.S)
+    if not match:
+        raise RuntimeError(f"{name} não encontrado em {ANALYTICS_CONFIG}")
+    return match.group(1)
+
+
+def load_workload():
+    """ Payloads de todas as combinações métrica x dimensão x período x seleção de lojas. """
+    with open(ANALYTICS_CONFIG, encoding="utf-8") as f:
+        source = f.read()
+    metrics = re.findall(r"metric: '([^']+)',\s*agg: '([^']+)'", _config_block(source, "METRICS_CONFIG"))
+    dimensions = re.findall(r"group_by: '([^']+)'", _config_block(source, "DIMENSIONS_CONFIG"))
+    ranges = re.findall(r"value: '([^']+)'", _config_block(source, "FILTER_RANGES"))
+
+    payloads = []
+    for metric, agg_func in metrics:
+        for group_by in dimensions:
+            for date_range in ranges:
+                for store_ids in STORE_SELECTIONS:
+                    filters = {"date_range": date_range}
+                    if store_ids:
+                        filters["store_ids"] = store_ids
+                    payloads.append({"metric": metric, "agg_func": agg_func,
+                                     "group_by": group_by, "filters": filters})
+    return payloads
+
+
+# =======================================================================
+# 2. BANCOS POR FATOR DE ESCALA
+# =======================================================================
+
+def scale_database(scale):
+    return f"{DB_NAME}_sf{format(scale, 'g').replace('.', '_')}"
+
+
+def scale_arguments(scale):
+    return {key: max(SCALE_MIN[key], round(value * scale)) for key, value in SCALE_BASE.items()}
+
+
+def _connect(database):
+    return psycopg2.connect(host=DB_HOST, database=database, user=DB_USER, password=DB_PASS)
+
+
+def count_sales(database):
+    conn = _connect(database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('sales') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute("SELECT COUNT(*) FROM sales")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def seed_database(scale, data_seed, engine, workers, reseed=False):
+    """ Cria o banco do fator de escala (schema + índices + generate_data + rollups), se preciso. """
+    database = scale_database(scale)
+    admin = _connect(DB_NAME)
+    admin.autocommit = True
+    try:
+        cursor = admin.cursor()
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (database,))
+        exists = cursor.fetchone() is not None
+        if exists and not reseed and count_sales(database) > 0:
+            print(f"✓ {database}: já populado (use --reseed para recriar)")
+            return database
+        if exists:
+            cursor.execute(sql.SQL("DROP DATABASE {}").format(sql.Identifier(database)))
+        cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(database)))
+    finally:
+        admin.close()
+
+    conn = _connect(database)
+    try:
+        cursor = conn.cursor()
+        for script in ("database-schema.sql", "database-indexes.sql"):
+            with open(os.path.join(ROOT_DIR, script), encoding="utf-8") as f:
+                cursor.execute(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+
+    # Funciona tanto para host TCP quanto para diretório de socket (host=/caminho)
+    db_url = (f"postgresql://{quote(DB_USER, safe='')}:{quote(DB_PASS, safe='')}@/{database}"
+              f"?host={quote(DB_HOST, safe='')}")
+    arguments = scale_arguments(scale)
+    print(f"Populando {database}: {arguments['months']} meses, {arguments['stores']} lojas, "
+          f"{arguments['customers']} clientes...")
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "generate_data.py", "--db-url", db_url, "--seed", str(data_seed),
+         "--months", str(arguments["months"]), "--stores", str(arguments["stores"]),
+         "--customers", str(arguments["customers"]), "--engine", engine, "--workers", str(workers)],
+        cwd=ROOT_DIR, check=True, stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [sys.executable, "-m", "backend.rollups", "refresh", "--full"],
+        cwd=ROOT_DIR, env=dict(os.environ, DB_NAME=database), check=True, stdout=subprocess.DEVNULL,
+    )
+    print(f"✓ {database}: {count_sales(database):,} vendas em {time.perf_counter() - started:.1f}s")
+    return database
+
+
+# =======================================================================
+# 3. REPLAY
+# =======================================================================
+
+def start_server(port, database, pool_size, cache):
+    env = dict(os.environ, DB_NAME=database, DB_POOL_MAX_SIZE=str(pool_size),
+               PIVOT_CACHE_ENABLED="true" if cache else "false")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if httpx.get(f"{base_url}/api/v1/status", timeout=5).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Servidor do banco '{database}' não respondeu em {base_url}")
+
+
+def _summary(samples, elapsed=None):
+    """ Latências (ms) e status de uma lista de (latência, status). """
+    latencies = [latency for latency, _ in samples]
+    statuses = Counter(str(status) for _, status in samples)
+    summary = {
+        "requests": len(samples),
+        "errors": sum(count for status, count in statuses.items() if status != "200"),
+        "status": dict(sorted(statuses.items())),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "max_ms": round(max(latencies), 2) if latencies else 0.0,
+    }
+    if elapsed is not None:
+        summary["elapsed_s"] = round(elapsed, 3)
+        summary["throughput_rps"] = round(len(samples) / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+async def replay(base_url, payloads, rounds, concurrency, seed):
+    """ Reproduz `rounds` vezes o workload (ordem embaralhada por rodada). """
+    fingerprints = [query_fingerprint(p["metric"], p["group_by"], p["filters"]) for p in payloads]
+    schedule = []
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        order = list(range(len(payloads)))
+        rng.shuffle(order)
+        schedule.extend(order)
+
+    samples = [None] * len(schedule)
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def one(slot, index):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/api/v1/analytics/pivot", json=payloads[index])
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = "connection_error"
+                samples[slot] = ((time.perf_counter() - start) * 1000, status)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(slot, index) for slot, index in enumerate(schedule)))
+        elapsed = time.perf_counter() - start
+
+    # Quebra por fingerprint (a agregação não muda o fingerprint: fica listada à parte)
+    by_fingerprint = {}
+    for slot, index in enumerate(schedule):
+        fingerprint = fingerprints[index]
+        entry = by_fingerprint.setdefault(fingerprint["id"], {
+            "fingerprint": fingerprint, "agg_funcs": set(), "samples": [],
+        })
+        entry["agg_funcs"].add(payloads[index]["agg_func"])
+        entry["samples"].append(samples[slot])
+
+    return {
+        "overall": _summary(samples, elapsed),
+        "fingerprints": {
+            fingerprint_id: {
+                **{key: value for key, value in entry["fingerprint"].items() if key != "id"},
+                "agg_funcs": sorted(entry["agg_funcs"]),
+                **_summary(entry["samples"]),
+            }
+            for fingerprint_id, entry in sorted(by_fingerprint.items())
+        },
+    }
+
+
+# =======================================================================
+# 4. COMPARAÇÃO
+# =======================================================================
+
+def _regressed(baseline, current, tolerance, min_delta_ms):
+    """ Piora de p95 acima da tolerância (e do piso de ruído) ou aumento da taxa de erro. """
+    reasons = []
+    delta = current["p95_ms"] - baseline["p95_ms"]
+    if delta > min_delta_ms and current["p95_ms"] > baseline["p95_ms"] * (1 + tolerance):
+        reasons.append(f"p95 {baseline['p95_ms']} -> {current['p95_ms']} ms")
+    baseline_rate = baseline["errors"] / baseline["requests"] if baseline["requests"] else 0.0
+    current_rate = current["errors"] / current["requests"] if current["requests"] else 0.0
+    if current_rate > baseline_rate + 1e-9:
+        reasons.append(f"erros {baseline_rate:.1%} -> {current_rate:.1%}")
+    return reasons
+
+
+def compare_runs(baseline, current, tolerance, min_delta_ms):
+    """ Regressões por escala: totais (p95, throughput, erros) e cada fingerprint em comum. """
+    regressions = []
+    for scale, result in current["results"].items():
+        previous = baseline["results"].get(scale)
+        if previous is None:
+            print(f"  {scale}: sem baseline, ignorado")
+            continue
+        before, after = previous["overall"], result["overall"]
+        print(f"  {scale}: p50 {before['p50_ms']} -> {after['p50_ms']} ms, "
+              f"p95 {before['p95_ms']} -> {after['p95_ms']} ms, "
+              f"p99 {before['p99_ms']} -> {after['p99_ms']} ms, "
+              f"{before['throughput_rps']} -> {after['throughput_rps']} req/s")
+
+        reasons = _regressed(before, after, tolerance, min_delta_ms)
+        if after["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            reasons.append(f"throughput {before['throughput_rps']} -> {after['throughput_rps']} req/s")
+        if reasons:
+            regressions.append({"scale": scale, "fingerprint": None, "reasons": reasons})
+
+        for fingerprint_id, entry in result["fingerprints"].items():
+            previous_entry = previous["fingerprints"].get(fingerprint_id)
+            if previous_entry is None:
+                continue
+            reasons = _regressed(previous_entry, entry, tolerance, min_delta_ms)
+            if reasons:
+                regressions.append({"scale": scale, "fingerprint": fingerprint_id,
+                                    "group_by": entry["group_by"], "metric": entry["metric"],
+                                    "filter_keys": entry["filter_keys"], "reasons": reasons})
+
+    for regression in regressions:
+        target = "total" if regression["fingerprint"] is None else (
+            f"[{regression['fingerprint']}] {regression['metric']} BY {regression['group_by']} "
+            f"filtros={regression['filter_keys']}"
+        )
+        print(f"  ✗ {regression['scale']} {target}: {'; '.join(regression['reasons'])}")
+    if not regressions:
+        print(f"  ✓ Nenhuma regressão (tolerância {tolerance:.0%}, piso {min_delta_ms} ms)")
+    return regressions
+
+
+# =======================================================================
+# 5. CLI
+# =======================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the Dashboard workload against /analytics/pivot')
+    parser.add_argument('--scales', help='Fatores de escala separados por vírgula (ex: 0.25,1,2); '
+                                         'padrão: banco atual (DB_NAME)')
+    parser.add_argument('--reseed', action='store_true', help='Recria os bancos das escalas mesmo se já populados')
+    parser.add_argument('--data-seed', type=int, default=42, help='Seed do generate_data.py')
+    parser.add_argument('--engine', choices=['rows', 'columnar'], default='rows',
+                        help='Engine do generate_data.py')
+    parser.add_argument('--workers', type=int, default=1, help='Processos do generate_data.py')
+    parser.add_argument('--base-url', help='Servidor já em execução (não sobe uvicorn; incompatível com --scales)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Requisições simultâneas')
+    parser.add_argument('--rounds', type=int, default=3, help='Repetições do workload completo')
+    parser.add_argument('--seed', type=int, default=0, help='Seed da ordem das requisições')
+    parser.add_argument('--cache', action='store_true',
+                        help='Mantém o cache do pivot ligado (padrão: desligado, mede o motor)')
+    parser.add_argument('--pool-size', type=int, default=20, help='DB_POOL_MAX_SIZE do servidor de teste')
+    parser.add_argument('--port', type=int, default=8200, help='Porta do servidor de teste')
+    parser.add_argument('--output', help='Arquivo JSON para salvar o resultado')
+    parser.add_argument('--baseline', help='Resultado anterior (JSON) para detectar regressões')
+    parser.add_argument('--current', help='Com --baseline: compara este arquivo sem rodar o replay')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Piora relativa aceita (0.10 = 10%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='Diferença absoluta de p95 abaixo da qual não há regressão (ruído)')
+    args = parser.parse_args()
+    if args.current and not args.baseline:
+        parser.error('--current requer --baseline')
+    if args.base_url and args.scales:
+        parser.error('--base-url não pode ser usado com --scales')
+
+    if args.current:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        print(f"Comparação {args.baseline} -> {args.current}:")
+        sys.exit(1 if compare_runs(baseline, current, args.tolerance, args.min_delta_ms) else 0)
+
+    payloads = load_workload()
+    print(f"Workload: {len(payloads)} combinações x {args.rounds} rodadas, concorrência {args.concurrency}")
+
+    if args.scales:
+        scales = [float(scale) for scale in args.scales.split(',')]
+        targets = [(f"sf{format(scale, 'g')}",
+                    seed_database(scale, args.data_seed, args.engine, args.workers, args.reseed))
+                   for scale in scales]
+    else:
+        targets = [("current", DB_NAME)]
+
+    results = {}
+    for label, database in targets:
+        process = None
+        base_url = args.base_url
+        if base_url is None:
+            process, base_url = start_server(args.port, database, args.pool_size, args.cache)
+        try:
+            # Aquecimento: uma passada por combinação (planos, conexões do pool, cache do Postgres)
+            asyncio.run(replay(base_url, payloads, 1, args.concurrency, args.seed))
+            result = asyncio.run(replay(base_url, payloads, args.rounds, args.concurrency, args.seed))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+        result["database"] = database
+        result["sales"] = count_sales(database) if args.base_url is None else None
+        results[label] = result
+
+    print(f"{'escala':<10} {'vendas':>10} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>6}")
+    for label, result in results.items():
+        r = result["overall"]
+        sales = f"{result['sales']:,}" if result["sales"] is not None else "-"
+        print(f"{label:<10} {sales:>10} {r['throughput_rps']:>8} {r['p50_ms']:>9} "
+              f"{r['p95_ms']:>9} {r['p99_ms']:>9} {r['errors']:>6}")
+
+    for label, result in results.items():
+        print(f"\nPiores fingerprints por p95 ({label}):")
+        worst = sorted(result["fingerprints"].items(), key=lambda item: item[1]["p95_ms"], reverse=True)[:5]
+        for fingerprint_id, entry in worst:
+            print(f"  [{fingerprint_id}] {entry['metric']} BY {entry['group_by']} "
+                  f"filtros={entry['filter_keys']}: p95 {entry['p95_ms']} ms, status {entry['status']}")
+
+    output = {"config": vars(args), "workload_size": len(payloads), "results": results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"\n✓ Resultado salvo em {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparação com {args.baseline}:")
+        if compare_runs(baseline, output, args.tolerance, args.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+-- Pacote de índices do motor de queries (gerado por: python -m backend.index_advisor --emit-sql)
+-- Executado após o schema na inicialização do container do Postgres.
+
+-- JOIN 'payments': pay.sale_id
+CREATE INDEX IF NOT EXISTS idx_payments_sale_id ON payments (sale_id);
+-- JOIN 'items_custom': ps.sale_id
+CREATE INDEX IF NOT EXISTS idx_product_sales_sale_id ON product_sales (sale_id);
+-- JOIN 'items_custom': ips.product_sale_id
+CREATE INDEX IF NOT EXISTS idx_item_product_sales_product_sale_id ON item_product_sales (product_sale_id);
+-- JOIN 'delivery_addresses': da.sale_id
+CREATE INDEX IF NOT EXISTS idx_delivery_addresses_sale_id ON delivery_addresses (sale_id);
+-- semi-join 'delivery_type': ds.sale_id
+CREATE INDEX IF NOT EXISTS idx_delivery_sales_sale_id ON delivery_sales (sale_id);
+-- filtro date_range + vendas concluídas (cobre pivots por loja/canal/data sem visitar o heap)
+CREATE INDEX IF NOT EXISTS idx_sales_created_at_completed ON sales (created_at) INCLUDE (id, store_id, channel_id, total_amount) WHERE sale_status_desc = 'COMPLETED';
+-- filtro store_ids (+ date_range) em vendas concluídas
+CREATE INDEX IF NOT EXISTS idx_sales_store_id_created_at_completed ON sales (store_id, created_at) WHERE sale_status_desc = 'COMPLETED';
+-- filtro channel_ids (+ date_range) em vendas concluídas
+CREATE INDEX IF NOT EXISTS idx_sales_channel_id_created_at_completed ON sales (channel_id, created_at) WHERE sale_status_desc = 'COMPLETED';
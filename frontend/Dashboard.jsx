@@ -13,14 +13,16 @@ const TABS = [
 ];
 
 /*
- * - Faz o fetch inicial dos metadados (lojas e canais)
+ * - Faz o fetch inicial dos metadados (lojas, canais e demais dimensões dos filtros)
  * - Gerencia as abas e passa os metadados para os componentes filhos
 */
 const Dashboard = () => {
   // Estado de controle de abas
   const [activeTab, setActiveTab] = useState("home");
 
-  const [metadata, setMetadata] = useState({ stores: [], channels: [] });
+  const [metadata, setMetadata] = useState({
+    stores: [], channels: [], sub_brands: [], payment_types: [], categories: [], cities: [],
+  });
 
   // Carrega metadados apenas uma vez ao montar o componente
   useEffect(() => {
@@ -1,7 +1,8 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { METRICS_CONFIG } from './analytics_config.js'; 
 
-const API_URL = 'http://localhost:8000/api/v1/analytics/pivot';
+// Todas as métricas do ranking vão em uma única chamada (o backend funde as queries)
+const API_URL = 'http://localhost:8000/api/v1/analytics/pivot/batch';
 
 // Métricas que queremos ranquear (Top 5)
 const RANK_METRICS = [
@@ -28,23 +29,20 @@ const StoreRankingTab = () => {
 
     const fetchRankings = useCallback(async () => {
         setLoading(true);
-        const fetches = RANK_METRICS.map(m => {
-            const payload = {
-                metric: m.metric,
-                agg_func: m.agg,
-                group_by: 'stores.name',
-                filters: { date_range: 'last_6m' }
-            };
-            return fetch(API_URL, {
+        const requests = RANK_METRICS.map(m => ({
+            metric: m.metric,
+            agg_func: m.agg,
+            group_by: 'stores.name',
+            filters: { date_range: 'last_6m' }
+        }));
+
+        try {
+            const response = await fetch(API_URL, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(payload),
+                body: JSON.stringify({ requests }),
             });
-        });
-
-        try {
-            const responses = await Promise.all(fetches);
-            const results = await Promise.all(responses.map(res => res.json()));
+            const { results } = await response.json();
             
             const compiledRankings = results.map((result, index) => ({
                 ...RANK_METRICS[index],
@@ -26,6 +26,13 @@ export const METRICS_CONFIG = [
         format: 'number',
         description: 'Contagem de pedidos concluídos.'
     },
+    {
+        label: 'Clientes Únicos',
+        metric: 'customer_id',
+        agg: 'COUNT_DISTINCT',
+        format: 'number',
+        description: 'Clientes identificados distintos com pedidos concluídos.'
+    },
     // ------------------------------------
     // Métricas Operacionais / Margem
     // ------------------------------------
@@ -36,6 +43,20 @@ export const METRICS_CONFIG = [
         format: 'minutes',
         description: 'Média do tempo entre o pedido e o despacho.'
     },
+    {
+        label: 'Tempo de Preparo P90 (min)',
+        metric: 'production_seconds',
+        agg: 'P90',
+        format: 'minutes',
+        description: '90% dos pedidos concluídos são preparados em até este tempo.'
+    },
+    {
+        label: 'Tempo de Entrega P90 (min)',
+        metric: 'delivery_seconds',
+        agg: 'P90',
+        format: 'minutes',
+        description: '90% das entregas são concluídas em até este tempo.'
+    },
     {
         label: 'Receita de Customizações (R$)',
         metric: 'items.additional_price',
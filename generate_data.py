@@ -4,14 +4,29 @@ God Level Coder Challenge - Data Generator
 Generates realistic restaurant data based on Arcca's actual models
 """
 
+import io
+import os
+import json
 import random
+import time
+import hashlib
 import argparse
+import itertools
+import multiprocessing
 from datetime import datetime, timedelta
+from itertools import accumulate
 from decimal import Decimal
 import psycopg2
 from psycopg2.extras import execute_batch
 from faker import Faker
 
+from backend.copy_format import copy_value
+
+try:
+    import numpy as np
+except ImportError:  # only needed by --engine columnar
+    np = None
+
 fake = Faker('pt_BR')
 
 # Configurations
@@ -82,6 +97,137 @@ def get_hour_weight(hour):
     return 0.01
 
 
+# =======================================================================
+# Synthetic text pools
+# =======================================================================
+
+TEXT_POOL_VERSION = 1
+TEXT_POOL_SIZES = {'names': 20000, 'phones': 20000, 'streets': 5000, 'postcodes': 20000}
+POOL_CITIES = 60
+NEIGHBORHOODS_PER_CITY = 40
+ZIPF_EXPONENT = 1.1
+
+
+def zipf_weights(size, exponent=ZIPF_EXPONENT):
+    """Weight of rank 1..size under a Zipf law (rank 1 is the most frequent)"""
+    return [1.0 / rank ** exponent for rank in range(1, size + 1)]
+
+
+def _unique_values(factory, size, max_attempts=None):
+    """Up to `size` distinct values from factory(), in generation order"""
+    values = {}
+    attempts, max_attempts = 0, max_attempts or size * 3
+    while len(values) < size and attempts < max_attempts:
+        values[factory()] = None
+        attempts += 1
+    return list(values)
+
+
+class TextPools:
+    """
+    Deduplicated pools of Faker values, built once per run (optionally cached on
+    disk) and sampled instead of calling Faker per row.
+
+    Addresses are skewed: cities follow a Zipf law and each city has its own
+    Zipf-ranked neighborhoods, so address.neighborhood pivots have a realistic
+    long tail. Scalar helpers use the `random` module (seeded per day); the
+    sample_* helpers take a NumPy Generator (columnar engine).
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.city_cum_weights = list(accumulate(zipf_weights(len(data['cities']))))
+        self.neighborhood_cum_weights = list(accumulate(zipf_weights(NEIGHBORHOODS_PER_CITY)))
+        self._arrays = None
+
+    @classmethod
+    def cache_key(cls, seed):
+        return {'version': TEXT_POOL_VERSION, 'seed': seed, 'locale': 'pt_BR', 'sizes': TEXT_POOL_SIZES,
+                'cities': POOL_CITIES, 'neighborhoods': NEIGHBORHOODS_PER_CITY}
+
+    @classmethod
+    def build(cls, seed):
+        # Separate Faker instance: building (or loading) pools never shifts the main generator
+        pool_fake = Faker('pt_BR')
+        pool_fake.seed_instance(derive_seed(seed, 'text-pools'))
+        rng = random.Random(derive_seed(seed, 'text-pools'))
+
+        data = {pool: _unique_values(getattr(pool_fake, factory), TEXT_POOL_SIZES[pool]) for pool, factory in (
+            ('names', 'name'), ('phones', 'phone_number'), ('streets', 'street_name'), ('postcodes', 'postcode')
+        )}
+        data['cities'] = _unique_values(pool_fake.city, POOL_CITIES)
+        data['city_states'] = [pool_fake.estado_sigla() for _ in data['cities']]
+        data['neighborhoods'] = []
+        for _ in data['cities']:
+            neighborhoods = _unique_values(pool_fake.bairro, NEIGHBORHOODS_PER_CITY)
+            rng.shuffle(neighborhoods)
+            # Faker's bairro list is finite: repeat if a city could not get enough distinct names
+            data['neighborhoods'].append(list(itertools.islice(itertools.cycle(neighborhoods), NEIGHBORHOODS_PER_CITY)))
+        return cls(data)
+
+    @classmethod
+    def load_or_build(cls, seed, cache_path=None):
+        """Pools for `seed`, read from cache_path when it holds the same key (rebuilt and saved otherwise)"""
+        key = cls.cache_key(seed)
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('key') == key:
+                print(f"✓ Text pools loaded from {cache_path}")
+                return cls(cached['data'])
+
+        started = time.perf_counter()
+        pools = cls.build(seed)
+        print(f"✓ Text pools built in {time.perf_counter() - started:.1f}s "
+              f"({sum(len(v) for k, v in pools.data.items() if k in TEXT_POOL_SIZES):,} values)")
+        if cache_path:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'data': pools.data}, f, ensure_ascii=False)
+        return pools
+
+    # Scalar sampling (row engine, stores, customers)
+    def name(self):
+        return random.choice(self.data['names'])
+
+    def phone(self):
+        return random.choice(self.data['phones'])
+
+    def street(self):
+        return random.choice(self.data['streets'])
+
+    def postcode(self):
+        return random.choice(self.data['postcodes'])
+
+    def address(self):
+        """(neighborhood, city, state)"""
+        city = random.choices(range(len(self.data['cities'])), cum_weights=self.city_cum_weights)[0]
+        rank = random.choices(range(NEIGHBORHOODS_PER_CITY), cum_weights=self.neighborhood_cum_weights)[0]
+        return self.data['neighborhoods'][city][rank], self.data['cities'][city], self.data['city_states'][city]
+
+    # Vector sampling (columnar engine)
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {pool: np.array(values, dtype=object) for pool, values in self.data.items()
+                            if pool != 'neighborhoods'}
+            self._arrays['neighborhoods'] = np.array(self.data['neighborhoods'], dtype=object)
+            city_p = np.array(zipf_weights(len(self.data['cities'])))
+            rank_p = np.array(zipf_weights(NEIGHBORHOODS_PER_CITY))
+            self._arrays['city_p'] = city_p / city_p.sum()
+            self._arrays['rank_p'] = rank_p / rank_p.sum()
+        return self._arrays
+
+    def sample(self, rng, pool, size):
+        values = self.arrays()[pool]
+        return values[rng.integers(0, len(values), size)]
+
+    def sample_addresses(self, rng, size):
+        """(neighborhoods, cities, states) arrays"""
+        arrays = self.arrays()
+        city = rng.choice(len(arrays['cities']), size, p=arrays['city_p'])
+        rank = rng.choice(NEIGHBORHOODS_PER_CITY, size, p=arrays['rank_p'])
+        return arrays['neighborhoods'][city, rank], arrays['cities'][city], arrays['city_states'][city]
+
+
 def setup_base_data(conn):
     """Create brands, channels, payment types"""
     print("Setting up base data...")
@@ -130,16 +276,15 @@ def setup_base_data(conn):
     return sub_brand_ids, channel_ids
 
 
-def generate_stores(conn, sub_brand_ids, num_stores=50):
-    """Generate realistic stores"""
+def generate_stores(conn, sub_brand_ids, pools, num_stores=50, now=None):
+    """Generate realistic stores (dates relative to `now`, addresses from the text pools)"""
     print(f"Generating {num_stores} stores...")
     cursor = conn.cursor()
     stores = []
-    
-    cities = [fake.city() for _ in range(20)]
+    now = now or datetime.now()
     
     for i in range(num_stores):
-        city = random.choice(cities)
+        district, city, state = pools.address()
         sub_brand_id = random.choice(sub_brand_ids)
         is_active = random.random() > 0.1
         is_own = random.random() > 0.7
@@ -160,13 +305,13 @@ def generate_stores(conn, sub_brand_ids, num_stores=50):
         """, (
             BRAND_ID, sub_brand_id,
             f"{fake.company()} - {city}",
-            city, fake.estado_sigla(), fake.bairro(),
-            fake.street_name(), random.randint(10, 9999),
+            city, state, district,
+            pools.street(), random.randint(10, 9999),
             Decimal(str(round(base_lat, 6))),
             Decimal(str(round(base_long, 6))),
             is_active, is_own,
-            fake.date_between(start_date='-2y', end_date='-6m'),
-            datetime.now() - timedelta(days=random.randint(180, 720))
+            fake.date_between(start_date=now.date() - timedelta(days=730), end_date=now.date() - timedelta(days=182)),
+            now - timedelta(days=random.randint(180, 720))
         ))
         stores.append(cursor.fetchone()[0])
     
@@ -279,21 +424,22 @@ def generate_products_and_items(conn, sub_brand_ids, num_products=500, num_items
     return products, items, option_groups
 
 
-def generate_customers(conn, num_customers=10000):
-    """Generate customers"""
+def generate_customers(conn, pools, num_customers=10000, now=None):
+    """Generate customers (dates relative to `now`, names and phones from the text pools)"""
     print(f"Generating {num_customers} customers...")
     cursor = conn.cursor()
+    now = now or datetime.now()
     
     batch = []
     for _ in range(num_customers):
         batch.append((
-            fake.name(), fake.email(), fake.phone_number(), fake.cpf(),
-            fake.date_of_birth(minimum_age=18, maximum_age=75),
+            pools.name(), fake.email(), pools.phone(), fake.cpf(),
+            fake.date_between(start_date=now.date() - timedelta(days=75 * 365), end_date=now.date() - timedelta(days=18 * 365)),
             random.choice(['M', 'F', 'NB', 'O']),
             random.choice([True, False]),
             random.choice([True, False, False]),  # 33% accept email
             random.choice(['qr_code', 'link', 'balcony', 'pos']),
-            datetime.now() - timedelta(days=random.randint(0, 720))
+            now - timedelta(days=random.randint(0, 720))
         ))
     
     execute_batch(cursor, """
@@ -303,7 +449,7 @@ def generate_customers(conn, num_customers=10000):
         ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     """, batch, page_size=1000)
     
-    cursor.execute("SELECT id FROM customers")
+    cursor.execute("SELECT id FROM customers ORDER BY id")
     customer_ids = [row[0] for row in cursor.fetchall()]
     
     conn.commit()
@@ -311,91 +457,243 @@ def generate_customers(conn, num_customers=10000):
     return customer_ids
 
 
-def generate_sales(conn, stores, channels, products, items, option_groups, customers, months=6):
-    """Generate sales with realistic patterns"""
-    print(f"Generating sales for {months} months...")
-    
+# Upper bound of child rows per sale (see generate_single_sale): used to carve
+# deterministic per-day id ranges for the bulk loader
+CHILD_ROWS_PER_SALE = {
+    'sales': 1,
+    'product_sales': 5,
+    'item_product_sales': 5 * 4,
+    'delivery_sales': 1,
+    'delivery_addresses': 1,
+    'payments': 2,
+}
+
+HOUR_CUM_WEIGHTS = list(accumulate(get_hour_weight(h) * 100 for h in range(24)))
+
+
+def derive_seed(seed, *parts):
+    """Deterministic sub-seed for a (seed, shard/day/...) combination"""
+    digest = hashlib.sha256(':'.join(map(str, (seed,) + parts)).encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def seed_generators(seed):
+    random.seed(seed)
+    fake.seed_instance(seed)
+
+
+def daily_sales_count(rng, day, anomaly_week, promo_day):
+    """Number of sales of a day (first draw after the day's seed)"""
+    day_mult = WEEKDAY_MULT[day.weekday()]
+
+    # Anomaly: bad week
+    if anomaly_week <= day < anomaly_week + timedelta(days=7):
+        day_mult *= 0.7
+
+    # Anomaly: promo day
+    if day.date() == promo_day.date():
+        day_mult *= 3.0
+
+    return int(rng.gauss(2700, 400) * day_mult)
+
+
+def plan_sales_days(conn, seed, start_date, end_date, anomaly_week, promo_day, with_id_ranges):
+    """
+    One entry per day: (day, number of sales, first id of each table or None).
+
+    Sales counts come from each day's own seed, so the plan is the same whatever
+    the number of workers; every day owns an id range sized for its worst case.
+    """
+    next_ids = None
+    if with_id_ranges:
+        cursor = conn.cursor()
+        next_ids = {}
+        for table in CHILD_ROWS_PER_SALE:
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+            next_ids[table] = cursor.fetchone()[0]
+
+    plan = []
+    day = start_date
+    while day <= end_date:
+        count = max(0, daily_sales_count(random.Random(derive_seed(seed, day.date())), day, anomaly_week, promo_day))
+        id_starts = None
+        if next_ids is not None:
+            id_starts = dict(next_ids)
+            for table, per_sale in CHILD_ROWS_PER_SALE.items():
+                next_ids[table] += count * per_sale
+        plan.append((day, count, id_starts))
+        day += timedelta(days=1)
+    return plan
+
+
+def generate_sales_days(conn, context, days, loader='copy', label=''):
+    """Generate and load the given (day, count, id_starts) entries; returns (sales, loader stats)"""
     cursor = conn.cursor()
-    start_date = datetime.now() - timedelta(days=30 * months)
-    end_date = datetime.now()
-    
-    # Anomalies
-    anomaly_week = start_date + timedelta(days=random.randint(30, 60))
-    promo_day = start_date + timedelta(days=random.randint(90, 120))
-    
-    current_date = start_date
+    copy_loader = CopyLoader(conn, context['partitioned']) if loader == 'copy' else None
+    stores, channels, customers = context['stores'], context['channels'], context['customers']
+    channel_cum_weights = list(accumulate(c['weight'] for c in channels))
+    product_cum_weights = list(accumulate(p['popularity'] for p in context['products']))
     total_sales = 0
     batch_size = 500
-    
-    while current_date <= end_date:
-        weekday = current_date.weekday()
-        day_mult = WEEKDAY_MULT[weekday]
-        
-        # Anomaly: bad week
-        if anomaly_week <= current_date < anomaly_week + timedelta(days=7):
-            day_mult *= 0.7
-        
-        # Anomaly: promo day
-        if current_date.date() == promo_day.date():
-            day_mult *= 3.0
-        
-        daily_sales = int(random.gauss(2700, 400) * day_mult)
-        
+
+    def load_batch(batch):
+        if copy_loader:
+            for sale in batch:
+                copy_loader.add_sale(sale)
+        else:
+            insert_sales_batch(cursor, batch, context['items'], context['option_groups'], context['partitioned'])
+            conn.commit()
+
+    if context['engine'] == 'columnar':
+        catalog = build_columnar_catalog(context)
+        for current_date, daily_sales, id_starts in days:
+            rng = np.random.default_rng(derive_seed(context['seed'], 'columnar', current_date.date()))
+            copy_loader.add_columns(synthesize_sales_day(
+                catalog, rng, current_date, daily_sales, id_starts, context['partitioned']
+            ))
+            total_sales += daily_sales
+            if (current_date + timedelta(days=1)).day == 1:
+                print(f"  → {label}{current_date.strftime('%B %Y')}: {total_sales:,} sales")
+        copy_loader.flush()
+        return total_sales, (copy_loader.rows, copy_loader.seconds)
+
+    for current_date, _, id_starts in days:
+        # Every day has its own seed: its data does not depend on how days are sharded
+        seed_generators(derive_seed(context['seed'], current_date.date()))
+        daily_sales = daily_sales_count(random, current_date, context['anomaly_week'], context['promo_day'])
+        if copy_loader:
+            copy_loader.use_id_ranges(id_starts)
+
         sales_batch = []
-        
+
         for _ in range(daily_sales):
             # Hour distribution
-            hour_weights = [get_hour_weight(h) * 100 for h in range(24)]
-            hour = random.choices(range(24), weights=hour_weights)[0]
-            
+            hour = random.choices(range(24), cum_weights=HOUR_CUM_WEIGHTS)[0]
+
             sale_time = current_date.replace(
                 hour=hour,
                 minute=random.randint(0, 59),
-                second=random.randint(0, 59)
+                second=random.randint(0, 59),
+                microsecond=0
             )
-            
+
             # Select entities
             store_id = random.choice(stores)
-            channel = random.choices(channels, weights=[c['weight'] for c in channels])[0]
+            channel = random.choices(channels, cum_weights=channel_cum_weights)[0]
             customer_id = random.choice(customers) if random.random() > 0.3 else None
-            
+
             # Generate sale
             sale_data = generate_single_sale(
-                sale_time, store_id, channel, customer_id, 
-                products, items, option_groups
+                sale_time, store_id, channel, customer_id,
+                context['products'], context['items'], context['option_groups'], context['pools'],
+                product_cum_weights
             )
-            
+
             sales_batch.append(sale_data)
-            
+
             if len(sales_batch) >= batch_size:
-                insert_sales_batch(cursor, sales_batch, items, option_groups)
+                load_batch(sales_batch)
                 total_sales += len(sales_batch)
                 sales_batch = []
-                conn.commit()
-        
+
         # Insert remaining
         if sales_batch:
-            insert_sales_batch(cursor, sales_batch, items, option_groups)
+            load_batch(sales_batch)
             total_sales += len(sales_batch)
-            conn.commit()
-        
-        current_date += timedelta(days=1)
-        
-        if current_date.day == 1:
-            print(f"  → {current_date.strftime('%B %Y')}: {total_sales:,} sales")
-    
-    print(f"✓ {total_sales:,} total sales generated")
+
+        if (current_date + timedelta(days=1)).day == 1:
+            print(f"  → {label}{current_date.strftime('%B %Y')}: {total_sales:,} sales")
+
+    if copy_loader:
+        copy_loader.flush()
+        return total_sales, (copy_loader.rows, copy_loader.seconds)
+    return total_sales, None
+
+
+def _sales_worker(args):
+    """Process entry point for --workers: one connection and one CopyLoader per shard"""
+    db_url, context, days, label = args
+    conn = get_db_connection(db_url)
+    try:
+        return generate_sales_days(conn, context, days, 'copy', label)
+    finally:
+        conn.close()
+
+
+def generate_sales(conn, stores, channels, products, items, option_groups, customers, pools, months=6,
+                   loader='copy', workers=1, seed=0, db_url=None, end_date=None, engine='rows'):
+    """Generate sales with realistic patterns.
+
+    loader='copy' streams rows through CopyLoader (COPY FROM STDIN);
+    loader='insert' keeps the row-by-row INSERT path. With workers > 1 the days
+    are split into contiguous shards, each generated and copied by its own process.
+    Days are seeded from `seed`, so the same seed and end date reproduce the same data.
+    engine='columnar' draws whole days as NumPy arrays (synthesize_sales_day).
+    """
+    print(f"Generating sales for {months} months ({engine} engine, {loader} loader, "
+          f"{workers} worker(s), seed {seed})...")
+
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    # Days start at midnight: without --end-date only the calendar day varies between runs
+    end_date = (end_date or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = end_date - timedelta(days=30 * months)
+
+    # Anomalies
+    anomalies = random.Random(derive_seed(seed, 'anomalies'))
+    anomaly_week = start_date + timedelta(days=anomalies.randint(30, 60))
+    promo_day = start_date + timedelta(days=anomalies.randint(90, 120))
+
+    context = {
+        'stores': stores, 'channels': channels, 'products': products, 'items': items,
+        'option_groups': option_groups, 'customers': customers, 'pools': pools, 'seed': seed,
+        'anomaly_week': anomaly_week, 'promo_day': promo_day,
+        'partitioned': is_sales_partitioned(cursor), 'engine': engine,
+    }
+    cursor.execute("SELECT description, MIN(id) FROM payment_types GROUP BY description")
+    context['payment_type_ids'] = dict(cursor.fetchall())
+    days = plan_sales_days(conn, seed, start_date, end_date, anomaly_week, promo_day, loader == 'copy')
+
+    if workers > 1:
+        shard_size = -(-len(days) // workers)
+        shards = [days[i:i + shard_size] for i in range(0, len(days), shard_size)]
+        with multiprocessing.Pool(len(shards)) as pool:
+            results = pool.map(_sales_worker, [
+                (db_url, context, shard, f"[shard {index + 1}/{len(shards)}] ")
+                for index, shard in enumerate(shards)
+            ])
+    else:
+        results = [generate_sales_days(conn, context, days, loader)]
+
+    if loader == 'copy':
+        # Ids were assigned client-side: move the sequences past the highest id used
+        for table in CHILD_ROWS_PER_SALE:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST(MAX(id), 1)) FROM {table}"
+            )
+        conn.commit()
+
+    total_sales = sum(sales for sales, _ in results)
+    elapsed = time.perf_counter() - started
+    print(f"✓ {total_sales:,} total sales generated in {elapsed:.1f}s ({total_sales / elapsed:,.0f} sales/s)")
+    if loader == 'copy':
+        rows = {table: sum(stats[0][table] for _, stats in results) for table in COPY_COLUMNS}
+        seconds = {table: sum(stats[1][table] for _, stats in results) for table in COPY_COLUMNS}
+        report_copy_throughput(rows, seconds)
     return total_sales
 
 
-def generate_single_sale(sale_time, store_id, channel, customer_id, products, items, option_groups):
+def generate_single_sale(sale_time, store_id, channel, customer_id, products, items, option_groups, pools,
+                         product_cum_weights=None):
     """Generate a single sale with all related data"""
     
     # Select 1-5 products
     num_products = min(5, max(1, int(random.expovariate(0.5)) + 1))
+    if product_cum_weights is None:
+        product_cum_weights = list(accumulate(p['popularity'] for p in products))
     selected_products = random.choices(
         products,
-        weights=[p['popularity'] for p in products],
+        cum_weights=product_cum_weights,
         k=num_products
     )
     
@@ -476,22 +774,23 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
         lat = -23.5 + random.uniform(-10, 5)  # -33.5 to -18.5 (covers Brazil)
         long = -46.6 + random.uniform(-10, 10)  # -56.6 to -36.6
         
+        neighborhood, city, state = pools.address()
         delivery_data = {
-            'courier_name': fake.name(),
-            'courier_phone': fake.phone_number(),
+            'courier_name': pools.name(),
+            'courier_phone': pools.phone(),
             'courier_type': random.choice(COURIER_TYPES),
             'delivery_type': random.choice(DELIVERY_TYPES),
             'status': 'DELIVERED',
             'delivery_fee': delivery_fee,
             'courier_fee': round(delivery_fee * 0.6, 2),
             'address': {
-                'street': fake.street_name(),
+                'street': pools.street(),
                 'number': str(random.randint(10, 9999)),
                 'complement': random.choice(['Apto 101', 'Casa', 'Bloco A', 'Fundos', None, None]) if random.random() > 0.5 else None,
-                'neighborhood': fake.bairro(),
-                'city': fake.city(),
-                'state': fake.estado_sigla(),
-                'postal_code': fake.postcode(),
+                'neighborhood': neighborhood,
+                'city': city,
+                'state': state,
+                'postal_code': pools.postcode(),
                 'latitude': lat,
                 'longitude': long
             }
@@ -514,7 +813,7 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
     return {
         'store_id': store_id,
         'customer_id': customer_id,
-        'customer_name': fake.name() if not customer_id else None,
+        'customer_name': pools.name() if not customer_id else None,
         'channel_id': channel['id'],
         'created_at': sale_time,
         'status': status,
@@ -535,8 +834,23 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
     }
 
 
-def insert_sales_batch(cursor, sales_batch, items, option_groups):
-    """Insert batch of sales with all related data"""
+def is_sales_partitioned(cursor):
+    """True when the schema was migrated to the partitioned layout (python -m backend.partitioning migrate)"""
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'product_sales' AND column_name = 'sale_created_at'
+        )
+    """)
+    return cursor.fetchone()[0]
+
+
+def insert_sales_batch(cursor, sales_batch, items, option_groups, partitioned=False):
+    """Insert batch of sales with all related data.
+
+    With the partitioned layout, child rows also carry the sale timestamp
+    (sale_created_at), which is their partition key.
+    """
     
     # Insert sales
     sales_data = [(
@@ -573,18 +887,22 @@ def insert_sales_batch(cursor, sales_batch, items, option_groups):
     sale_ids = [row[0] for row in cursor.fetchall()]
     sale_ids.reverse()
     
+    partition_column = ", sale_created_at" if partitioned else ""
+    partition_value = ",%s" if partitioned else ""
+
     # Insert product_sales and related data
     for sale_id, sale in zip(sale_ids, sales_batch):
+        partition_params = (sale['created_at'],) if partitioned else ()
         for prod_data in sale['products']:
-            cursor.execute("""
+            cursor.execute(f"""
                 INSERT INTO product_sales (
-                    sale_id, product_id, quantity, base_price, total_price
-                ) VALUES (%s,%s,%s,%s,%s) RETURNING id
+                    sale_id, product_id, quantity, base_price, total_price{partition_column}
+                ) VALUES (%s,%s,%s,%s,%s{partition_value}) RETURNING id
             """, (
                 sale_id, prod_data['product_id'],
                 prod_data['quantity'], prod_data['base_price'],
                 prod_data['total_price']
-            ))
+            ) + partition_params)
             product_sale_id = cursor.fetchone()[0]
             
             # Insert items for this product
@@ -621,16 +939,16 @@ def insert_sales_batch(cursor, sales_batch, items, option_groups):
             lat = max(-33.0, min(-5.0, addr['latitude']))
             long = max(-74.0, min(-34.0, addr['longitude']))
             
-            cursor.execute("""
+            cursor.execute(f"""
                 INSERT INTO delivery_addresses (
                     sale_id, delivery_sale_id, street, number, complement,
-                    neighborhood, city, state, postal_code, latitude, longitude
-                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                    neighborhood, city, state, postal_code, latitude, longitude{partition_column}
+                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s{partition_value})
             """, (
                 sale_id, delivery_sale_id, addr['street'], addr['number'],
                 addr['complement'], addr['neighborhood'], addr['city'],
                 addr['state'], addr['postal_code'], lat, long
-            ))
+            ) + partition_params)
         
         # Insert payments
         for payment in sale['payments']:
@@ -640,10 +958,375 @@ def insert_sales_batch(cursor, sales_batch, items, option_groups):
             )
             result = cursor.fetchone()
             if result:
-                cursor.execute("""
-                    INSERT INTO payments (sale_id, payment_type_id, value)
-                    VALUES (%s,%s,%s)
-                """, (sale_id, result[0], Decimal(str(payment['value']))))
+                cursor.execute(f"""
+                    INSERT INTO payments (sale_id, payment_type_id, value{partition_column})
+                    VALUES (%s,%s,%s{partition_value})
+                """, (sale_id, result[0], Decimal(str(payment['value']))) + partition_params)
+
+
+# =======================================================================
+# COPY-based bulk loader
+# =======================================================================
+
+# Column order of each table as streamed through COPY (ids are assigned client-side)
+COPY_COLUMNS = {
+    'sales': (
+        'id', 'store_id', 'customer_id', 'channel_id', 'customer_name',
+        'created_at', 'sale_status_desc',
+        'total_amount_items', 'total_discount', 'total_increase',
+        'delivery_fee', 'service_tax_fee', 'total_amount', 'value_paid',
+        'production_seconds', 'delivery_seconds',
+        'discount_reason', 'people_quantity', 'origin'
+    ),
+    'product_sales': ('id', 'sale_id', 'product_id', 'quantity', 'base_price', 'total_price'),
+    'item_product_sales': (
+        'id', 'product_sale_id', 'item_id', 'option_group_id',
+        'quantity', 'additional_price', 'price', 'amount'
+    ),
+    'delivery_sales': (
+        'id', 'sale_id', 'courier_name', 'courier_phone', 'courier_type',
+        'delivery_type', 'status', 'delivery_fee', 'courier_fee'
+    ),
+    'delivery_addresses': (
+        'id', 'sale_id', 'delivery_sale_id', 'street', 'number', 'complement',
+        'neighborhood', 'city', 'state', 'postal_code', 'latitude', 'longitude'
+    ),
+    'payments': ('id', 'sale_id', 'payment_type_id', 'value'),
+}
+# Child tables that carry the sale timestamp in the partitioned layout
+PARTITIONED_CHILDREN = ('product_sales', 'delivery_addresses', 'payments')
+
+class IdRange:
+    """Hands out consecutive ids from a pre-assigned range"""
+
+    def __init__(self, start):
+        self.ids = itertools.count(start)
+
+    def next(self):
+        return next(self.ids)
+
+
+class CopyLoader:
+    """
+    Buffers generated sales as table rows and streams them with COPY FROM STDIN.
+
+    Ids are pre-assigned client-side from the per-day ranges set with use_id_ranges
+    (see plan_sales_days), so child rows never need a RETURNING round trip.
+    Buffers are flushed in foreign key order.
+    """
+
+    def __init__(self, conn, partitioned=False, chunk_rows=50000):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.partitioned = partitioned
+        self.chunk_rows = chunk_rows
+        self.ids = {}
+        self.buffers = {table: [] for table in COPY_COLUMNS}
+        self.rows = {table: 0 for table in COPY_COLUMNS}
+        self.seconds = {table: 0.0 for table in COPY_COLUMNS}
+
+        # Payment type ids are looked up once instead of once per payment
+        self.cursor.execute("SELECT description, MIN(id) FROM payment_types GROUP BY description")
+        self.payment_type_ids = dict(self.cursor.fetchall())
+
+    def use_id_ranges(self, id_starts):
+        """Take the next ids of each table from the given starting points"""
+        self.ids = {table: IdRange(start) for table, start in id_starts.items()}
+
+    def _add(self, table, row, sale=None):
+        if self.partitioned and table in PARTITIONED_CHILDREN:
+            row = row + (sale['created_at'],)
+        self.buffers[table].append('\t'.join(map(copy_value, row)))
+
+    def add_sale(self, sale):
+        sale_id = self.ids['sales'].next()
+        self._add('sales', (
+            sale_id, sale['store_id'], sale['customer_id'], sale['channel_id'],
+            sale['customer_name'], sale['created_at'], sale['status'],
+            sale['total_items_value'], sale['discount'], sale['increase'],
+            sale['delivery_fee'], sale['service_tax'], sale['total_amount'], sale['value_paid'],
+            sale['production_sec'], sale['delivery_sec'],
+            sale['discount_reason'], sale['people_qty'], 'POS'
+        ))
+
+        for prod_data in sale['products']:
+            product_sale_id = self.ids['product_sales'].next()
+            self._add('product_sales', (
+                product_sale_id, sale_id, prod_data['product_id'],
+                prod_data['quantity'], prod_data['base_price'], prod_data['total_price']
+            ), sale)
+            for item_data in prod_data['items']:
+                self._add('item_product_sales', (
+                    self.ids['item_product_sales'].next(), product_sale_id, item_data['item_id'],
+                    item_data['option_group_id'], item_data['quantity'],
+                    item_data['additional_price'], item_data['price'], 1
+                ))
+
+        if sale['delivery']:
+            d = sale['delivery']
+            delivery_sale_id = self.ids['delivery_sales'].next()
+            self._add('delivery_sales', (
+                delivery_sale_id, sale_id, d['courier_name'], d['courier_phone'],
+                d['courier_type'], d['delivery_type'], d['status'],
+                d['delivery_fee'], d['courier_fee']
+            ))
+            addr = d['address']
+            self._add('delivery_addresses', (
+                self.ids['delivery_addresses'].next(), sale_id, delivery_sale_id,
+                addr['street'], addr['number'], addr['complement'], addr['neighborhood'],
+                addr['city'], addr['state'], addr['postal_code'],
+                max(-33.0, min(-5.0, addr['latitude'])), max(-74.0, min(-34.0, addr['longitude']))
+            ), sale)
+
+        for payment in sale['payments']:
+            payment_type_id = self.payment_type_ids.get(payment['type'])
+            if payment_type_id:
+                self._add('payments', (
+                    self.ids['payments'].next(), sale_id, payment_type_id, payment['value']
+                ), sale)
+
+        if any(len(buffer) >= self.chunk_rows for buffer in self.buffers.values()):
+            self.flush()
+
+    def add_columns(self, tables):
+        """Buffer column-shaped rows ({table: [column text, ...]}, see synthesize_sales_day)"""
+        for table, columns in tables.items():
+            self.buffers[table].extend(map('\t'.join, zip(*columns)))
+        if any(len(buffer) >= self.chunk_rows for buffer in self.buffers.values()):
+            self.flush()
+
+    def flush(self):
+        """COPY every buffered row (parents before children) and commit"""
+        for table, buffer in self.buffers.items():
+            if not buffer:
+                continue
+            columns = COPY_COLUMNS[table]
+            if self.partitioned and table in PARTITIONED_CHILDREN:
+                columns = columns + ('sale_created_at',)
+            start = time.perf_counter()
+            self.cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+                io.StringIO('\n'.join(buffer) + '\n')
+            )
+            self.seconds[table] += time.perf_counter() - start
+            self.rows[table] += len(buffer)
+            buffer.clear()
+        self.conn.commit()
+
+    def report(self):
+        report_copy_throughput(self.rows, self.seconds)
+
+
+def report_copy_throughput(rows, seconds):
+    """Rows and COPY rows/s per table (seconds summed over all loader connections)"""
+    print("  COPY throughput:")
+    for table in COPY_COLUMNS:
+        rate = rows[table] / seconds[table] if seconds[table] else 0
+        print(f"    {table:<20} {rows[table]:>12,} rows  {seconds[table]:>8.2f}s  {rate:>12,.0f} rows/s")
+
+
+# =======================================================================
+# Columnar (NumPy) sale synthesis
+# =======================================================================
+
+COMPLEMENTS = ['Apto 101', 'Casa', 'Bloco A', 'Fundos', None, None]
+DELIVERY_FEES = [5.0, 7.0, 9.0, 12.0, 15.0]
+
+
+def build_columnar_catalog(context):
+    """NumPy views of the entities a sale draws from (built once per process)"""
+    products, items, channels = context['products'], context['items'], context['channels']
+    popularity = np.array([p['popularity'] for p in products])
+    channel_weights = np.array([c['weight'] for c in channels])
+    hour_weights = np.array([get_hour_weight(h) for h in range(24)])
+    return {
+        'hour_p': hour_weights / hour_weights.sum(),
+        'store_ids': np.array(context['stores']),
+        'customer_ids': np.array(context['customers']),
+        'channel_ids': np.array([c['id'] for c in channels]),
+        'channel_is_delivery': np.array([c['type'] == 'D' for c in channels]),
+        'channel_is_presencial': np.array([c['type'] == 'P' for c in channels]),
+        'channel_p': channel_weights / channel_weights.sum(),
+        'product_ids': np.array([p['id'] for p in products]),
+        'product_prices': np.array([p['base_price'] for p in products]),
+        'product_customizable': np.array([p['has_customization'] for p in products]),
+        'product_p': popularity / popularity.sum(),
+        'item_ids': np.array([i['id'] for i in items]),
+        'item_prices': np.array([i['price'] for i in items]),
+        'option_groups': np.array(context['option_groups']),
+        'payment_type_ids': np.array([context['payment_type_ids'][pt] for pt in PAYMENT_TYPES_LIST]),
+        'pools': context['pools'],
+    }
+
+
+def _copy_text(values, mask=None, money=False):
+    """COPY text for a column: values as strings, '\\N' where mask is False"""
+    if money:
+        text = np.char.mod('%.2f', values).astype(object)
+    elif values.dtype == object:
+        text = np.array([copy_value(v) for v in values], dtype=object)
+    else:
+        text = values.astype(str).astype(object)
+    if mask is not None:
+        text[~mask] = '\\N'
+    return text
+
+
+def synthesize_sales_day(catalog, rng, day, count, id_starts, partitioned=False):
+    """
+    Draw one day of sales and their child rows as NumPy columns, with the same
+    distributions as generate_single_sale. Returns {table: [column, ...]} in
+    COPY_COLUMNS order (plus sale_created_at for partitioned child tables).
+    """
+    n = count
+    pools = catalog['pools']
+
+    # Sales: time, store, channel, customer
+    seconds = (rng.choice(24, n, p=catalog['hour_p']) * 3600
+               + rng.integers(0, 60, n) * 60 + rng.integers(0, 60, n))
+    created_at = np.datetime64(day.replace(hour=0, minute=0, second=0, microsecond=0), 'us') + seconds.astype('timedelta64[s]')
+    created_text = np.datetime_as_string(created_at).astype(object)
+    channel_index = rng.choice(len(catalog['channel_ids']), n, p=catalog['channel_p'])
+    is_delivery = catalog['channel_is_delivery'][channel_index]
+    has_customer = rng.random(n) > 0.3
+    customer_ids = catalog['customer_ids'][rng.integers(0, len(catalog['customer_ids']), n)]
+
+    # Product lines: 1-5 per sale, by popularity
+    lines_per_sale = np.minimum(5, np.floor(rng.exponential(2.0, n)).astype(np.int64) + 1)
+    line_sale = np.repeat(np.arange(n), lines_per_sale)
+    lines = len(line_sale)
+    product_index = rng.choice(len(catalog['product_ids']), lines, p=catalog['product_p'])
+    quantity = rng.integers(1, 4, lines)
+    base_price = catalog['product_prices'][product_index]
+
+    # Customizations: 60% of the customizable lines get 1-4 items
+    customized = catalog['product_customizable'][product_index] & (rng.random(lines) > 0.4)
+    items_per_line = np.where(customized, rng.integers(1, 5, lines), 0)
+    item_line = np.repeat(np.arange(lines), items_per_line)
+    item_count = len(item_line)
+    item_index = rng.integers(0, len(catalog['item_ids']), item_count)
+    item_price = catalog['item_prices'][item_index]
+    has_option_group = rng.random(item_count) > 0.5
+    option_group = catalog['option_groups'][rng.integers(0, len(catalog['option_groups']), item_count)]
+
+    line_total = (base_price + np.bincount(item_line, weights=item_price, minlength=lines)) * quantity
+    total_items = np.bincount(line_sale, weights=line_total, minlength=n)
+
+    # Financials
+    has_discount = rng.random(n) < 0.2
+    discount = np.where(has_discount, np.round(total_items * rng.uniform(0.05, 0.30, n), 2), 0.0)
+    discount_reason = np.array(DISCOUNT_REASONS, dtype=object)[rng.integers(0, len(DISCOUNT_REASONS), n)]
+    increase = np.where(rng.random(n) < 0.05, np.round(total_items * rng.uniform(0.02, 0.10, n), 2), 0.0)
+    delivery_fee = np.where(is_delivery, np.array(DELIVERY_FEES)[rng.integers(0, len(DELIVERY_FEES), n)], 0.0)
+    service_tax = np.where(rng.random(n) < 0.3, np.round(total_items * 0.10, 2), 0.0)
+    completed = rng.random(n) < STATUS_WEIGHTS[0]
+    total_amount = total_items - discount + increase + delivery_fee + service_tax
+    value_paid = np.where(completed, total_amount, 0.0)
+    production_seconds = rng.integers(300, 2401, n)
+    delivery_seconds = rng.integers(600, 3601, n)
+    is_presencial = catalog['channel_is_presencial'][channel_index]
+    people = rng.integers(1, 9, n)
+
+    sale_ids = id_starts['sales'] + np.arange(n)
+    tables = {'sales': [
+        _copy_text(sale_ids),
+        _copy_text(catalog['store_ids'][rng.integers(0, len(catalog['store_ids']), n)]),
+        _copy_text(customer_ids, has_customer),
+        _copy_text(catalog['channel_ids'][channel_index]),
+        _copy_text(pools.sample(rng, 'names', n), ~has_customer),
+        created_text,
+        np.where(completed, 'COMPLETED', 'CANCELLED').astype(object),
+        _copy_text(total_items, money=True),
+        _copy_text(discount, money=True),
+        _copy_text(increase, money=True),
+        _copy_text(delivery_fee, money=True),
+        _copy_text(service_tax, money=True),
+        _copy_text(total_amount, money=True),
+        _copy_text(value_paid, money=True),
+        _copy_text(production_seconds, completed),
+        _copy_text(delivery_seconds, completed & is_delivery),
+        _copy_text(discount_reason, has_discount),
+        _copy_text(people, is_presencial),
+        np.full(n, 'POS', dtype=object),
+    ]}
+
+    line_ids = id_starts['product_sales'] + np.arange(lines)
+    tables['product_sales'] = [
+        _copy_text(line_ids),
+        _copy_text(sale_ids[line_sale]),
+        _copy_text(catalog['product_ids'][product_index]),
+        _copy_text(quantity),
+        _copy_text(base_price),
+        _copy_text(line_total),
+    ]
+    tables['item_product_sales'] = [
+        _copy_text(id_starts['item_product_sales'] + np.arange(item_count)),
+        _copy_text(line_ids[item_line]),
+        _copy_text(catalog['item_ids'][item_index]),
+        _copy_text(option_group, has_option_group),
+        np.full(item_count, '1', dtype=object),
+        _copy_text(item_price),
+        _copy_text(item_price),
+        np.full(item_count, '1', dtype=object),
+    ]
+
+    # Deliveries: completed sales of delivery channels
+    delivered = np.flatnonzero(completed & is_delivery)
+    d = len(delivered)
+    delivery_ids = id_starts['delivery_sales'] + np.arange(d)
+    fee = delivery_fee[delivered]
+
+    neighborhoods, cities, states = pools.sample_addresses(rng, d)
+    tables['delivery_sales'] = [
+        _copy_text(delivery_ids),
+        _copy_text(sale_ids[delivered]),
+        _copy_text(pools.sample(rng, 'names', d)),
+        _copy_text(pools.sample(rng, 'phones', d)),
+        _copy_text(np.array(COURIER_TYPES, dtype=object)[rng.integers(0, len(COURIER_TYPES), d)]),
+        _copy_text(np.array(DELIVERY_TYPES, dtype=object)[rng.integers(0, len(DELIVERY_TYPES), d)]),
+        np.full(d, 'DELIVERED', dtype=object),
+        _copy_text(fee),
+        _copy_text(np.round(fee * 0.6, 2)),
+    ]
+    complement = np.array(COMPLEMENTS, dtype=object)[rng.integers(0, len(COMPLEMENTS), d)]
+    complement = np.where(rng.random(d) > 0.5, complement, None)
+    tables['delivery_addresses'] = [
+        _copy_text(id_starts['delivery_addresses'] + np.arange(d)),
+        _copy_text(sale_ids[delivered]),
+        _copy_text(delivery_ids),
+        _copy_text(pools.sample(rng, 'streets', d)),
+        _copy_text(rng.integers(10, 10000, d)),
+        _copy_text(complement),
+        _copy_text(neighborhoods),
+        _copy_text(cities),
+        _copy_text(states),
+        _copy_text(pools.sample(rng, 'postcodes', d)),
+        _copy_text(np.clip(-23.5 + rng.uniform(-10, 5, d), -33.0, -5.0)),
+        _copy_text(np.clip(-46.6 + rng.uniform(-10, 10, d), -74.0, -34.0)),
+    ]
+
+    # Payments: completed sales, 15% split in two
+    paid = np.flatnonzero(completed)
+    split = rng.random(len(paid)) < 0.15
+    first_value = np.where(split, np.round(value_paid[paid] * rng.uniform(0.3, 0.7, len(paid)), 2), value_paid[paid])
+    first_type = np.where(split, rng.integers(0, 3, len(paid)), rng.integers(0, len(PAYMENT_TYPES_LIST), len(paid)))
+    second = paid[split]
+    payment_sale = np.concatenate([paid, second])
+    payment_value = np.concatenate([first_value, value_paid[second] - first_value[split]])
+    payment_type = np.concatenate([first_type, rng.integers(0, len(PAYMENT_TYPES_LIST), len(second))])
+    order = np.argsort(payment_sale, kind='stable')
+    tables['payments'] = [
+        _copy_text(id_starts['payments'] + np.arange(len(order))),
+        _copy_text(sale_ids[payment_sale[order]]),
+        _copy_text(catalog['payment_type_ids'][payment_type[order]]),
+        _copy_text(payment_value[order], money=True),
+    ]
+
+    if partitioned:
+        tables['product_sales'].append(created_text[line_sale])
+        tables['delivery_addresses'].append(created_text[delivered])
+        tables['payments'].append(created_text[payment_sale[order]])
+    return tables
 
 
 def create_indexes(conn):
@@ -677,8 +1360,31 @@ def main():
     parser.add_argument('--items', type=int, default=200, help='Number of items/complements')
     parser.add_argument('--customers', type=int, default=10000, help='Number of customers')
     parser.add_argument('--months', type=int, default=6, help='Months of sales data')
+    parser.add_argument('--loader', choices=['copy', 'insert'], default='copy',
+                       help='Sales loading strategy: COPY FROM STDIN (fast) or row-by-row INSERT')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Processes generating sales in parallel (date range split into shards; copy loader)')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Random seed; the same seed and --end-date reproduce identical data')
+    parser.add_argument('--end-date', type=datetime.fromisoformat, default=None,
+                       help='Last day of sales (YYYY-MM-DD); default: today, so runs on different days '
+                            'differ even with the same --seed')
+    parser.add_argument('--engine', choices=['rows', 'columnar'], default='rows',
+                       help='Sale synthesis: per-sale Python dicts or whole days as NumPy arrays (copy loader)')
+    parser.add_argument('--text-pool-cache', default=None,
+                       help='JSON file caching the Faker text pools between runs (rebuilt if the seed changes)')
     
     args = parser.parse_args()
+    if args.workers > 1 and args.loader != 'copy':
+        parser.error('--workers requires --loader copy')
+    if args.engine == 'columnar' and args.loader != 'copy':
+        parser.error('--engine columnar requires --loader copy')
+    if args.engine == 'columnar' and np is None:
+        parser.error('--engine columnar requires numpy (pip install numpy)')
+    if args.seed is None:
+        args.seed = random.SystemRandom().randrange(2 ** 31)
+    now = args.end_date or datetime.now()
+    seed_generators(args.seed)
     
     print("=" * 70)
     print("God Level Coder Challenge - Data Generator")
@@ -689,16 +1395,18 @@ def main():
     conn = get_db_connection(args.db_url)
     
     try:
+        pools = TextPools.load_or_build(args.seed, args.text_pool_cache)
         sub_brand_ids, channels = setup_base_data(conn)
-        stores = generate_stores(conn, sub_brand_ids, args.stores)
+        stores = generate_stores(conn, sub_brand_ids, pools, args.stores, now)
         products, items, option_groups = generate_products_and_items(
             conn, sub_brand_ids, args.products, args.items
         )
-        customers = generate_customers(conn, args.customers)
+        customers = generate_customers(conn, pools, args.customers, now)
         
         total_sales = generate_sales(
             conn, stores, channels, products, items, 
-            option_groups, customers, args.months
+            option_groups, customers, pools, args.months, args.loader,
+            args.workers, args.seed, args.db_url, args.end_date, args.engine
         )
         
         create_indexes(conn)
@@ -0,0 +1,44 @@
+"""
+Configuração compartilhada dos testes.
+
+Os testes de lógica pura (builder, cache, ingestão) não precisam de banco. Os que
+usam a fixture `db_cursor` rodam contra o banco de DB_HOST/DB_NAME (dados do
+generate_data.py) e são ignorados quando ele não está acessível.
+"""
+
+import os
+import sys
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.database import get_db_connection  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def db_connection():
+    try:
+        conn = get_db_connection()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Banco indisponível: {e}")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def db_cursor(db_connection):
+    """ Cursor em uma transação própria (NOW() fixo durante o teste), desfeita ao final. """
+    with db_connection.cursor() as cursor:
+        yield cursor
+    db_connection.rollback()
+
+
+@pytest.fixture(scope="session")
+def sales_partitioned(db_connection):
+    with db_connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'sales'::regclass)")
+        partitioned = cursor.fetchone()[0]
+    db_connection.rollback()
+    return partitioned
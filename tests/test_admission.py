@@ -0,0 +1,63 @@
+"""
+Testes da estimativa de custo do controle de admissão (EXPLAIN sob a classe 'light').
+"""
+
+import asyncio
+
+import pytest
+
+from backend import admission as admission_module
+from backend.admission import AdmissionController, AdmissionRejectedError
+
+
+@pytest.fixture
+def explains(monkeypatch):
+    """ Substitui o fetch_all da admissão: registra cada EXPLAIN e a ocupação da classe 'light'. """
+    calls = []
+
+    def install(controller, cost=100.0):
+        async def fake_fetch_all(query, params, timeout_ms=None, **kwargs):
+            calls.append({"params": params, "timeout_ms": timeout_ms,
+                          "light_active": controller.classes["light"].stats()["active"]})
+            return ["QUERY PLAN"], [([{"Plan": {"Total Cost": cost}}],)]
+        monkeypatch.setattr(admission_module, "fetch_all", fake_fetch_all)
+        return calls
+
+    return install
+
+
+def test_explain_holds_a_light_slot(explains):
+    controller = AdmissionController()
+    calls = explains(controller)
+    assert asyncio.run(controller.estimate_cost("SELECT 1", [])) == 100.0
+    light = controller.classes["light"]
+    assert calls[0]["light_active"] == 1
+    assert calls[0]["timeout_ms"] == light.statement_timeout_ms
+    assert light.stats()["active"] == 0
+
+
+def test_cost_is_reused_only_within_the_same_id_list_range(explains):
+    controller = AdmissionController()
+    calls = explains(controller)
+
+    async def scenario():
+        for params in ([[1]], [[9]], [[1, 2]], [[1, 2, 3]], [[1, 2, 3, 4]], [[1, 2], 50], [[3, 4], 10]):
+            await controller.estimate_cost("SELECT 1", params)
+
+    asyncio.run(scenario())
+    # 1 ID | 2-3 IDs | 4-7 IDs; escalares (limite) não mudam a chave
+    assert [call["params"] for call in calls] == [[[1]], [[1, 2]], [[1, 2, 3, 4]]]
+
+
+def test_saturated_light_class_falls_back_to_the_join_set_class(explains):
+    controller = AdmissionController()
+    calls = explains(controller, cost=10 ** 9)
+    light = controller.classes["light"]
+    light.concurrency, light.max_queue = 1, 0
+    assert light.try_acquire()
+
+    with pytest.raises(AdmissionRejectedError):
+        asyncio.run(controller.estimate_cost("SELECT 1", []))
+    query_class, cost = asyncio.run(controller.classify("SELECT 1", [], ["stores"]))
+    assert (query_class.name, cost) == ("light", None)
+    assert calls == [] and controller.stats()["explain_failures"] == 1
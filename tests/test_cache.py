@@ -0,0 +1,137 @@
+"""
+Testes do cache de resultados (TTL + LRU) e da coalescência de execuções (SingleFlight).
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend import cache
+from backend.cache import SingleFlight, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Relógio manual para o TTLCache (substitui apenas o time.monotonic visto por backend.cache). """
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+# =======================================================================
+# TTLCache
+# =======================================================================
+
+def test_entry_expires_after_ttl(clock):
+    results = TTLCache(max_entries=10, ttl=30)
+    results.set("k", "v")
+
+    clock.value += 29.9
+    assert results.get("k") == "v"
+    clock.value += 0.2
+    assert results.get("k") is None
+
+    stats = results.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["entries"]) == (1, 1, 1, 0)
+
+
+def test_set_renews_the_ttl(clock):
+    results = TTLCache(max_entries=10, ttl=30)
+    results.set("k", "old")
+    clock.value += 20
+    results.set("k", "new")
+    clock.value += 20
+    assert results.get("k") == "new"
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    results = TTLCache(max_entries=2, ttl=30)
+    results.set("a", 1)
+    results.set("b", 2)
+    assert results.get("a") == 1  # 'a' passa a ser o mais recente
+    results.set("c", 3)
+
+    assert results.get("b") is None
+    assert (results.get("a"), results.get("c")) == (1, 3)
+    assert results.stats()["evictions"] == 1
+    assert results.stats()["entries"] == 2
+
+
+def test_hit_ratio():
+    results = TTLCache(max_entries=10, ttl=30)
+    assert results.stats()["hit_ratio"] == 0.0
+    results.set("k", "v")
+    results.get("k")
+    results.get("other")
+    assert results.stats()["hit_ratio"] == 0.5
+
+
+# =======================================================================
+# SingleFlight
+# =======================================================================
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def scenario():
+        return await asyncio.gather(*(flights.run("k", execute) for _ in range(5)))
+
+    outcomes = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert len({id(result) for result, _ in outcomes}) == 1
+    assert [coalesced for _, coalesced in outcomes] == [False, True, True, True, True]
+    assert flights.stats() == {"in_flight": 0, "executions": 1, "saved_executions": 4}
+
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+
+    async def scenario():
+        return await asyncio.gather(flights.run("a", lambda: asyncio.sleep(0, "A")),
+                                    flights.run("b", lambda: asyncio.sleep(0, "B")))
+
+    assert asyncio.run(scenario()) == [("A", False), ("B", False)]
+
+
+def test_exception_reaches_every_waiter():
+    flights = SingleFlight()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("falhou")
+
+    async def scenario():
+        return await asyncio.gather(*(flights.run("k", execute) for _ in range(3)), return_exceptions=True)
+
+    outcomes = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert len({id(outcome) for outcome in outcomes}) == 1
+    # A chave sai do mapa em voo: a próxima chamada executa de novo
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_execution():
+    flights = SingleFlight()
+
+    async def execute():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def scenario():
+        first = asyncio.ensure_future(flights.run("k", execute))
+        second = asyncio.ensure_future(flights.run("k", execute))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == ("ok", True)
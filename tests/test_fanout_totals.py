@@ -0,0 +1,60 @@
+"""
+Totais do pivot sobre tabelas filhas contra o banco gerado pelo generate_data.py.
+
+Sem fan-out, cada venda entra uma única vez em cada grupo da dimensão: o
+SUM(total_amount) de um grupo é o total, sem agrupamento, das vendas que têm
+aquele valor. Dimensões de `sales` (lojas, canais) somam o total geral.
+"""
+
+import pytest
+
+from backend.query_builder import build_analytics_query
+
+COMPLETED = "s.sale_status_desc = 'COMPLETED'"
+
+# Vendas que têm o valor da dimensão (semi-join independente do builder)
+SALES_WITH_VALUE = {
+    "products.name": "EXISTS (SELECT 1 FROM product_sales ps JOIN products p ON p.id = ps.product_id "
+                     "WHERE ps.sale_id = s.id AND p.name = %s)",
+    "payment_types.desc": "EXISTS (SELECT 1 FROM payments pay JOIN payment_types pt ON pt.id = pay.payment_type_id "
+                          "WHERE pay.sale_id = s.id AND pt.description = %s)",
+    "items.name_custom": "EXISTS (SELECT 1 FROM product_sales ps JOIN item_product_sales ips ON ips.product_sale_id = ps.id "
+                         "JOIN items i ON i.id = ips.item_id WHERE ps.sale_id = s.id AND i.name = %s)",
+}
+
+FILTER_CASES = {
+    "sem filtro": ({}, []),
+    "30 dias, lojas 1-5": ({"date_range": "last_30d", "store_ids": [1, 2, 3, 4, 5]},
+                           ["s.created_at >= NOW() - INTERVAL '30 days'", "s.store_id = ANY(%s::int[])"]),
+}
+
+
+def _ungrouped_total(cursor, extra_where, params):
+    cursor.execute(f"SELECT COALESCE(SUM(s.total_amount), 0) FROM sales s WHERE {' AND '.join([COMPLETED] + extra_where)}",
+                   params)
+    return cursor.fetchone()[0]
+
+
+@pytest.mark.parametrize("group_by", sorted(SALES_WITH_VALUE))
+@pytest.mark.parametrize("case", sorted(FILTER_CASES))
+def test_child_group_matches_ungrouped_total_of_its_sales(db_cursor, sales_partitioned, group_by, case):
+    filters, where = FILTER_CASES[case]
+    query, params = build_analytics_query("total_amount", "SUM", group_by, filters, partitioned=sales_partitioned)
+    db_cursor.execute(query, params)
+    groups = [(result, dimension) for result, dimension in db_cursor.fetchall() if dimension is not None]
+    assert groups, "dataset sem vendas para a dimensão"
+
+    filter_params = [filters["store_ids"]] if "store_ids" in filters else []
+    for result, dimension in groups[:3] + groups[-2:]:
+        expected = _ungrouped_total(db_cursor, where + [SALES_WITH_VALUE[group_by]], filter_params + [dimension])
+        assert result == expected, dimension
+
+
+@pytest.mark.parametrize("group_by", ["stores.name", "channels.name"])
+@pytest.mark.parametrize("case", sorted(FILTER_CASES))
+def test_sales_dimension_adds_up_to_ungrouped_total(db_cursor, sales_partitioned, group_by, case):
+    filters, where = FILTER_CASES[case]
+    query, params = build_analytics_query("total_amount", "SUM", group_by, filters, partitioned=sales_partitioned)
+    db_cursor.execute(query, params)
+    filter_params = [filters["store_ids"]] if "store_ids" in filters else []
+    assert sum(result for result, _ in db_cursor.fetchall()) == _ungrouped_total(db_cursor, where, filter_params)
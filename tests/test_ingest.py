@@ -0,0 +1,171 @@
+"""
+Testes da ingestão em lote sem banco: validação do NDJSON e montagem do texto do COPY.
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from backend import ingest
+from backend.copy_format import copy_value
+from backend.ingest import (
+    INGEST_COLUMNS, IngestBatchTooLargeError, IngestValidationError, build_copy_payloads, parse_batch, row_counts,
+)
+from backend.partitioning import CHILD_TABLES
+
+SALE = {"store_id": 1, "channel_id": 2, "created_at": "2024-05-01T12:30:00", "total_amount_items": 50.0,
+        "total_amount": 55.0}
+
+
+def _ndjson(*lines):
+    return "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode()
+
+
+# =======================================================================
+# FORMATO TEXTO DO COPY
+# =======================================================================
+
+@pytest.mark.parametrize("value, expected", [
+    (None, "\\N"),
+    ("", ""),
+    ("a\tb", "a\\tb"),
+    ("linha 1\nlinha 2\r\n", "linha 1\\nlinha 2\\r\\n"),
+    ("C:\\pasta", "C:\\\\pasta"),
+    ("\\N", "\\\\N"),  # o texto literal \N não vira NULL
+    ("sem escape: ç, é, 😀", "sem escape: ç, é, 😀"),
+    (True, "t"),
+    (False, "f"),
+    (0, "0"),
+    (12.5, "12.5"),
+    (datetime(2024, 5, 1, 12, 30), "2024-05-01 12:30:00"),
+])
+def test_copy_value(value, expected):
+    assert copy_value(value) == expected
+
+
+def test_escaped_values_keep_one_field_per_column():
+    row = ("a\tb", None, "c\nd", "e\\")
+    line = "\t".join(map(copy_value, row))
+    assert "\n" not in line
+    assert line.split("\t") == ["a\\tb", "\\N", "c\\nd", "e\\\\"]
+
+
+# =======================================================================
+# VALIDAÇÃO DO NDJSON
+# =======================================================================
+
+def test_valid_batch_skips_blank_lines():
+    sales = parse_batch(_ndjson(SALE, "", "   ", {**SALE, "store_id": 3}, ""))
+    assert [sale.store_id for sale in sales] == [1, 3]
+
+
+def test_invalid_lines_are_collected_with_their_line_numbers():
+    body = _ndjson(
+        SALE,
+        "",
+        {**SALE, "store_id": "loja"},
+        "{nao e json",
+        {key: value for key, value in SALE.items() if key != "total_amount"},
+        {**SALE, "products": [{"product_id": 1, "quantity": 0, "base_price": 1, "total_price": 1}]},
+    )
+    with pytest.raises(IngestValidationError, match="4 de 5 linhas inválidas") as raised:
+        parse_batch(body)
+
+    errors = {error["line"]: error["errors"] for error in raised.value.errors}
+    assert sorted(errors) == [3, 4, 5, 6]
+    assert errors[3][0]["loc"] == ["store_id"]
+    assert errors[5][0]["loc"] == ["total_amount"]
+    assert errors[6][0]["loc"] == ["products", 0, "quantity"]
+    assert all(error["msg"] for line in errors.values() for error in line)
+
+
+def test_reported_errors_are_capped(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_REPORTED_ERRORS", 2)
+    with pytest.raises(IngestValidationError, match="5 de 5 linhas inválidas") as raised:
+        parse_batch(_ndjson(*["{}"] * 5))
+    assert [error["line"] for error in raised.value.errors] == [1, 2]
+
+
+@pytest.mark.parametrize("body", [b"", b"\n\n  \n"])
+def test_empty_batch_is_rejected(body):
+    with pytest.raises(IngestValidationError, match="Lote vazio"):
+        parse_batch(body)
+
+
+def test_batch_above_the_sales_limit_is_rejected(monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_MAX_BATCH_SALES", 2)
+    parse_batch(_ndjson(SALE, SALE))
+    with pytest.raises(IngestBatchTooLargeError):
+        parse_batch(_ndjson(SALE, SALE, SALE))
+
+
+# =======================================================================
+# MONTAGEM DO COPY
+# =======================================================================
+
+FULL_SALE = {
+    **SALE,
+    "customer_name": "Ana\tMaria",
+    "discount_reason": "cupom\\10",
+    "products": [
+        {"product_id": 7, "quantity": 2, "base_price": 10, "total_price": 20, "observations": "sem\ncebola",
+         "items": [{"item_id": 3, "additional_price": 1.5}, {"item_id": 4}]},
+        {"product_id": 8, "quantity": 1, "base_price": 30, "total_price": 30},
+    ],
+    "delivery": {"delivery_type": "DELIVERY", "address": {"street": "Rua A", "city": "Recife"}},
+    "payments": [{"payment_type_id": 1, "value": 55.0, "is_online": True}],
+}
+
+
+def _payloads(sales, partitioned=False):
+    counts = row_counts(sales)
+    ids = {table: list(range(100 * (index + 1), 100 * (index + 1) + counts[table]))
+           for index, table in enumerate(INGEST_COLUMNS)}
+    return {table: (columns, text) for table, columns, text in build_copy_payloads(sales, ids, partitioned)}
+
+
+def _rows(payloads, table):
+    columns, text = payloads[table]
+    assert text.endswith("\n")
+    rows = [dict(zip(columns, line.split("\t"))) for line in text[:-1].split("\n")]
+    assert all(len(row) == len(columns) for row in rows)
+    return rows
+
+
+def test_copy_payloads_link_children_to_reserved_ids():
+    sales = parse_batch(_ndjson(FULL_SALE, SALE))
+    assert row_counts(sales) == {"sales": 2, "product_sales": 2, "item_product_sales": 2, "delivery_sales": 1,
+                                 "delivery_addresses": 1, "payments": 1}
+    payloads = _payloads(sales)
+
+    assert [row["id"] for row in _rows(payloads, "sales")] == ["100", "101"]
+    assert [(row["id"], row["sale_id"]) for row in _rows(payloads, "product_sales")] == [("200", "100"), ("201", "100")]
+    assert [row["product_sale_id"] for row in _rows(payloads, "item_product_sales")] == ["200", "200"]
+    delivery, = _rows(payloads, "delivery_sales")
+    address, = _rows(payloads, "delivery_addresses")
+    assert (address["sale_id"], address["delivery_sale_id"]) == ("100", delivery["id"])
+    assert _rows(payloads, "payments")[0]["is_online"] == "t"
+
+
+def test_copy_payloads_escape_text_and_nulls():
+    payloads = _payloads(parse_batch(_ndjson(FULL_SALE)))
+    sale, = _rows(payloads, "sales")
+    assert sale["customer_name"] == "Ana\\tMaria"
+    assert sale["discount_reason"] == "cupom\\\\10"
+    assert sale["customer_id"] == "\\N"
+    assert _rows(payloads, "product_sales")[0]["observations"] == "sem\\ncebola"
+    assert _rows(payloads, "delivery_addresses")[0]["complement"] == "\\N"
+
+
+def test_tables_without_rows_are_left_out():
+    payloads = _payloads(parse_batch(_ndjson(SALE)))
+    assert list(payloads) == ["sales"]
+
+
+def test_partitioned_children_carry_the_sale_timestamp():
+    payloads = _payloads(parse_batch(_ndjson(FULL_SALE)), partitioned=True)
+    for table, (columns, _) in payloads.items():
+        assert (columns[-1] == "sale_created_at") == (table in CHILD_TABLES)
+        if table in CHILD_TABLES:
+            assert _rows(payloads, table)[0]["sale_created_at"] == "2024-05-01 12:30:00"
@@ -0,0 +1,38 @@
+"""
+Testes do cache de metadados do Dashboard: invalidação durante uma carga em andamento.
+"""
+
+import asyncio
+
+from backend import metadata
+from backend.metadata import MetadataCache
+
+
+def test_invalidate_discards_a_load_in_flight(monkeypatch):
+    stores = {"name": "Antiga"}
+    started = []
+
+    async def fake_fetch_all(sql, *args, **kwargs):
+        name = stores["name"]
+        started.append(sql)
+        await asyncio.sleep(0.01)
+        return [], ([(1, name)] if sql.startswith("SELECT id, name FROM stores") else [])
+
+    monkeypatch.setattr(metadata, "fetch_all", fake_fetch_all)
+    cache = MetadataCache()
+
+    async def scenario():
+        stale = asyncio.ensure_future(cache.get())
+        while len(started) < len(metadata.METADATA_QUERIES):
+            await asyncio.sleep(0)  # a carga antiga já leu os dados
+        stores["name"] = "Nova"
+        cache.invalidate()
+        fresh = await cache.get()
+        return await stale, fresh, await cache.get()
+
+    stale, fresh, cached = asyncio.run(scenario())
+    assert b"Antiga" in stale.body
+    assert b"Nova" in fresh.body and fresh.version != stale.version
+    # O resultado antigo terminou depois da invalidação e não ficou em cache
+    assert cached is fresh
+    assert cache.stats()["loads"] == 2
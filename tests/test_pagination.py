@@ -0,0 +1,109 @@
+"""
+Testes da paginação por keyset do pivot: token do cursor e predicado de continuação.
+"""
+
+from decimal import Decimal
+
+import pytest
+
+from backend import query_builder
+from backend.query_builder import build_paginated_query, decode_cursor, encode_cursor, pivot_cache_key
+
+KEY = pivot_cache_key("total_amount", "SUM", "stores.name", {"store_ids": [1, 2], "date_range": "last_30d"})
+
+
+# =======================================================================
+# TOKEN DO CURSOR
+# =======================================================================
+
+@pytest.mark.parametrize("row", [
+    (Decimal("1234.50"), "Loja Centro"),
+    (Decimal("10"), None),
+    (None, "Loja Sul"),
+    (None, None),
+    (7, "nome com \"aspas\" e acentuação"),
+])
+def test_cursor_round_trip(row):
+    token = encode_cursor(KEY, row)
+    assert "=" not in token and "/" not in token and "+" not in token
+    assert decode_cursor(token, KEY) == tuple(None if value is None else str(value) for value in row)
+
+
+def test_cursor_is_accepted_by_an_equivalent_request():
+    token = encode_cursor(KEY, (Decimal("5"), "Loja"))
+    equivalent = pivot_cache_key("total_amount", "sum", "stores.name", {"date_range": "last_30d", "store_ids": [2, 1, 1]})
+    assert decode_cursor(token, equivalent) == ("5", "Loja")
+
+
+@pytest.mark.parametrize("other", [
+    pivot_cache_key("total_amount", "AVG", "stores.name", {"store_ids": [1, 2], "date_range": "last_30d"}),
+    pivot_cache_key("total_amount", "SUM", "channels.name", {"store_ids": [1, 2], "date_range": "last_30d"}),
+    pivot_cache_key("total_amount", "SUM", "stores.name", {"store_ids": [1, 2, 3], "date_range": "last_30d"}),
+    pivot_cache_key("total_amount", "SUM", "stores.name", {"store_ids": [1, 2]}),
+    pivot_cache_key("delivery_fee", "SUM", "stores.name", {"store_ids": [1, 2], "date_range": "last_30d"}),
+])
+def test_cursor_from_another_request_shape_is_rejected(other):
+    token = encode_cursor(KEY, (Decimal("5"), "Loja"))
+    with pytest.raises(ValueError, match="outra requisição"):
+        decode_cursor(token, other)
+
+
+@pytest.mark.parametrize("token", ["", "nao-e-base64!", "bm9wZQ", encode_cursor(KEY, (1, "a"))[:-3]])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(ValueError, match="Cursor de paginação"):
+        decode_cursor(token, KEY)
+
+
+# =======================================================================
+# PREDICADO DE CONTINUAÇÃO (result DESC, dimension ASC, NULLs por último)
+# =======================================================================
+
+@pytest.mark.parametrize("after, predicate, keyset_params", [
+    (("10", "b"), "(q.result_0 < %s OR (q.result_0 = %s AND (q.dimension > %s OR q.dimension IS NULL)) "
+                  "OR q.result_0 IS NULL)", ["10", "10", "b"]),
+    (("10", None), "(q.result_0 < %s OR q.result_0 IS NULL)", ["10"]),
+    ((None, "b"), "(q.result_0 IS NULL AND (q.dimension > %s OR q.dimension IS NULL))", ["b"]),
+    ((None, None), "WHERE FALSE", []),
+])
+def test_keyset_predicate_orders_nulls_last(after, predicate, keyset_params):
+    query, params = build_paginated_query("total_amount", "SUM", "stores.name", {"store_ids": [1]},
+                                          limit=3, after=after)
+    assert predicate in query
+    assert "ORDER BY q.result_0 DESC NULLS LAST, q.dimension ASC NULLS LAST" in query
+    assert params == [[1]] + keyset_params + [3]
+    assert query.count("%s") == len(params)
+
+
+def test_first_page_has_no_predicate():
+    query, params = build_paginated_query("total_amount", "SUM", "stores.name", {}, limit=3)
+    assert "q.result_0 <" not in query and "FALSE" not in query
+    assert params == [3]
+
+
+# Resultado sintético com empates e NULLs nas duas colunas, já na ordem total esperada
+SYNTHETIC_ROWS = [
+    (Decimal("10"), "a"), (Decimal("10"), "b"), (Decimal("10"), None),
+    (Decimal("5.5"), "a"), (Decimal("5.5"), None),
+    (None, "a"), (None, "b"), (None, None),
+]
+SYNTHETIC_INNER = "SELECT * FROM (VALUES " + ", ".join(
+    f"({'NULL' if result is None else result}::numeric, {'NULL' if dimension is None else repr(dimension)}::text)"
+    for result, dimension in reversed(SYNTHETIC_ROWS)
+) + ") v(result_0, dimension)"
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 3])
+def test_pages_cover_every_row_once_with_ties_and_nulls(db_cursor, monkeypatch, page_size):
+    # Mesmo caminho da rota: página com uma linha a mais e cursor codificado/decodificado
+    monkeypatch.setattr(query_builder, "build_multi_metric_query", lambda *args, **kwargs: (SYNTHETIC_INNER, []))
+    rows, after = [], None
+    for _ in range(len(SYNTHETIC_ROWS) + 1):
+        query, params = build_paginated_query("total_amount", "SUM", "stores.name", {},
+                                              limit=page_size + 1, after=after)
+        db_cursor.execute(query, params)
+        page = db_cursor.fetchall()
+        rows += page[:page_size]
+        if len(page) <= page_size:
+            break
+        after = decode_cursor(encode_cursor(KEY, page[page_size - 1]), KEY)
+    assert rows == SYNTHETIC_ROWS
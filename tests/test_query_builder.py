@@ -0,0 +1,165 @@
+"""
+Testes do query_builder sem banco: forma do SQL gerado e normalização das requisições.
+"""
+
+import re
+
+import pytest
+from pydantic import ValidationError
+
+from backend.models import PivotRequest
+from backend.query_builder import (
+    CHILD_SOURCES, DIMENSION_MAP, JOIN_MAP, METRIC_MAP, build_analytics_query, build_multi_metric_query,
+    build_paginated_query, build_rollup_query, normalize_filters, pivot_cache_key, plan_analytics_query,
+)
+
+# Dimensões servidas por tabelas filhas (1:N com sales)
+CHILD_DIMENSIONS = [key for key, dim in DIMENSION_MAP.items() if dim["join"] in CHILD_SOURCES]
+
+
+# =======================================================================
+# AGREGAÇÃO SEM FAN-OUT (tabelas filhas pré-agregadas)
+# =======================================================================
+
+@pytest.mark.parametrize("group_by", CHILD_DIMENSIONS)
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_child_dimension_is_pre_aggregated(group_by, partitioned):
+    query, _ = build_analytics_query("total_amount", "SUM", group_by, {}, partitioned=partitioned)
+    source = CHILD_SOURCES[DIMENSION_MAP[group_by]["join"]]
+    alias = source["alias"]
+
+    # A filha só aparece dentro da subquery agrupada por venda, nunca juntada direto a sales
+    assert JOIN_MAP[DIMENSION_MAP[group_by]["join"]] not in query
+    assert re.search(rf"JOIN \(SELECT {alias}\.sale_id\b.* FROM {source['table']} {alias}\b.*GROUP BY 1, 2.*\) "
+                     rf"{alias}_agg ON {alias}_agg\.sale_id = s\.id", query)
+    assert f"GROUP BY {alias}_agg.dimension" in query
+    assert ("sale_created_at = s.created_at" in query) == partitioned
+
+
+def test_child_metric_is_pre_aggregated_per_sale():
+    query, _ = build_analytics_query("items.additional_price", "AVG", "stores.name", {})
+    assert "SUM(ips.additional_price) AS m0_sum" in query
+    assert "COUNT(ips.additional_price) AS m0_count" in query
+    assert "SUM(ps_agg.m0_sum) / NULLIF(SUM(ps_agg.m0_count), 0) AS result" in query
+    assert "JOIN stores st ON st.id = s.store_id" in query
+
+
+def test_delivery_type_filter_is_a_semi_join():
+    query, params = build_analytics_query("total_amount", "SUM", "stores.name", {"delivery_type": "DELIVERY"})
+    assert "EXISTS (SELECT 1 FROM delivery_sales ds WHERE ds.sale_id = s.id AND ds.delivery_type = %s)" in query
+    assert "JOIN delivery_sales" not in query
+    assert params == ["DELIVERY"]
+
+
+def test_filtered_children_share_one_filter_cte():
+    filters = {"date_range": "last_30d", "store_ids": [2, 1], "delivery_type": "DELIVERY"}
+    query, params = build_multi_metric_query(
+        [("total_amount", "SUM"), ("items.additional_price", "SUM")], "payment_types.desc", filters
+    )
+    # Duas filhas (pagamentos e itens): o filtro aparece na CTE e na query externa, não por filha
+    assert query.count("WITH filtered_sales AS NOT MATERIALIZED") == 1
+    assert query.count("IN (SELECT id FROM filtered_sales)") == 2
+    assert query.count("EXISTS (SELECT 1 FROM delivery_sales") == 2
+    assert query.count("%s") == len(params) == 4
+    assert params == [[1, 2], "DELIVERY", [1, 2], "DELIVERY"]
+
+
+def test_unfiltered_children_skip_the_filter_cte():
+    query, params = build_analytics_query("total_amount", "SUM", "products.name", {})
+    assert "filtered_sales" not in query
+    assert params == []
+
+
+# =======================================================================
+# VALIDAÇÃO DE MÉTRICA E AGREGAÇÃO (nada vai cru para o SQL)
+# =======================================================================
+
+@pytest.mark.parametrize("metric", ["total_amount) FROM sales; --", "pg_sleep(10)", "items.name", "items.x; --", ""])
+def test_unknown_metric_is_rejected(metric):
+    with pytest.raises(ValueError, match="Métrica inválida"):
+        build_analytics_query(metric, "SUM", "stores.name", {})
+    with pytest.raises(ValueError, match="Métrica inválida"):
+        build_paginated_query(metric, "SUM", "stores.name", {}, limit=10)
+    with pytest.raises(ValueError, match="Métrica inválida"):
+        plan_analytics_query(metric, "SUM", "stores.name", {}, use_rollups=True, use_sketches=True,
+                             precision="approximate")
+
+
+@pytest.mark.parametrize("agg_func", ["MEDIAN", "pg_sleep", "SUM(s.id)) --", "STDDEV"])
+def test_unknown_aggregation_is_rejected(agg_func):
+    with pytest.raises(ValueError, match="não suportada"):
+        build_analytics_query("total_amount", agg_func, "stores.name", {})
+
+
+def test_allowed_metrics_compile():
+    for metric in METRIC_MAP:
+        query, _ = build_analytics_query(metric, "SUM", "stores.name", {})
+        assert METRIC_MAP[metric]["column"] in query
+
+
+@pytest.mark.parametrize("agg_func", ["SUM", "sum", " p90 ", "COUNT_DISTINCT"])
+def test_request_accepts_known_aggregations(agg_func):
+    PivotRequest(metric="total_amount", agg_func=agg_func, group_by="stores.name")
+
+
+@pytest.mark.parametrize("agg_func", ["MEDIAN", "SUM(1)); DROP TABLE sales; --", ""])
+def test_request_rejects_unknown_aggregations(agg_func):
+    with pytest.raises(ValidationError):
+        PivotRequest(metric="total_amount", agg_func=agg_func, group_by="stores.name")
+
+
+@pytest.mark.parametrize("filters", [
+    {"date_range": ["last_7d"]},
+    {"date_range": {"from": "2024-01-01"}},
+    {"delivery_type": ["DELIVERY"]},
+    {"store_ids": [{"id": 1}]},
+    {"store_ids": [[1, 2]]},
+    {"channel_ids": [1.5]},
+    {"store_ids": [True]},
+])
+def test_unsupported_filter_values_are_rejected(filters):
+    with pytest.raises(ValueError, match="Filtro"):
+        normalize_filters(filters)
+    # ValueError (400 nas rotas), e não TypeError dentro dos compiladores em cache
+    with pytest.raises(ValueError, match="Filtro"):
+        plan_analytics_query("total_amount", "SUM", "stores.name", filters, use_rollups=True)
+    with pytest.raises(ValueError, match="Filtro"):
+        build_paginated_query("total_amount", "SUM", "products.name", filters, limit=10)
+
+
+def test_id_filters_accept_integer_text():
+    assert normalize_filters({"store_ids": ["3", 1, "1"], "channel_ids": 2}) == {"store_ids": [1, 3], "channel_ids": [2]}
+    _, params = build_rollup_query("total_amount", "SUM", "stores.name", normalize_filters({"store_ids": "7"}))
+    assert params and all(param == [7] for param in params)
+
+
+# =======================================================================
+# CHAVE DO CACHE DE RESULTADOS
+# =======================================================================
+
+def _key(filters, agg_func="SUM", precision="exact", metric="total_amount", group_by="stores.name"):
+    return pivot_cache_key(metric, agg_func, group_by, filters, precision)
+
+
+def test_id_lists_are_order_and_duplicate_insensitive():
+    base = _key({"store_ids": [1, 2, 3], "channel_ids": [5]})
+    assert _key({"store_ids": [3, 1, 2], "channel_ids": [5]}) == base
+    assert _key({"store_ids": [2, 2, 1, 3, 1], "channel_ids": [5, 5]}) == base
+    assert _key({"channel_ids": 5, "store_ids": ["3", 2, 1]}) == base
+    assert _key({"store_ids": [1, 2]}) != _key({"store_ids": [1, 2, 3]})
+
+
+def test_empty_filters_do_not_change_the_key():
+    base = _key({"date_range": "last_7d"})
+    assert _key({"date_range": "last_7d", "store_ids": [], "delivery_type": None, "channel_ids": ""}) == base
+    assert _key({"date_range": "last_30d"}) != base
+
+
+def test_aggregation_and_names_are_canonical():
+    assert _key({}, agg_func=" avg ") == _key({}, agg_func="AVG")
+    assert pivot_cache_key(" total_amount ", "SUM", " stores.name", {}) == _key({})
+
+
+def test_precision_is_part_of_the_key():
+    assert _key({}, precision="approximate") != _key({}, precision="exact")
+    assert _key({}) == _key({}, precision="exact")